@@ -76,6 +76,7 @@ def elaspic_cli(args):
             args.mutations,
             run_type=args.run_type,
             uniprot_domain_pair_ids=uniprot_domain_pair_ids_asint,
+            jobs=args.jobs,
         )
         pipeline.run()
     elif args.structure_file:
@@ -88,6 +89,7 @@ def elaspic_cli(args):
             args.mutations,
             mutation_format=args.mutation_format,
             run_type=args.run_type,
+            jobs=args.jobs,
         )
         pipeline.run()
 
@@ -326,6 +328,19 @@ def configure_run_parser(sub_parsers):
             """
         ),
     )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=1,
+        help=dedent(
+            """\
+            Number of worker processes. Used to build homology models in parallel
+            with '--uniprot_id' and to evaluate mutations in parallel with
+            '--structure_file'.
+        """
+        ),
+    )
 
     parser.set_defaults(func=elaspic_cli)
 
@@ -394,40 +409,7 @@ def load_data_to_database(args, tables):
     from elaspic import elaspic_database
 
     db = elaspic_database.MyDatabase()
-
-    for table_name in tables:
-        load_table_to_database(table_name, args.url, db.engine)
-
-    # # This code tries to load tables faster by directly reading from CSVs
-    # args.data_folder = args.data_folder.rstrip('/')
-    # table_names = args.data_files.split(',') if args.data_files else None
-    # dirpath, dirnames, filenames = next(os.walk(args.data_folder))
-    # for table in elaspic_database.Base.metadata.sorted_tables:
-    #     if table_names is not None and table.name not in table_names:
-    #         logger.warning(
-    #             "Skipping table '{}' because it was not included in the 'table_names' list..."
-    #             .format(table.name))
-    #         continue
-    #     if '{}.tsv'.format(table.name) in filenames:
-    #         db.copy_table_to_db(table.name, args.data_folder)
-    #         logger.info("Successfully loaded data from file '{}' to table '{}'"
-    #                     .format('{}.tsv'.format(table.name), table.name))
-    #     elif '{}.tsv.gz'.format(table.name) in filenames:
-    #         with decompress(os.path.join(args.data_folder, '{}.tsv.gz'.format(table.name))):
-    #             db.copy_table_to_db(table.name, args.data_folder.rstrip('/'))
-    #         logger.info("Successfully loaded data from file '{}' to table '{}'"
-    #                     .format('{}.tsv.gz'.format(table.name), table.name))
-
-
-def load_table_to_database(table_name, table_url, engine):
-    logger.info("Loading table {} from {} into database...".format(table_name, table_url))
-    engine.execute("DELETE FROM {}".format(table_name))
-    df_header = pd.read_sql_query("select * from {} limit 0".format(table_name), engine)
-    csv_file = op.join(table_url, table_name + ".tsv.gz")
-    for chunk in pd.read_csv(
-        csv_file, chunksize=100000, na_values=["\\N"], names=df_header.columns
-    ):
-        chunk.to_sql(table_name, engine, if_exists="append", index=False)
+    elaspic_database.load_tables(db.engine, tables, args.url, jobs=args.jobs)
 
 
 def delete_database(args):
@@ -475,6 +457,13 @@ def configure_database_parser(sub_parsers):
         action="count",
         help="Increase verbosity level. Can be specified multiple times.",
     )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=1,
+        help="Number of tables to load in parallel (ignored for SQLite).",
+    )
     parser.add_argument(
         "action",
         choices=["create", "load_basic", "load_complete", "delete"],
@@ -532,6 +521,86 @@ def configure_train_parser(sub_parsers):
     parser.set_defaults(func=elaspic_train)
 
 
+# #################################################################################################
+# ELASPIC RESCORE
+
+
+def elaspic_rescore(args):
+    if args.config_file:
+        conf.read_configuration_file(args.config_file)
+    elif args.connection_string:
+        conf.read_configuration_file(
+            DATABASE={"connection_string": args.connection_string},
+            LOGGER={"level": LOGGING_LEVELS[args.verbose]},
+        )
+    else:
+        raise Exception("Either 'config_file' or 'connection_string' must be specified!")
+
+    from elaspic import elaspic_database
+
+    db = elaspic_database.MyDatabase()
+    if args.mutation_type == "all":
+        mutation_types = ["core", "interface"]
+    else:
+        mutation_types = [args.mutation_type]
+    for mutation_type in mutation_types:
+        logger.info("Rescoring {} mutations...".format(mutation_type))
+        num_updated = elaspic_predictor.rescore_mutations(
+            db.engine, mutation_type, chunk_size=args.chunk_size
+        )
+        logger.info("Updated ΔΔG scores of {} {} mutations.".format(num_updated, mutation_type))
+
+
+def configure_rescore_parser(sub_parsers):
+    help = "Recalculate ΔΔG scores of mutations stored in the database"
+    description = help + "\n"
+    example = dedent(
+        """\
+
+    Examples:
+
+        elaspic rescore -c config_file.ini
+
+    """
+    )
+    parser = sub_parsers.add_parser("rescore", help=help, description=description, epilog=example)
+    parser.add_argument(
+        "-c", "--config_file", nargs="?", type=str, help="ELASPIC configuration file."
+    )
+    parser.add_argument(
+        "--connection_string",
+        nargs="?",
+        type=str,
+        default=os.getenv("ELASPIC_DB_STRING"),
+        help=dedent(
+            """\
+            SQLAlchemy formatted string describing the connection to the
+            database. Can also be specified using the 'ELASPIC_DB_STRING'
+            environment variable.
+        """
+        ),
+    )
+    parser.add_argument(
+        "--mutation_type",
+        choices=["core", "interface", "all"],
+        default="all",
+        help="Rescore core mutations, interface mutations, or both.",
+    )
+    parser.add_argument(
+        "--chunk_size",
+        type=int,
+        default=10000,
+        help="Number of mutations to read, score and update at a time.",
+    )
+    parser.add_argument(
+        "-v",
+        "--verbose",
+        action="count",
+        help="Increase verbosity level. Can be specified multiple times.",
+    )
+    parser.set_defaults(func=elaspic_rescore)
+
+
 # #################################################################################################
 # MAIN
 
@@ -545,6 +614,7 @@ def main():
     configure_run_parser(sub_parsers)
     configure_database_parser(sub_parsers)
     configure_train_parser(sub_parsers)
+    configure_rescore_parser(sub_parsers)
     args = parser.parse_args()
     if "func" not in args.__dict__:
         args = parser.parse_args(["--help"])
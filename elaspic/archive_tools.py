@@ -0,0 +1,282 @@
+"""Read precalculated data from ``.zip`` and ``.7z`` archives without rescanning them.
+
+The list of members of an archive is read once and is stored in an on-disk cache,
+so that later processes can look members up without parsing the archive headers.
+Members of ``.zip`` archives are read directly from their offsets. Members of ``.7z``
+archives are decompressed one block (folder) at a time, and recently used blocks are kept
+in memory, since files that belong to the same domain are usually stored in the same block.
+"""
+
+import bz2
+import hashlib
+import logging
+import os
+import os.path as op
+import struct
+import tempfile
+import threading
+import time
+import zipfile
+import zlib
+from collections import OrderedDict
+
+from . import errors, helper
+
+logger = logging.getLogger(__name__)
+
+#: Maximum size of decompressed blocks kept in memory for each archive, in bytes.
+DEFAULT_CACHE_SIZE = 256 * 1024 * 1024
+
+# Local file header of a zip archive
+_ZIP_FILE_HEADER = struct.Struct("<4s2B4HL2L2H")
+_ZIP_FILE_HEADER_SIGNATURE = b"PK\003\004"
+
+_archives = {}
+_archives_lock = threading.Lock()
+
+
+def get_archive(filename, index_cache_dir=None):
+    """Return a reader for archive `filename`, shared by all callers in this process.
+
+    If a ``.zip`` archive with the same name exists next to a ``.7z`` archive,
+    the ``.zip`` archive is used instead.
+
+    Raises
+    ------
+    ImportError
+        If `filename` is a ``.7z`` archive and :mod:`py7zr` is not installed.
+    """
+    zip_filename = op.splitext(filename)[0] + ".zip"
+    if op.isfile(zip_filename):
+        filename = zip_filename
+    key = (op.realpath(filename), index_cache_dir)
+    with _archives_lock:
+        if key not in _archives:
+            if filename.endswith(".zip"):
+                _archives[key] = ZipArchive(filename, index_cache_dir)
+            elif filename.endswith((".7z", ".7zip")):
+                _archives[key] = SevenZipArchive(filename, index_cache_dir)
+            else:
+                raise ValueError("Unsupported archive: '{}'".format(filename))
+        return _archives[key]
+
+
+class IndexedArchive:
+    """Base class for archives that are read using an index of their members.
+
+    Subclasses implement :meth:`_build_index` and :meth:`_read_block`.
+
+    Parameters
+    ----------
+    filename : str
+        Location of the archive.
+    index_cache_dir : str, optional
+        Folder where the index of the archive is stored. If not provided, the index is
+        rebuilt by every process.
+    cache_size : int
+        Maximum size of decompressed blocks kept in memory, in bytes.
+    """
+
+    def __init__(self, filename, index_cache_dir=None, cache_size=DEFAULT_CACHE_SIZE):
+        self.filename = filename
+        self.index_cache_dir = index_cache_dir
+        self.cache_size = cache_size
+        self._index = None
+        self._blocks = OrderedDict()
+        self._blocks_size = 0
+        self._lock = threading.RLock()
+
+    def _get_index_key(self):
+        stat = os.stat(self.filename)
+        archive_id = "{}:{}:{}".format(op.realpath(self.filename), stat.st_size, stat.st_mtime_ns)
+        return hashlib.sha1(archive_id.encode()).hexdigest()
+
+    @property
+    def index(self):
+        """Dictionary with the block of every member, and the members and size of every block."""
+        with self._lock:
+            if self._index is not None:
+                return self._index
+            cache = None
+            if self.index_cache_dir is not None:
+                cache = helper.FileCache(self.index_cache_dir)
+                self._index = cache.get(self._get_index_key())
+            if self._index is None:
+                start_time = time.perf_counter()
+                self._index = self._build_index()
+                logger.info(
+                    "Indexed {} members of archive '{}' in {:.1f} s.".format(
+                        len(self._index["members"]),
+                        self.filename,
+                        time.perf_counter() - start_time,
+                    )
+                )
+                if cache is not None:
+                    cache.set(self._get_index_key(), self._index)
+            return self._index
+
+    def __contains__(self, name):
+        return name in self.index["members"]
+
+    def _build_index(self):
+        raise NotImplementedError
+
+    def _read_block(self, block_key, names):
+        """Return a dictionary with the contents of members `names` of block `block_key`."""
+        raise NotImplementedError
+
+    def _read_members(self, block_key, names):
+        block_names, block_size = self.index["blocks"][block_key]
+        with self._lock:
+            if block_key in self._blocks:
+                self._blocks.move_to_end(block_key)
+                return self._blocks[block_key]
+            if block_size > self.cache_size:
+                return self._read_block(block_key, names)
+            block = self._read_block(block_key, block_names)
+            self._blocks[block_key] = block
+            self._blocks_size += block_size
+            while self._blocks_size > self.cache_size:
+                evicted_key, _ = self._blocks.popitem(last=False)
+                self._blocks_size -= self.index["blocks"][evicted_key][1]
+            return block
+
+    def read(self, name):
+        """Return the contents of member `name`."""
+        return self.read_many([name])[name]
+
+    def read_many(self, names):
+        """Return a dictionary with the contents of members `names`."""
+        missing_names = [name for name in names if name not in self]
+        if missing_names:
+            raise errors.ArchiveMemberNotFoundError(self.filename, missing_names)
+        names_by_block = OrderedDict()
+        for name in names:
+            names_by_block.setdefault(self.index["members"][name], []).append(name)
+        data = {}
+        for block_key, block_names in names_by_block.items():
+            block = self._read_members(block_key, block_names)
+            data.update((name, block[name]) for name in block_names)
+        return data
+
+    def extract(self, names, output_dir):
+        """Extract members `names` into `output_dir`, keeping their relative paths."""
+        for name, data in self.read_many(names).items():
+            filename = op.join(output_dir, name)
+            os.makedirs(op.dirname(filename), exist_ok=True)
+            with tempfile.NamedTemporaryFile(
+                "wb", dir=op.dirname(filename), suffix=".tmp", delete=False
+            ) as ofh:
+                ofh.write(data)
+            os.replace(ofh.name, filename)
+
+
+class ZipArchive(IndexedArchive):
+    """Zip archive whose members are read directly from their offsets.
+
+    Every member is compressed separately, so every member is a block of its own.
+    """
+
+    def _build_index(self):
+        members = {}
+        blocks = {}
+        offsets = {}
+        with zipfile.ZipFile(self.filename) as archive:
+            for info in archive.infolist():
+                if info.is_dir():
+                    continue
+                members[info.filename] = info.filename
+                blocks[info.filename] = ([info.filename], info.file_size)
+                offsets[info.filename] = (
+                    info.header_offset,
+                    info.compress_type,
+                    info.compress_size,
+                    info.CRC,
+                )
+        return {"members": members, "blocks": blocks, "offsets": offsets}
+
+    def _read_block(self, block_key, names):
+        (name,) = names
+        offset, compress_type, compress_size, crc = self.index["offsets"][name]
+        with open(self.filename, "rb") as ifh:
+            ifh.seek(offset)
+            header = _ZIP_FILE_HEADER.unpack(ifh.read(_ZIP_FILE_HEADER.size))
+            if header[0] != _ZIP_FILE_HEADER_SIGNATURE:
+                raise zipfile.BadZipFile(
+                    "Bad local file header for member '{}' of archive '{}'".format(
+                        name, self.filename
+                    )
+                )
+            # Skip the file name and the extra field
+            ifh.seek(header[10] + header[11], os.SEEK_CUR)
+            data = ifh.read(compress_size)
+        if compress_type == zipfile.ZIP_STORED:
+            pass
+        elif compress_type == zipfile.ZIP_DEFLATED:
+            data = zlib.decompress(data, -zlib.MAX_WBITS)
+        elif compress_type == zipfile.ZIP_BZIP2:
+            data = bz2.decompress(data)
+        else:
+            with zipfile.ZipFile(self.filename) as archive:
+                data = archive.read(name)
+        if zlib.crc32(data) != crc:
+            raise zipfile.BadZipFile(
+                "Bad CRC-32 for member '{}' of archive '{}'".format(name, self.filename)
+            )
+        return {name: data}
+
+
+class SevenZipArchive(IndexedArchive):
+    """7zip archive that is read using :mod:`py7zr`.
+
+    Members of a solid 7zip archive are compressed together in blocks ("folders"),
+    and reading any member requires decompressing its block from the start.
+    """
+
+    def __init__(self, filename, index_cache_dir=None, cache_size=DEFAULT_CACHE_SIZE):
+        import py7zr
+
+        super().__init__(filename, index_cache_dir, cache_size)
+        self._py7zr = py7zr
+        self._archive = None
+        self._archive_pid = None
+
+    def _get_archive(self):
+        # File handles are shared with forked processes, so every process opens its own
+        if self._archive is None or self._archive_pid != os.getpid():
+            self._archive = self._py7zr.SevenZipFile(self.filename)
+            self._archive_pid = os.getpid()
+        else:
+            self._archive.reset()
+        return self._archive
+
+    def _build_index(self):
+        members = {}
+        blocks = {}
+        folder_keys = {}
+        with self._py7zr.SevenZipFile(self.filename) as archive:
+            for member in archive.files:
+                if member.is_directory:
+                    continue
+                if member.folder is None:
+                    # Empty files are not stored in any block
+                    block_key = None
+                else:
+                    block_key = folder_keys.setdefault(id(member.folder), len(folder_keys))
+                members[member.filename] = block_key
+                block_names, block_size = blocks.setdefault(block_key, ([], [0]))
+                block_names.append(member.filename)
+                block_size[0] += member.uncompressed
+        blocks = {key: (names, size) for key, (names, [size]) in blocks.items()}
+        return {"members": members, "blocks": blocks}
+
+    def _read_block(self, block_key, names):
+        if block_key is None:
+            return {name: b"" for name in names}
+        with tempfile.TemporaryDirectory() as output_dir:
+            self._get_archive().extract(path=output_dir, targets=names)
+            block = {}
+            for name in names:
+                with open(op.join(output_dir, name), "rb") as ifh:
+                    block[name] = ifh.read()
+        return block
@@ -1,3 +1,5 @@
+import functools
+import hashlib
 import logging
 import os
 import os.path as op
@@ -7,7 +9,7 @@ import subprocess
 
 import pandas as pd
 
-from elaspic import conf, errors
+from elaspic import conf, errors, helper, structure_tools
 
 logger = logging.getLogger(__name__)
 
@@ -53,19 +55,59 @@ names_stability_complex_mut = [name + "_mut" for name in names_stability_complex
 ]
 
 
+@functools.lru_cache(maxsize=None)
+def get_foldx_version():
+    """Return a hash identifying the FoldX executable."""
+    foldx_file = shutil.which("foldx")
+    if foldx_file is None:
+        return ""
+    return helper.get_file_hash(foldx_file)
+
+
 def read_build_model(output_file, wt_pdb_id, mut_pdb_id):
+    return read_build_models(output_file, [wt_pdb_id], [mut_pdb_id])[0]
+
+
+def read_build_models(output_file, wt_pdb_ids, mut_pdb_ids):
+    """Read ``BuildModel`` results for one or more mutations.
+
+    Returns
+    -------
+    list
+        ``(stability_values_wt, stability_values_mut)`` for every pair of
+        `wt_pdb_ids` and `mut_pdb_ids`.
+    """
     df = pd.read_csv(output_file, sep="\t", skiprows=8)
     # Format dataframes
     df = df.rename(columns=str.lower)
     logger.debug(df.head())
-    logger.info(df.head())
-    df_wt = df.loc[df["pdb"] == wt_pdb_id, :].drop("pdb", axis=1).drop_duplicates()
-    df_mut = df.loc[df["pdb"] == mut_pdb_id, :].drop("pdb", axis=1).drop_duplicates()
-    assert df_wt.shape[0] == 1 and df_mut.shape[0] == 1
-    # Compile results
-    stability_values_wt = df_wt.iloc[0].tolist()
-    stability_values_mut = df_mut.iloc[0].tolist()
-    return stability_values_wt, stability_values_mut
+    results = []
+    for wt_pdb_id, mut_pdb_id in zip(wt_pdb_ids, mut_pdb_ids):
+        df_wt = df.loc[df["pdb"] == wt_pdb_id, :].drop("pdb", axis=1).drop_duplicates()
+        df_mut = df.loc[df["pdb"] == mut_pdb_id, :].drop("pdb", axis=1).drop_duplicates()
+        assert df_wt.shape[0] == 1 and df_mut.shape[0] == 1
+        # Compile results
+        stability_values_wt = df_wt.iloc[0].tolist()
+        stability_values_mut = df_mut.iloc[0].tolist()
+        results.append((stability_values_wt, stability_values_mut))
+    return results
+
+
+def get_number_of_residues(structure_file):
+    """Count amino acid residues in the same way as FoldX ``Stability``."""
+    structure = structure_tools.get_pdb_structure(structure_file)
+    return sum(
+        1 for residue in structure[0].get_residues() if residue.resname in structure_tools.AAA_DICT
+    )
+
+
+def add_number_of_residues(stability_values, structure_file):
+    """Make ``BuildModel`` results look like the results of ``Stability``.
+
+    ``BuildModel`` reports the same energy terms as ``Stability``,
+    but without ``number_of_residues``.
+    """
+    return stability_values + [float(get_number_of_residues(structure_file))]
 
 
 def read_stability(output_file):
@@ -89,8 +131,20 @@ def read_analyse_complex(output_file):
 
 
 class FoldX:
-    def __init__(self, foldx_dir=None):
+    """.
+
+    Parameters
+    ----------
+    foldx_dir : str, optional
+        Folder where FoldX should be run.
+    cache : helper.FileCache, optional
+        Cache for structures repaired using ``RepairPDB``, which are looked up using
+        a hash of the input structure and of the FoldX executable.
+    """
+
+    def __init__(self, foldx_dir=None, cache=None):
         self._tempdir = op.abspath(foldx_dir or conf.CONFIGS["foldx_dir"])
+        self.cache = cache
         logger.debug("FoldX._tempdir: %s", self._tempdir)
         self._foldx_rotabase = self._find_rotabase()
         logger.debug("FoldX._foldx_rotabase: %s", self._foldx_rotabase)
@@ -137,7 +191,25 @@ class FoldX:
             )
 
     def _repair_pdb(self, structure_file):
-        """Run FoldX ``RepairPDB``."""
+        """Run FoldX ``RepairPDB``, reusing cached results if available."""
+        if self.cache is None:
+            return self._run_repair_pdb(structure_file)
+
+        repaired_structure_file = op.splitext(structure_file)[0] + "-foldx.pdb"
+        key = helper.get_file_hash(structure_file, command="RepairPDB", foldx=get_foldx_version())
+        data = self.cache.get(key)
+        if data is not None:
+            logger.debug("Loaded repaired structure for %s from cache.", structure_file)
+            with open(repaired_structure_file, "wb") as ofh:
+                ofh.write(data)
+            return repaired_structure_file
+
+        repaired_structure_file = self._run_repair_pdb(structure_file)
+        with open(repaired_structure_file, "rb") as ifh:
+            self.cache.set(key, ifh.read())
+        return repaired_structure_file
+
+    def _run_repair_pdb(self, structure_file):
         # Run FoldX
         system_command = (
             (
@@ -161,6 +233,17 @@ class FoldX:
             For some reason, the results of ``BuildModel``
             do not include ``number_of_residues``.
         """
+        return self.build_models(pdb_file, [foldx_mutation])[0]
+
+    def build_models(self, pdb_file, foldx_mutations):
+        """Run FoldX ``BuildModel`` for several mutations, repairing `pdb_file` only once.
+
+        Returns
+        -------
+        list
+            ``(structure_file_wt, structure_file_mut, stability_values_wt, stability_values_mut)``
+            for every mutation in `foldx_mutations`.
+        """
         pdb_file = op.abspath(pdb_file)
         try:
             pdb_file = shutil.copy(pdb_file, op.join(self._tempdir, op.basename(pdb_file)))
@@ -170,7 +253,7 @@ class FoldX:
 
         pdb_id = op.basename(op.splitext(structure_file)[0])
         cwd = op.dirname(structure_file)
-        mutation_file = self._get_mutation_file(foldx_mutation, cwd)
+        mutation_file = self._get_mutation_file(foldx_mutations, cwd)
 
         # Run FoldX
         system_command = (
@@ -182,34 +265,46 @@ class FoldX:
         )
         self._run(system_command, cwd)
 
-        # Copy FoldX results
-        wt_pdb_id = "WT_{}_1.pdb".format(pdb_id)
-        mut_pdb_id = "{}_1.pdb".format(pdb_id)
-        structure_file_wt = shutil.move(
-            op.join(cwd, wt_pdb_id),
-            op.join(cwd, "{}-{}-wt.pdb".format(pdb_id, foldx_mutation)),
-        )
-        structure_file_mut = shutil.move(
-            op.join(cwd, mut_pdb_id),
-            op.join(cwd, "{}-{}-mut.pdb".format(pdb_id, foldx_mutation)),
-        )
-
-        # Read results
+        # Read results (mutants are numbered in the order of the mutant file)
+        wt_pdb_ids = ["WT_{}_{}.pdb".format(pdb_id, i + 1) for i in range(len(foldx_mutations))]
+        mut_pdb_ids = ["{}_{}.pdb".format(pdb_id, i + 1) for i in range(len(foldx_mutations))]
         output_file = op.join(cwd, "Raw_{}.fxout".format(pdb_id))
-        stability_values_wt, stability_values_mut = read_build_model(
-            output_file, wt_pdb_id, mut_pdb_id
-        )
-        return (
-            structure_file_wt,
-            structure_file_mut,
-            stability_values_wt,
-            stability_values_mut,
-        )
+        stability_values = read_build_models(output_file, wt_pdb_ids, mut_pdb_ids)
+
+        # Copy FoldX results
+        results = []
+        for (
+            foldx_mutation,
+            wt_pdb_id,
+            mut_pdb_id,
+            (
+                stability_values_wt,
+                stability_values_mut,
+            ),
+        ) in zip(foldx_mutations, wt_pdb_ids, mut_pdb_ids, stability_values):
+            structure_file_wt = shutil.move(
+                op.join(cwd, wt_pdb_id),
+                op.join(cwd, "{}-{}-wt.pdb".format(pdb_id, foldx_mutation)),
+            )
+            structure_file_mut = shutil.move(
+                op.join(cwd, mut_pdb_id),
+                op.join(cwd, "{}-{}-mut.pdb".format(pdb_id, foldx_mutation)),
+            )
+            results.append(
+                (
+                    structure_file_wt,
+                    structure_file_mut,
+                    stability_values_wt,
+                    stability_values_mut,
+                )
+            )
+        return results
 
     def stability(self, structure_file) -> dict:
         """Run FoldX ``Stability``.
 
-        .. deprecated:: `FoldX._build_model` already gives you the same information.
+        .. deprecated:: `FoldX.build_model` already gives you the same information
+            (see `add_number_of_residues`).
         """
         pdb_id = op.basename(op.splitext(structure_file)[0])
         cwd = op.dirname(structure_file)
@@ -246,15 +341,20 @@ class FoldX:
         result = read_analyse_complex(output_file)
         return result
 
-    def _get_mutation_file(self, foldx_mutation, cwd) -> str:
+    def _get_mutation_file(self, foldx_mutations, cwd) -> str:
         """
         Parameters
         ----------
-        foldx_mutation:
-            Mutation specified in the following format:
+        foldx_mutations:
+            List of mutations specified in the following format:
             {mutation.residue_wt}{chain_id}{residue_id}{mutation.residue_mut}
         """
-        mutation_file = op.join(cwd, "individual_list_{}.txt".format(foldx_mutation))
+        if len(foldx_mutations) == 1:
+            mutation_file_id = foldx_mutations[0]
+        else:
+            mutation_file_id = hashlib.md5(",".join(foldx_mutations).encode()).hexdigest()
+        mutation_file = op.join(cwd, "individual_list_{}.txt".format(mutation_file_id))
         with open(mutation_file, "wt") as fout:
-            fout.write("{};\n".format(foldx_mutation))
+            for foldx_mutation in foldx_mutations:
+                fout.write("{};\n".format(foldx_mutation))
         return mutation_file
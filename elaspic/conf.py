@@ -8,6 +8,7 @@
 
     Deprecate configuration files and do everything from the command line?
 """
+
 import configparser
 import logging
 import logging.config
@@ -96,6 +97,15 @@ def read_sequence_configs(config):
         "sequence_dir", fallback=op.join(CONFIGS["unique_temp_dir"], "sequence")
     )
     CONFIGS["provean_temp_dir"] = op.join(CONFIGS["sequence_dir"], "provean_temp")
+    CONFIGS["provean_supset_store_dir"] = config.get(
+        "provean_supset_store_dir", fallback=op.join(CONFIGS["temp_dir"], "provean_supset_store")
+    )
+    CONFIGS["provean_saturation"] = config.getboolean("provean_saturation", fallback=False)
+    # Resource budget of provean (memory and disk space in GB, time in seconds)
+    CONFIGS["provean_max_memory"] = config.getfloat("provean_max_memory", fallback=0)
+    CONFIGS["provean_min_free_memory"] = config.getfloat("provean_min_free_memory", fallback=0.5)
+    CONFIGS["provean_min_free_disk"] = config.getfloat("provean_min_free_disk", fallback=5)
+    CONFIGS["provean_timeout"] = config.getint("provean_timeout", fallback=0)
     _validate_provean_temp_dir(config, CONFIGS)
 
     CONFIGS["pdb_dir"] = config.get("pdb_dir")
@@ -114,6 +124,7 @@ def read_sequence_configs(config):
         os.makedirs(CONFIGS["archive_dir"], exist_ok=True)
         CONFIGS["archive_type"] = "directory"
     CONFIGS["archive_temp_dir"] = op.join(CONFIGS["temp_dir"], "archive")
+    CONFIGS["archive_prefetch_jobs"] = config.getint("archive_prefetch_jobs", fallback=0)
 
 
 def _validate_provean_temp_dir(config, configs):
@@ -153,6 +164,11 @@ def read_database_configs(config):
         CONFIGS["db_socket"] = _get_db_socket(config, CONFIGS["db_type"], CONFIGS["db_url"])
         CONFIGS["connection_string"] = make_connection_string(**CONFIGS)
     CONFIGS["db_is_immutable"] = config.get("db_is_immutable", fallback=False)
+    CONFIGS["db_loading_strategy"] = config.get("db_loading_strategy", fallback="joined")
+    CONFIGS["db_write_buffer_size"] = config.getint("db_write_buffer_size", fallback=0)
+    CONFIGS["db_write_buffer_timeout"] = config.getfloat("db_write_buffer_timeout", fallback=60)
+    CONFIGS["db_pool_size"] = config.getint("db_pool_size", fallback=1)
+    CONFIGS["db_max_overflow"] = config.getint("db_max_overflow", fallback=10)
 
 
 def _get_db_socket(config, db_type, db_url):
@@ -192,10 +208,21 @@ def read_model_configs(config):
     # FoldX
     CONFIGS["foldx_water"] = config.get("foldx_water", "-IGNORE")
     CONFIGS["foldx_num_of_runs"] = config.getint("foldx_num_of_runs", 1)
+    CONFIGS["foldx_stability_from_build_model"] = config.getboolean(
+        "foldx_stability_from_build_model", False
+    )
+    CONFIGS["foldx_cache_dir"] = config.get(
+        "foldx_cache_dir", fallback=op.join(CONFIGS["model_dir"], "foldx_cache")
+    )
     CONFIGS["matrix_type"] = config.get("matrix_type", "blosum80")
     CONFIGS["gap_start"] = config.getint("gap_start", -16)
     CONFIGS["gap_extend"] = config.getint("gap_extend", -4)
 
+    # Cache of structural properties, shared between runs (size in MB).
+    # Disabled by default because cache entries are unpickled.
+    CONFIGS["analysis_cache_dir"] = config.get("analysis_cache_dir", fallback="")
+    CONFIGS["analysis_cache_size"] = config.getint("analysis_cache_size", 1024)
+
 
 def read_logger_configs(config):
     """Standard logger configuration, with optional tee to a file.
@@ -215,7 +242,7 @@ def _prepare_temp_folders(configs):
         if value is None:
             logger.warning("No value provided for key: '{}'".format(key))
             continue
-        if key.endswith("_dir") and not re.match("{.*}", value):
+        if key.endswith("_dir") and value and not re.match("{.*}", value):
             logger.debug("Creating '{}' folder: {}...".format(key, value))
             os.makedirs(value, exist_ok=True)
 
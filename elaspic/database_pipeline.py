@@ -1,5 +1,7 @@
+import concurrent.futures
 import json
 import logging
+import multiprocessing
 import os
 import os.path as op
 import re
@@ -37,6 +39,7 @@ class DatabasePipeline(Pipeline):
         run_type="5",
         number_of_tries=[],
         uniprot_domain_pair_ids=[],
+        jobs=1,
     ):
         """Run the main function of the program and parse errors.
 
@@ -52,6 +55,8 @@ class DatabasePipeline(Pipeline):
             4 : Calculate mutations using precalculated provean (calculating mutations on the fly)
                 (not working)
             5 : Calculate mutations, calculating provean and homology models as required.
+        jobs : int
+            Number of worker processes used to build homology models.
         """
         super().__init__(configurations)
 
@@ -63,6 +68,7 @@ class DatabasePipeline(Pipeline):
         self.run_type = self._validate_run_type(run_type)
         self.number_of_tries = number_of_tries
         self.uniprot_domain_pair_ids = uniprot_domain_pair_ids
+        self.jobs = jobs
 
         logger.info("=" * 80)
         logger.info("## Input parameters")
@@ -130,6 +136,8 @@ class DatabasePipeline(Pipeline):
         if self.run_type in ["2", "4", "5", "6"] or "model" in self.run_type:
             logger.info("\n\n\n" + "*" * 110)
             logger.info("Building models...")
+            if self.jobs > 1:
+                self._build_models_in_parallel(self.uniprot_domains + self.uniprot_domain_pairs)
             for d in self.uniprot_domains + self.uniprot_domain_pairs:
                 self.get_model(d)
             logger.info(
@@ -140,10 +148,19 @@ class DatabasePipeline(Pipeline):
         if self.run_type in ["3", "4", "5"] or "mutation" in self.run_type:
             logger.info("\n\n\n" + "*" * 110)
             logger.info("Analyzing mutations...")
+            if self.uniprot_domains:
+                # Score all mutations using a single provean run
+                self.get_sequence(self.uniprot_domains[0]).expect_mutations(self.mutations)
             for d in self.uniprot_domains + self.uniprot_domain_pairs:
                 for mutation in self.mutations:
                     self.get_mutation_score(d, mutation)
 
+        self.db.flush()
+        for step in [PrepareSequence, PrepareModel, PrepareMutation]:
+            logger.debug("{}: {}".format(step.__name__, step.cache_info()))
+            # Steps are keyed by database objects which are not reused by the next run
+            step.invalidate()
+
     def get_sequence(self, d):
         """"""
         logger.debug("-" * 80)
@@ -156,20 +173,79 @@ class DatabasePipeline(Pipeline):
         logger.debug("get_model({})".format(d))
         return PrepareModel(d, self.db)
 
+    def _build_models_in_parallel(self, ds):
+        """Build homology models for domains and domain pairs `ds` using `self.jobs` processes.
+
+        Input files are prepared in the parent process and only :class:`elaspic_model.Model`
+        is constructed in the workers. Results are merged into the database by the parent
+        process, one model at a time and in the order of `ds`. Domains whose input files
+        cannot be prepared are left for :meth:`get_model` to handle serially.
+        """
+        tasks = []
+        for d in ds:
+            instance = _PrepareModel(d, self.db)
+            if not instance:
+                continue
+            try:
+                instance.__enter__()
+            except Exception as e:
+                logger.debug("Could not prepare model input files for {}: {}".format(d, e))
+                continue
+            # Files are named after template chains, which may be shared by several domains
+            model_input_dir = op.join(
+                conf.CONFIGS["unique_temp_dir"], "model_inputs", "{}_{}".format(*get_unique_id(d))
+            )
+            os.makedirs(model_input_dir, exist_ok=True)
+            instance.sequence_file = shutil.copy(instance.sequence_file, model_input_dir)
+            instance.structure_file = shutil.copy(instance.structure_file, model_input_dir)
+            tasks.append((d, instance))
+        if len(tasks) < 2:
+            return
+
+        # Archive copy threads must not be running when worker processes are forked
+        self.db.shutdown_copy_executor()
+        logger.info("Building {} models using {} processes...".format(len(tasks), self.jobs))
+        with concurrent.futures.ProcessPoolExecutor(
+            max_workers=self.jobs,
+            mp_context=multiprocessing.get_context("fork"),
+            initializer=_init_model_worker,
+        ) as executor:
+            futures = [
+                executor.submit(
+                    _build_model,
+                    instance.sequence_file,
+                    instance.structure_file,
+                    instance.modeller_results_file,
+                )
+                for d, instance in tasks
+            ]
+            for (d, instance), future in zip(tasks, futures):
+                print_header(d)
+                try:
+                    instance.model = future.result()
+                except Exception as e:
+                    if not instance.__exit__(type(e), e, e.__traceback__):
+                        raise
+                else:
+                    instance.__exit__(None, None, None)
+                PrepareModel.remember(instance, d, self.db)
+
     def get_mutation_score(self, d, mutation):
         logger.debug("-" * 80)
         logger.debug("get_mutation_score({}, {})".format(d, mutation))
         if isinstance(d, elaspic_database_tables.UniprotDomain):
-            sequence = self.get_sequence(d)
+            ud = d
         elif isinstance(d, elaspic_database_tables.UniprotDomainPair):
             if self.uniprot_id == d.uniprot_domain_1.uniprot_id:
-                sequence = self.get_sequence(d.uniprot_domain_1)
+                ud = d.uniprot_domain_1
             elif self.uniprot_id == d.uniprot_domain_2.uniprot_id:
-                sequence = self.get_sequence(d.uniprot_domain_2)
+                ud = d.uniprot_domain_2
             else:
                 raise Exception()
         else:
             raise Exception()
+        # All domains share the sequence of protein `self.uniprot_id`
+        sequence = self.get_sequence(self.uniprot_domains[0] if self.uniprot_domains else ud)
         model = self.get_model(d)
         return PrepareMutation(d, mutation, self.uniprot_id, sequence, model, self.db)
 
@@ -178,6 +254,7 @@ class _PrepareSequence:
     def __init__(self, d, db):
         self.d = d
         self.db = db
+        self.db.wait_for_provean(d)
 
         self.sequence = None
         self.skip = False
@@ -264,6 +341,7 @@ class _PrepareModel:
         print_header(d)
         self.d = d
         self.db = db
+        self.db.wait_for_data(d)
         self.skip = False
         self.model = None
         self.modeller_results_file = None
@@ -808,10 +886,9 @@ class _PrepareMutation:
 
         # Machine learning
         if isinstance(d, elaspic_database_tables.UniprotDomain):
-            pred = elaspic_predictor.CorePredictor()
+            pred = elaspic_predictor.get_predictor("core", CACHE_DIR)
         else:
-            pred = elaspic_predictor.InterfacePredictor()
-        pred.load(CACHE_DIR)
+            pred = elaspic_predictor.get_predictor("interface", CACHE_DIR)
         row_idx = 0
         df = self.get_mutation_features(d, self.mut, row_idx=row_idx)
         self.mut.ddg = pred.score(df)[0]
@@ -1037,6 +1114,19 @@ PrepareModel = execute_and_remember(_PrepareModel)
 PrepareMutation = execute_and_remember(_PrepareMutation)
 
 
+def _init_model_worker():
+    """Give each worker process its own T-Coffee and Modeller folders."""
+    worker_dir = op.join(conf.CONFIGS["model_dir"], "worker_{}".format(os.getpid()))
+    conf.CONFIGS["tcoffee_dir"] = op.join(worker_dir, "tcoffee")
+    conf.CONFIGS["modeller_dir"] = op.join(worker_dir, "modeller")
+    for path in [conf.CONFIGS["tcoffee_dir"], conf.CONFIGS["modeller_dir"]]:
+        os.makedirs(path, exist_ok=True)
+
+
+def _build_model(sequence_file, structure_file, modeller_results_file):
+    return elaspic_model.Model(sequence_file, structure_file, modeller_results_file)
+
+
 def get_unique_id(d):
     if isinstance(d, elaspic_database_tables.UniprotDomain):
         return ("uniprot_domain_id", d.uniprot_domain_id)
@@ -1,17 +1,27 @@
+import atexit
+import concurrent.futures
+import csv
 import datetime
+import gzip
 import logging
 import os
 import os.path as op
 import shlex
 import shutil
 import subprocess
+import tempfile
+import threading
+import time
+import urllib.request
+from collections import OrderedDict
 from contextlib import contextmanager
 
 import pandas as pd
 import six
 import sqlalchemy as sa
+from sqlalchemy.dialects import mysql, postgresql, sqlite
 
-from elaspic import conf, errors, helper
+from elaspic import archive_tools, conf, errors, helper
 from elaspic.elaspic_database_tables import (
     Base,
     UniprotDomain,
@@ -20,6 +30,9 @@ from elaspic.elaspic_database_tables import (
     UniprotDomainPair,
     UniprotDomainPairModel,
     UniprotDomainPairMutation,
+    UniprotDomainPairTemplate,
+    UniprotDomainTemplate,
+    UniprotSequence,
 )
 from elaspic.kmtools_legacy import make_connection_string, parse_connection_string
 
@@ -48,18 +61,221 @@ def enable_sqlite_foreign_key_checks(engine):
     event.listen(engine, "connect", _fk_pragma_on_connect)
 
 
+LOADING_STRATEGIES = {
+    "joined": sa.orm.joinedload,
+    "selectin": sa.orm.selectinload,
+}
+
+
+def _get_loader(loading_strategy):
+    try:
+        return LOADING_STRATEGIES[loading_strategy]
+    except KeyError:
+        raise ValueError("Unsupported loading strategy: '{}'".format(loading_strategy))
+
+
+def _get_uniprot_domain_options(loader):
+    return [
+        loader(UniprotDomain.uniprot_sequence).options(
+            loader(UniprotSequence.provean), sa.orm.lazyload("*")
+        ),
+        loader(UniprotDomain.template).options(
+            loader(UniprotDomainTemplate.model),
+            loader(UniprotDomainTemplate.domain),
+            sa.orm.lazyload("*"),
+        ),
+        sa.orm.lazyload("*"),
+    ]
+
+
+def get_uniprot_domain_load_options(loading_strategy="joined"):
+    """Return loader options that fetch a domain together with everything that ELASPIC needs.
+
+    Parameters
+    ----------
+    loading_strategy : str
+        ``joined`` fetches the domain, its sequence, Provean supporting set, template and model
+        in a single query. ``selectin`` issues one ``SELECT ... IN`` query per relationship,
+        so that wide rows (e.g. protein sequences) are not repeated for every parent.
+        Relationships outside of this graph are not loaded.
+    """
+    loader = _get_loader(loading_strategy)
+    return _get_uniprot_domain_options(loader)
+
+
+def get_uniprot_domain_pair_load_options(loading_strategy="joined"):
+    """Return loader options that fetch a domain pair together with everything that ELASPIC needs.
+
+    See :func:`get_uniprot_domain_load_options`.
+    """
+    loader = _get_loader(loading_strategy)
+    return [
+        loader(UniprotDomainPair.template).options(
+            loader(UniprotDomainPairTemplate.model),
+            loader(UniprotDomainPairTemplate.domain_1),
+            loader(UniprotDomainPairTemplate.domain_2),
+            sa.orm.lazyload("*"),
+        ),
+        loader(UniprotDomainPair.uniprot_domain_1).options(*_get_uniprot_domain_options(loader)),
+        loader(UniprotDomainPair.uniprot_domain_2).options(*_get_uniprot_domain_options(loader)),
+        sa.orm.lazyload("*"),
+    ]
+
+
+def get_upsert_statement(table, column_names, dialect_name):
+    """Return an ``INSERT`` statement that updates `column_names` of rows which already exist.
+
+    SQLite and PostgreSQL use ``ON CONFLICT DO UPDATE`` and MySQL uses
+    ``ON DUPLICATE KEY UPDATE``. Columns which are not in `column_names` keep their current
+    values, as they would with :meth:`sqlalchemy.orm.Session.merge`. SQLite's
+    ``INSERT OR REPLACE`` is not used because it deletes the existing row, and with it all
+    rows that reference it through an ``ON DELETE CASCADE`` foreign key.
+    """
+    primary_key = [c.key for c in table.primary_key]
+    update_columns = [c for c in column_names if c not in primary_key]
+    if dialect_name in ["sqlite", "postgresql"]:
+        insert = {"sqlite": sqlite.insert, "postgresql": postgresql.insert}[dialect_name]
+        statement = insert(table)
+        if not update_columns:
+            return statement.on_conflict_do_nothing(index_elements=primary_key)
+        return statement.on_conflict_do_update(
+            index_elements=primary_key,
+            set_={c: statement.excluded[c] for c in update_columns},
+        )
+    elif dialect_name == "mysql":
+        statement = mysql.insert(table)
+        return statement.on_duplicate_key_update(
+            {c: statement.inserted[c] for c in (update_columns or primary_key)}
+        )
+    else:
+        raise ValueError("Unsupported dialect: '{}'".format(dialect_name))
+
+
+def _get_row(row_instance):
+    """Return the table of `row_instance` and a dictionary of its loaded column values."""
+    state = sa.inspect(row_instance)
+    row = {}
+    for attr in state.mapper.column_attrs:
+        column = attr.columns[0]
+        if column.onupdate is not None and column.onupdate.is_callable:
+            row[column.key] = column.onupdate.arg(None)
+        elif attr.key in state.dict:
+            row[column.key] = state.dict[attr.key]
+    return state.mapper.local_table, row
+
+
+class UpsertBuffer(object):
+    """Collect rows and write them to the database using bulk upserts.
+
+    Parameters
+    ----------
+    engine : sqlalchemy.engine.Engine
+        Engine used to write the rows.
+    max_size : int
+        Write buffered rows once there are this many of them.
+    max_age : float
+        Write buffered rows once the oldest of them has been waiting for this many seconds.
+        Checked whenever a row is added.
+    """
+
+    def __init__(self, engine, max_size=1000, max_age=60):
+        self.engine = engine
+        self.max_size = max_size
+        self.max_age = max_age
+        self._rows = OrderedDict()
+        self._first_added = None
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._rows)
+
+    def add(self, row_instance):
+        """Add an ORM object to the buffer, replacing any buffered row with the same key."""
+        table, row = _get_row(row_instance)
+        key = (table.name, tuple(row.get(c.key) for c in table.primary_key))
+        with self._lock:
+            if self._first_added is None:
+                self._first_added = time.monotonic()
+            _, previous_row = self._rows.pop(key, (table, {}))
+            self._rows[key] = (table, {**previous_row, **row})
+            if (
+                len(self._rows) >= self.max_size
+                or time.monotonic() - self._first_added >= self.max_age
+            ):
+                self.flush()
+
+    @helper.retry_database
+    def flush(self):
+        """Write all buffered rows to the database in a single transaction."""
+        with self._lock:
+            if not self._rows:
+                return
+            rows_by_table = {}
+            for table, row in self._rows.values():
+                rows_by_table.setdefault(table, {}).setdefault(tuple(sorted(row)), []).append(row)
+            # Parent tables first, so that foreign keys of child rows are satisfied
+            with self.engine.begin() as conn:
+                for table in Base.metadata.sorted_tables:
+                    for column_names, rows in rows_by_table.get(table, {}).items():
+                        statement = get_upsert_statement(
+                            table, column_names, self.engine.dialect.name
+                        )
+                        conn.execute(statement, rows)
+            logger.debug("Wrote {} buffered rows to the database.".format(len(self._rows)))
+            self._rows.clear()
+            self._first_added = None
+
+
 # Get the session that will be used for all future queries.
 # `expire_on_commit` so that you keep all the table objects even after the session closes.
-Session = sa.orm.sessionmaker(expire_on_commit=False)
+# Every thread gets its own session.
+Session = sa.orm.scoped_session(sa.orm.sessionmaker(expire_on_commit=False))
+
+# Engines are shared by all `MyDatabase` instances in a process, so that pipelines running in
+# different threads draw connections from the same pool.
+_engines = {}
+_engines_lock = threading.Lock()
+
 
-# Session = sa.orm.scoped_session(sa.orm.sessionmaker(expire_on_commit=False))
+def _reset_engines_after_fork():
+    """Make child processes open their own connections instead of sharing the parent's sockets."""
+    global _engines_lock
+    _engines_lock = threading.Lock()
+    for engine in _engines.values():
+        engine.dispose(close=False)
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_engines_after_fork)
 
 
 class MyDatabase(object):
     """"""
 
-    def __init__(self, echo=False):
+    def __init__(self, echo=False, loading_strategy=None, write_buffer_size=None, copy_jobs=None):
         self.engine = self.get_engine(echo=echo)
+        if loading_strategy is None:
+            loading_strategy = conf.CONFIGS.get("db_loading_strategy", "joined")
+        self.loading_strategy = loading_strategy
+        if write_buffer_size is None:
+            write_buffer_size = conf.CONFIGS.get("db_write_buffer_size", 0)
+        self.write_buffer = None
+        if write_buffer_size > 0:
+            self.write_buffer = UpsertBuffer(
+                self.engine,
+                max_size=write_buffer_size,
+                max_age=conf.CONFIGS.get("db_write_buffer_timeout", 60),
+            )
+            atexit.register(self.flush)
+        if copy_jobs is None:
+            copy_jobs = conf.CONFIGS.get("archive_prefetch_jobs", 0)
+        self.copy_executor = None
+        if copy_jobs > 0:
+            self.copy_executor = concurrent.futures.ThreadPoolExecutor(
+                copy_jobs, thread_name_prefix="archive_prefetch"
+            )
+        self._copy_futures = {}
+        self._copied_keys = set()
         self.configure_session()
 
         logger.info(
@@ -69,7 +285,17 @@ class MyDatabase(object):
         )
 
     def get_engine(self, echo=False):
-        """Get an SQLAlchemy engine that can be used to connect to the database."""
+        """Get an SQLAlchemy engine that can be used to connect to the database.
+
+        Engines are cached by connection string, and are disposed of in forked processes.
+        """
+        key = (conf.CONFIGS["connection_string"], echo)
+        with _engines_lock:
+            if key not in _engines:
+                _engines[key] = self._create_engine(echo=echo)
+            return _engines[key]
+
+    def _create_engine(self, echo=False):
         sa_opts = {
             "echo": echo,
         }
@@ -77,10 +303,12 @@ class MyDatabase(object):
             sa_opts["isolation_level"] = "READ UNCOMMITTED"
         elif conf.CONFIGS["db_type"] == "mysql":
             sa_opts["isolation_level"] = "READ UNCOMMITTED"
-            sa_opts["pool_size"] = 1
+            sa_opts["pool_size"] = conf.CONFIGS.get("db_pool_size", 1)
+            sa_opts["max_overflow"] = conf.CONFIGS.get("db_max_overflow", 10)
             sa_opts["pool_recycle"] = 3600
         elif conf.CONFIGS["db_type"] == "postgresql":
-            sa_opts["pool_size"] = 1
+            sa_opts["pool_size"] = conf.CONFIGS.get("db_pool_size", 1)
+            sa_opts["max_overflow"] = conf.CONFIGS.get("db_max_overflow", 10)
             sa_opts["pool_recycle"] = 3600
         else:
             raise Exception("Unsupported 'db_type': '{}'!".format(conf.CONFIGS["db_type"]))
@@ -114,7 +342,9 @@ class MyDatabase(object):
         """Provide a transactional scope around a series of operations.
 
         Enables the following construct: ``with self.session_scope() as session:``.
+        Rows in `write_buffer` are written first, so that queries see them.
         """
+        self.flush()
         session = Session()
         try:
             yield session
@@ -126,7 +356,7 @@ class MyDatabase(object):
             raise
         finally:
             session.expunge_all()
-            session.close()
+            Session.remove()
 
     def create_database_schema(self, db_schema):
         """Create ELASPIC database schema."""
@@ -326,8 +556,7 @@ class MyDatabase(object):
             uniprot_domains = (
                 session.query(UniprotDomain)
                 .filter(UniprotDomain.uniprot_id == uniprot_id)
-                # .options(sa.orm.joinedload('template').joinedload('model'))
-                # .options(sa.orm.joinedload('template', innerjoin=True))
+                .options(*get_uniprot_domain_load_options(self.loading_strategy))
                 .limit(100)
                 .all()
             )
@@ -344,23 +573,21 @@ class MyDatabase(object):
                 )
                 del uniprot_domains[d_idx]
                 continue
-            # Copy precalculated Provean data
-            if copy_data:
-                try:
-                    self._copy_provean(d, archive_dir, archive_type)
-                except subprocess.CalledProcessError as e:
-                    logger.error(e)
-                    logger.error("Failed to copy provean supporting set!")
-                    d.uniprot_sequence.provean.provean_supset_filename = ""
-            # Copy precalculated homology models
+            # Copy precalculated Provean data and homology models
             if copy_data:
-                try:
-                    self._copy_uniprot_domain_data(d, d.path_to_data, archive_dir, archive_type)
-                except subprocess.CalledProcessError as e:
-                    logger.error(e)
-                    logger.error("Failed to copy the domain alignment and / or homology model!")
-                    d.template.model.alignment_filename = None
-                    d.template.model.model_filename = None
+                self._submit_copy(
+                    ("provean", d.uniprot_id), self._copy_provean, d, archive_dir, archive_type
+                )
+                self._submit_copy(
+                    ("uniprot_domain", d.uniprot_domain_id),
+                    self._copy_uniprot_domain_data,
+                    d,
+                    d.path_to_data,
+                    archive_dir,
+                    archive_type,
+                )
+                if self.copy_executor is None:
+                    self.wait_for_data(d)
             d_idx += 1
 
         return uniprot_domains
@@ -380,10 +607,11 @@ class MyDatabase(object):
                     UniprotDomainPair.uniprot_domain_pair_id.in_(uniprot_domain_pair_ids)
                 )
             uniprot_domain_pairs = (
-                uniprot_domain_pairs_query
-                # .options(sa.orm.joinedload('template', innerjoin=True).joinedload('model'))
-                # .options(sa.orm.joinedload('template', innerjoin=True))
-                .limit(100).all()
+                uniprot_domain_pairs_query.options(
+                    *get_uniprot_domain_pair_load_options(self.loading_strategy)
+                )
+                .limit(100)
+                .all()
             )
 
         # The above SQL query may result in duplicates if we have homodimers.
@@ -407,34 +635,104 @@ class MyDatabase(object):
                 )
                 del uniprot_domain_pairs[d_idx]
                 continue
-            # Copy precalculated Provean data
+            # Copy precalculated Provean data and homology models
             if copy_data:
                 if d.uniprot_id_1 == uniprot_id:
                     ud = d.uniprot_domain_1
                 elif d.uniprot_id_2 == uniprot_id:
                     ud = d.uniprot_domain_2
-                try:
-                    self._copy_provean(ud, archive_dir, archive_type)
-                except subprocess.CalledProcessError as e:
-                    logger.error(e)
-                    logger.error("Failed to copy provean supporting set!")
-                    d.uniprot_sequence.provean.provean_supset_filename = ""
-            # Copy precalculated homology models
-            if copy_data:
-                try:
-                    self._copy_uniprot_domain_pair_data(
-                        d, d.path_to_data, archive_dir, archive_type
-                    )
-                except subprocess.CalledProcessError as e:
-                    logger.error(e)
-                    logger.error("Failed to copy domain pair alignments and / or homology model!")
-                    d.template.model.alignment_filename_1 = None
-                    d.template.model.alignment_filename_2 = None
-                    d.template.model.model_filename = None
+                self._submit_copy(
+                    ("provean", ud.uniprot_id), self._copy_provean, ud, archive_dir, archive_type
+                )
+                self._submit_copy(
+                    ("uniprot_domain_pair", d.uniprot_domain_pair_id),
+                    self._copy_uniprot_domain_pair_data,
+                    d,
+                    d.path_to_data,
+                    archive_dir,
+                    archive_type,
+                )
+                if self.copy_executor is None:
+                    self.wait_for_data(d)
             d_idx += 1
 
         return uniprot_domain_pairs
 
+    def _submit_copy(self, key, fn, *args):
+        """Copy files from the archive using `fn(*args)`, in the background if possible.
+
+        Files are copied only once for every `key`. Use :meth:`wait_for_data` to wait until
+        the files of a domain or domain pair are available.
+        """
+        if key in self._copy_futures or key in self._copied_keys:
+            return
+        if self.copy_executor is not None:
+            future = self.copy_executor.submit(fn, *args)
+        else:
+            future = concurrent.futures.Future()
+            try:
+                future.set_result(fn(*args))
+            except Exception as e:
+                future.set_exception(e)
+        self._copy_futures[key] = future
+
+    def _pop_copy_future(self, key):
+        future = self._copy_futures.pop(key, None)
+        if future is not None:
+            self._copied_keys.add(key)
+        return future
+
+    def shutdown_copy_executor(self):
+        """Wait for background copies to finish and copy files in the foreground from now on.
+
+        Must be called before forking, so that child processes do not inherit locks held by
+        the copy threads.
+        """
+        if self.copy_executor is not None:
+            self.copy_executor.shutdown(wait=True)
+            self.copy_executor = None
+
+    def wait_for_provean(self, ud):
+        """Wait until the Provean supporting set for domain `ud` is copied from the archive."""
+        future = self._pop_copy_future(("provean", ud.uniprot_id))
+        if future is None:
+            return
+        try:
+            future.result()
+        except subprocess.CalledProcessError as e:
+            logger.error(e)
+            logger.error("Failed to copy provean supporting set!")
+            ud.uniprot_sequence.provean.provean_supset_filename = ""
+
+    def wait_for_data(self, d):
+        """Wait until precalculated files for domain or domain pair `d` are copied from the archive.
+
+        Files which could not be extracted are marked as missing, so that they are recalculated.
+        """
+        if isinstance(d, UniprotDomain):
+            uds = [d]
+            key = ("uniprot_domain", d.uniprot_domain_id)
+            filename_attributes = ["alignment_filename", "model_filename"]
+        elif isinstance(d, UniprotDomainPair):
+            uds = [d.uniprot_domain_1, d.uniprot_domain_2]
+            key = ("uniprot_domain_pair", d.uniprot_domain_pair_id)
+            filename_attributes = ["alignment_filename_1", "alignment_filename_2", "model_filename"]
+        else:
+            raise Exception("'d' is of incorrect type!")
+
+        for ud in uds:
+            self.wait_for_provean(ud)
+        future = self._pop_copy_future(key)
+        if future is None:
+            return
+        try:
+            future.result()
+        except subprocess.CalledProcessError as e:
+            logger.error(e)
+            logger.error("Failed to copy alignments and / or homology model!")
+            for attribute in filename_attributes:
+                setattr(d.template.model, attribute, None)
+
     def _copy_uniprot_domain_data(self, d, path_to_data, archive_dir, archive_type):
         if path_to_data is None:
             logger.error("Cannot copy uniprot domain data because `path_to_data` is None")
@@ -595,7 +893,12 @@ class MyDatabase(object):
 
     @helper.retry_archive
     def _extract_files_from_7zip(self, path_to_7zip, filenames_in):
-        """Extract files to `config['archive_temp_dir']`."""
+        """Extract files to `config['archive_temp_dir']`.
+
+        Files are read using :mod:`elaspic.archive_tools`, which indexes the archive once
+        (and prefers a ``.zip`` version of the archive, if there is one). The ``7za`` command
+        is used only if :mod:`py7zr` is not installed.
+        """
         logger.debug("Extracting the following files: {}".format(filenames_in))
         filenames = [
             f for f in filenames_in if not op.isfile(op.join(conf.CONFIGS["archive_temp_dir"], f))
@@ -603,6 +906,18 @@ class MyDatabase(object):
         if not filenames:
             logger.debug("All files already been extracted. Done!")
             return
+        try:
+            archive = archive_tools.get_archive(
+                path_to_7zip, index_cache_dir=op.join(conf.CONFIGS["temp_dir"], "archive_index")
+            )
+        except ImportError:
+            logger.debug("py7zr is not installed; falling back to 7za...")
+        else:
+            try:
+                archive.extract(filenames, conf.CONFIGS["archive_temp_dir"])
+            except FileNotFoundError as e:
+                raise errors.Archive7zipError(str(e), str(e), None)
+            return
         system_command = "7za x '{path_to_7zip}' '{files}' -y".format(
             path_to_7zip=path_to_7zip, files="' '".join(filenames)
         )
@@ -715,10 +1030,25 @@ class MyDatabase(object):
                 raise Exception("'d' is of incorrect type!")
 
     # %% Add objects to the database
+    def flush(self):
+        """Write rows buffered by :meth:`merge_row` to the database."""
+        if self.write_buffer is not None:
+            self.write_buffer.flush()
+
     @helper.retry_database
     def merge_row(self, row_instance):
-        """Add a list of rows (`row_instances`) to the database."""
-        if not conf.CONFIGS["db_is_immutable"]:
+        """Add a list of rows (`row_instances`) to the database.
+
+        If `write_buffer` is set, rows are added to it and are written in bulk later.
+        """
+        if conf.CONFIGS["db_is_immutable"]:
+            return
+        if self.write_buffer is not None:
+            if not isinstance(row_instance, (tuple, list)):
+                row_instance = [row_instance]
+            for instance in row_instance:
+                self.write_buffer.add(instance)
+        else:
             with self.session_scope() as session:
                 if not isinstance(row_instance, (tuple, list)):
                     session.merge(row_instance)
@@ -885,3 +1215,186 @@ def get_uniprot_domain_path(d=None, **vargs):
         raise Exception
 
     return uniprot_domain_path
+
+
+# %% Bulk loading
+SQLITE_BULK_LOAD_PRAGMAS = [
+    "PRAGMA foreign_keys = OFF",
+    "PRAGMA synchronous = OFF",
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA cache_size = -262144",  # 256 MB
+]
+
+
+@contextmanager
+def _open_table_file(table_url, table_name):
+    """Open the gzipped dump of table `table_name`, located in a folder or at a URL."""
+    filename = table_url.rstrip("/") + "/" + table_name + ".tsv.gz"
+    if "://" in table_url:
+        with urllib.request.urlopen(filename) as response:
+            with gzip.open(response, "rt", encoding="utf-8", newline="") as ifh:
+                yield ifh
+    else:
+        with gzip.open(filename, "rt", encoding="utf-8", newline="") as ifh:
+            yield ifh
+
+
+def _load_table_sqlite(cursor, table, ifh):
+    for pragma in SQLITE_BULK_LOAD_PRAGMAS:
+        cursor.execute(pragma)
+    sql_command = "INSERT INTO {} ({}) VALUES ({})".format(
+        table.name, ", ".join(table.columns.keys()), ", ".join("?" for _ in table.columns)
+    )
+    num_rows = 0
+
+    def iter_rows():
+        nonlocal num_rows
+        for row in csv.reader(ifh):
+            num_rows += 1
+            yield [None if value in ("\\N", "") else value for value in row]
+
+    cursor.executemany(sql_command, iter_rows())
+    return num_rows
+
+
+def _load_table_postgresql(cursor, table, ifh):
+    sql_command = r"COPY {} ({}) FROM STDIN WITH (FORMAT csv, NULL '\N')".format(
+        table.name, ", ".join(table.columns.keys())
+    )
+    cursor.copy_expert(sql_command, ifh)
+    return cursor.rowcount
+
+
+def _load_table_mysql(cursor, table, ifh):
+    cursor.execute("SET foreign_key_checks = 0, unique_checks = 0")
+    # ``LOAD DATA LOCAL`` can only read from a file
+    with tempfile.NamedTemporaryFile("wt", suffix=".csv", encoding="utf-8") as ofh:
+        shutil.copyfileobj(ifh, ofh)
+        ofh.flush()
+        sql_command = (
+            "LOAD DATA LOCAL INFILE '{}' INTO TABLE {} "
+            "FIELDS TERMINATED BY ',' OPTIONALLY ENCLOSED BY '\"' "
+            "LINES TERMINATED BY '\\n' ({})"
+        ).format(ofh.name, table.name, ", ".join(table.columns.keys()))
+        cursor.execute(sql_command)
+    return cursor.rowcount
+
+
+_BULK_LOADERS = {
+    "sqlite": _load_table_sqlite,
+    "postgresql": _load_table_postgresql,
+    "mysql": _load_table_mysql,
+}
+
+
+def load_table(engine, table, table_url):
+    """Load the dump of `table` from `table_url` using the native bulk loader of the database.
+
+    Indexes other than the primary key are dropped before the data is loaded
+    and are recreated afterwards.
+
+    Parameters
+    ----------
+    engine : sqlalchemy.engine.Engine
+        Engine used to load the data. Settings that are changed to speed up the load stay
+        changed for as long as the connection is open, so this engine should not use a pool.
+    table : sqlalchemy.Table
+        Table to load. It should already exist and be empty.
+    table_url : str
+        Folder or URL containing a ``{table_name}.tsv.gz`` file, with values separated by
+        commas and NULLs written as ``\\N``.
+
+    Returns
+    -------
+    num_rows : int
+        Number of rows loaded into `table`.
+    """
+    try:
+        load_table_data = _BULK_LOADERS[engine.dialect.name]
+    except KeyError:
+        raise ValueError("Unsupported dialect: '{}'".format(engine.dialect.name))
+
+    start_time = time.perf_counter()
+    with engine.begin() as conn:
+        for index in table.indexes:
+            index.drop(conn, checkfirst=True)
+    connection = engine.raw_connection()
+    try:
+        cursor = connection.cursor()
+        with _open_table_file(table_url, table.name) as ifh:
+            num_rows = load_table_data(cursor, table, ifh)
+        cursor.close()
+        connection.commit()
+    finally:
+        connection.close()
+    load_time = time.perf_counter() - start_time
+    with engine.begin() as conn:
+        for index in table.indexes:
+            index.create(conn, checkfirst=True)
+    total_time = time.perf_counter() - start_time
+    logger.info(
+        "Loaded {} rows into table '{}' in {:.1f} s ({:.0f} rows / s); "
+        "indexes were created in {:.1f} s.".format(
+            num_rows,
+            table.name,
+            load_time,
+            num_rows / max(load_time, 1e-6),
+            total_time - load_time,
+        )
+    )
+    return num_rows
+
+
+def load_tables(engine, table_names, table_url, jobs=1):
+    """Replace the contents of tables `table_names` with the dumps found at `table_url`.
+
+    Tables which do not depend on one another through foreign keys are loaded in parallel
+    using `jobs` threads. SQLite can only have one writer, so its tables are always loaded
+    one at a time.
+
+    Returns
+    -------
+    num_rows : dict
+        Number of rows loaded into each table.
+    """
+    tables = [t for t in Base.metadata.sorted_tables if t.name in table_names]
+    # Tables are only loaded after the tables that they reference
+    levels = {}
+    for table in tables:
+        levels[table] = 1 + max(
+            [levels[fk.column.table] for fk in table.foreign_keys if fk.column.table in levels]
+            + [-1]
+        )
+    if engine.dialect.name == "sqlite":
+        jobs = 1
+
+    with engine.begin() as conn:
+        for table in reversed(tables):
+            conn.execute(table.delete())
+
+    load_engine = sa.create_engine(
+        engine.url,
+        poolclass=sa.pool.NullPool,
+        connect_args={"local_infile": 1} if engine.dialect.name == "mysql" else {},
+    )
+    start_time = time.perf_counter()
+    num_rows = {}
+    with concurrent.futures.ThreadPoolExecutor(jobs) as executor:
+        for level in sorted(set(levels.values())):
+            level_tables = [t for t in tables if levels[t] == level]
+            for table, table_num_rows in zip(
+                level_tables,
+                executor.map(lambda t: load_table(load_engine, t, table_url), level_tables),
+            ):
+                num_rows[table.name] = table_num_rows
+    load_engine.dispose()
+    total_time = time.perf_counter() - start_time
+    logger.info(
+        "Loaded {} rows into {} tables in {:.1f} s ({:.0f} rows / s).".format(
+            sum(num_rows.values()),
+            len(num_rows),
+            total_time,
+            sum(num_rows.values()) / max(total_time, 1e-6),
+        )
+    )
+    return num_rows
@@ -1,3 +1,5 @@
+import functools
+import hashlib
 import json
 import logging
 import os
@@ -18,6 +20,7 @@ from . import (
     call_tcoffee,
     conf,
     errors,
+    helper,
     structure_analysis,
     structure_tools,
 )
@@ -25,6 +28,27 @@ from . import (
 logger = logging.getLogger(__name__)
 
 
+@functools.lru_cache(maxsize=None)
+def _get_file_cache(cache_dir, max_size=None):
+    return helper.FileCache(cache_dir, max_size)
+
+
+def get_analysis_cache():
+    """Return the cache used by `structure_analysis.AnalyzeStructure`, if one is configured."""
+    if not conf.CONFIGS.get("analysis_cache_dir"):
+        return None
+    return _get_file_cache(
+        conf.CONFIGS["analysis_cache_dir"], conf.CONFIGS["analysis_cache_size"] * 1024**2
+    )
+
+
+def get_foldx_cache():
+    """Return the cache used by `call_foldx.FoldX` for repaired structures, if one is configured."""
+    if not conf.CONFIGS.get("foldx_cache_dir"):
+        return None
+    return _get_file_cache(conf.CONFIGS["foldx_cache_dir"])
+
+
 class Model:
     """Structural homology model.
 
@@ -264,6 +288,7 @@ class Model:
         analyze_structure = structure_analysis.AnalyzeStructure(
             op.join(conf.CONFIGS["unique_temp_dir"], self.modeller_results["model_file"]),
             conf.CONFIGS["modeller_dir"],
+            cache=get_analysis_cache(),
         )
         (
             __,
@@ -374,6 +399,7 @@ class Model:
         analyze_structure = structure_analysis.AnalyzeStructure(
             op.join(conf.CONFIGS["unique_temp_dir"], self.modeller_results["model_file"]),
             conf.CONFIGS["modeller_dir"],
+            cache=get_analysis_cache(),
         )
         (
             self.interface_area_hydrophobic,
@@ -395,9 +421,108 @@ class Model:
         MutationOutsideDomainError
         MutationOutsideInterfaceError
         """
-        if (sequence_idx, mutation) in self.mutations:
-            return self.mutations[(sequence_idx, mutation)]
+        results = self.mutate_many(sequence_idx, [mutation])[mutation]
+        if isinstance(results, Exception):
+            raise results
+        return results
+
+    def mutate_many(self, sequence_idx, mutations):
+        """Introduce several mutations into model, running FoldX ``BuildModel`` only once.
+
+        Parameters
+        ----------
+        sequence_idx : int
+            Integer describing whether the mutations are on the first domain (`0`)
+            or on the second domain (`1`).
+        mutations : list
+            Mutations in domain coordinates (e.g. ``['G1A', 'L15P']``).
+
+        Returns
+        -------
+        dict
+            Results of :meth:`mutate` for every mutation. Mutations that fall outside the
+            domain or the interface map to the `MutationOutsideDomainError` or
+            `MutationOutsideInterfaceError` that they raised, so that they do not abort the
+            rest of the batch.
+        """
+        # Duplicate mutations would make FoldX build the same model twice
+        mutations = list(dict.fromkeys(mutations))
+        mutation_infos = []
+        for mutation in mutations:
+            if (sequence_idx, mutation) in self.mutations:
+                continue
+            try:
+                mutation_info = self._get_mutation_info(sequence_idx, mutation)
+            except (errors.MutationOutsideDomainError, errors.MutationOutsideInterfaceError) as e:
+                self.mutations[(sequence_idx, mutation)] = e
+                continue
+            if mutation_info["mutation_errors"]:
+                self.mutations[(sequence_idx, mutation)] = mutation_info
+                continue
+            mutation_infos.append(mutation_info)
+
+        if mutation_infos:
+            # FoldX runs in the mutation folder if there is only one mutation
+            if len(mutation_infos) == 1:
+                foldx_dir = self._prepare_mutation_dir(mutation_infos[0]["mutation_id"])
+            else:
+                foldx_dir = self._prepare_mutation_dir(
+                    "{}-{}-batch-{}".format(
+                        mutation_infos[0]["protein_id"],
+                        mutation_infos[0]["partner_protein_id"],
+                        hashlib.md5(
+                            ",".join(m["mutation_domain"] for m in mutation_infos).encode()
+                        ).hexdigest(),
+                    )
+                )
+
+            #######################################################################
+            # Copy the homology model to the FoldX folder
+            model_file = op.join(foldx_dir, op.basename(self.modeller_results["model_file"]))
+            shutil.copy(
+                op.join(conf.CONFIGS["unique_temp_dir"], self.modeller_results["model_file"]),
+                model_file,
+            )
 
+            #######################################################################
+            # 2nd: use the 'Repair' feature of FoldX to optimise the structure
+            foldx = call_foldx.FoldX(foldx_dir, cache=get_foldx_cache())
+
+            #######################################################################
+            # 3rd: introduce the mutations using FoldX
+            foldx_mutations = [m["mutation_foldx"] for m in mutation_infos]
+            logger.debug("FoldX mutations: %s", foldx_mutations)
+            foldx_results = foldx.build_models(model_file, foldx_mutations)
+
+            for mutation_info, (
+                structure_file_wt,
+                structure_file_mut,
+                stability_values_wt,
+                stability_values_mut,
+            ) in zip(mutation_infos, foldx_results):
+                mutation_dir = self._prepare_mutation_dir(mutation_info["mutation_id"])
+                if mutation_dir != foldx_dir:
+                    structure_file_wt = shutil.move(
+                        structure_file_wt, op.join(mutation_dir, op.basename(structure_file_wt))
+                    )
+                    structure_file_mut = shutil.move(
+                        structure_file_mut,
+                        op.join(mutation_dir, op.basename(structure_file_mut)),
+                    )
+                results = self._analyse_mutation(
+                    mutation_info,
+                    mutation_dir,
+                    structure_file_wt,
+                    structure_file_mut,
+                    (stability_values_wt, stability_values_mut),
+                )
+                # Another exit point
+                self.mutations[(sequence_idx, mutation_info["mutation_domain"])] = results
+
+        return {mutation: self.mutations[(sequence_idx, mutation)] for mutation in mutations}
+
+    def _get_mutation_info(self, sequence_idx, mutation):
+        """Map mutation to the homology model and make sure that it can be evaluated."""
         protein_id = self.sequence_seqrecords[sequence_idx].id
         chain_id = self.modeller_structure.child_list[0].child_list[sequence_idx].id
 
@@ -453,7 +578,7 @@ class Model:
         mutation_id = "{}-{}-{}".format(protein_id, partner_protein_id, mutation)
 
         if mutation_errors:
-            results = dict(
+            return dict(
                 protein_id=protein_id,
                 sequence_idx=sequence_idx,
                 chain_modeller=chain_id,
@@ -462,48 +587,61 @@ class Model:
                 mutation_domain=mutation,
                 mutation_errors=mutation_errors,
             )
-            self.mutations[(sequence_idx, mutation)] = results
-            return results
 
         # ...
         logger.debug("Running mutation with mutation_id: {}".format(mutation_id))
         logger.debug("chain_id: {}".format(chain_id))
         logger.debug("partner_chain_id: {}".format(partner_chain_id))
 
-        #######################################################################
-        # Create a folder for all mutation data.
-        mutation_dir = op.join(conf.CONFIGS["model_dir"], "mutations", mutation_id)
-        os.makedirs(mutation_dir, exist_ok=True)
-        os.makedirs(mutation_dir, exist_ok=True)
-        shutil.copy(op.join(conf.CONFIGS["data_dir"], "rotabase.txt"), mutation_dir)
+        foldx_mutation = mutation_modeller[0] + chain_id + mutation_modeller[1:]
+        logger.debug("FoldX mutation: %s", foldx_mutation)
 
-        #######################################################################
-        # Copy the homology model to the mutation folder
-        model_file = op.join(mutation_dir, op.basename(self.modeller_results["model_file"]))
-        shutil.copy(
-            op.join(conf.CONFIGS["unique_temp_dir"], self.modeller_results["model_file"]),
-            model_file,
+        return dict(
+            protein_id=protein_id,
+            partner_protein_id=partner_protein_id,
+            sequence_idx=sequence_idx,
+            chain_modeller=chain_id,
+            partner_chain_id=partner_chain_id,
+            mutation_id=mutation_id,
+            mutation_domain=mutation,
+            mutation_errors=mutation_errors,
+            mutation_modeller=mutation_modeller,
+            mutation_foldx=foldx_mutation,
         )
 
-        #######################################################################
-        # 2nd: use the 'Repair' feature of FoldX to optimise the structure
-        foldx = call_foldx.FoldX(mutation_dir)
-
-        #######################################################################
-        # 3rd: introduce the mutation using FoldX
-        foldx_mutation = mutation_modeller[0] + chain_id + mutation_modeller[1:]
-        logger.debug("FoldX mutation: %s", foldx_mutation)
+    def _prepare_mutation_dir(self, mutation_id):
+        """Create a folder for all mutation data."""
+        mutation_dir = op.join(conf.CONFIGS["model_dir"], "mutations", mutation_id)
+        os.makedirs(mutation_dir, exist_ok=True)
+        shutil.copy(op.join(conf.CONFIGS["data_dir"], "rotabase.txt"), mutation_dir)
+        return mutation_dir
+
+    def _analyse_mutation(
+        self,
+        mutation_info,
+        mutation_dir,
+        structure_file_wt,
+        structure_file_mut,
+        build_model_stability_values=None,
+    ):
+        """Calculate energies and structural properties of the wt and mut structures.
 
-        # Introduce the mutation using foldX
-        (
-            structure_file_wt,
-            structure_file_mut,
-            stability_values_wt,
-            stability_values_mut,
-        ) = foldx.build_model(model_file, foldx_mutation)
+        Parameters
+        ----------
+        build_model_stability_values : tuple, optional
+            Energies of the wt and mut structures calculated by FoldX ``BuildModel``.
+            Used instead of running FoldX ``Stability`` if the ``foldx_stability_from_build_model``
+            option is set.
+        """
+        mutation_id = mutation_info["mutation_id"]
+        mutation_modeller = mutation_info["mutation_modeller"]
+        chain_id = mutation_info["chain_modeller"]
+        partner_chain_id = mutation_info["partner_chain_id"]
         logger.debug("structure_file_wt: %s", structure_file_wt)
         logger.debug("structure_file_mut: %s", structure_file_mut)
 
+        foldx = call_foldx.FoldX(mutation_dir)
+
         wt_chain_sequences = structure_tools.get_structure_sequences(structure_file_wt)
         mut_chain_sequences = structure_tools.get_structure_sequences(structure_file_mut)
         logger.debug("wt_chain_sequences: %s" % str(wt_chain_sequences))
@@ -517,8 +655,21 @@ class Model:
 
         #######################################################################
         # 5th: Calculate energies
-        stability_values_wt = ",".join("{}".format(f) for f in foldx.stability(structure_file_wt))
-        stability_values_mut = ",".join("{}".format(f) for f in foldx.stability(structure_file_mut))
+        if (
+            conf.CONFIGS.get("foldx_stability_from_build_model")
+            and build_model_stability_values is not None
+        ):
+            stability_values_wt = call_foldx.add_number_of_residues(
+                build_model_stability_values[0], structure_file_wt
+            )
+            stability_values_mut = call_foldx.add_number_of_residues(
+                build_model_stability_values[1], structure_file_mut
+            )
+        else:
+            stability_values_wt = foldx.stability(structure_file_wt)
+            stability_values_mut = foldx.stability(structure_file_mut)
+        stability_values_wt = ",".join("{}".format(f) for f in stability_values_wt)
+        stability_values_mut = ",".join("{}".format(f) for f in stability_values_mut)
 
         if len(self.sequence_seqrecords) == 1:
             complex_stability_values_wt = None
@@ -539,6 +690,7 @@ class Model:
         analyze_structure_wt = structure_analysis.AnalyzeStructure(
             structure_file_wt,
             mutation_dir,
+            cache=get_analysis_cache(),
         )
         analyze_structure_results_wt = analyze_structure_wt(
             chain_id, mutation_modeller, partner_chain_id
@@ -547,6 +699,7 @@ class Model:
         analyze_structure_mut = structure_analysis.AnalyzeStructure(
             structure_file_mut,
             mutation_dir,
+            cache=get_analysis_cache(),
         )
         analyze_structure_results_mut = analyze_structure_mut(
             chain_id, mutation_modeller, partner_chain_id
@@ -558,17 +711,17 @@ class Model:
         #######################################################################
         # 5th: calculate the energy for the wildtype
         results = dict(
-            protein_id=protein_id,
-            sequence_idx=sequence_idx,
+            protein_id=mutation_info["protein_id"],
+            sequence_idx=mutation_info["sequence_idx"],
             chain_modeller=chain_id,
             partner_chain_id=partner_chain_id,
             mutation_id=mutation_id,
-            mutation_domain=mutation,
-            mutation_errors=mutation_errors,
+            mutation_domain=mutation_info["mutation_domain"],
+            mutation_errors=mutation_info["mutation_errors"],
             #
             mutation_dir=mutation_dir,
             mutation_modeller=mutation_modeller,
-            mutation_foldx=foldx_mutation,
+            mutation_foldx=mutation_info["mutation_foldx"],
             model_file_wt=model_file_wt,
             model_file_mut=model_file_mut,
             stability_energy_wt=stability_values_wt,
@@ -580,9 +733,6 @@ class Model:
             results[key + "_wt"] = value
         for key, value in analyze_structure_results_mut.items():
             results[key + "_mut"] = value
-
-        # Another exit point
-        self.mutations[(sequence_idx, mutation)] = results
         return results
 
     @property
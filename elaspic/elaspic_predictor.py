@@ -1,14 +1,17 @@
+import io
 import json
 import logging
 import os.path as op
 import pickle
+import threading
 import warnings
 
 import numpy as np
 import pandas as pd
 import sklearn.ensemble
+import sqlalchemy as sa
 
-from . import call_foldx
+from . import CACHE_DIR, call_foldx
 
 logger = logging.getLogger(__name__)
 
@@ -96,7 +99,41 @@ def _split_foldx_features(df, foldx_column_name, foldx_feature_names):
     return df
 
 
-def format_mutation_features(df):
+def _split_features(values, num_features):
+    """Parse comma-separated lists of features into a 2D array of floats.
+
+    Null values are converted to rows of NaNs.
+    """
+    values = pd.Series(values, dtype=object)
+    is_valid = values.notnull().values
+    features = np.full((len(values), num_features), np.nan)
+    if not is_valid.any():
+        return features
+    valid_values = values[is_valid].tolist()
+    # Use the C parser of `read_csv` to parse all rows at once
+    text = "\n".join(valid_values)
+    num_columns = max(valid_values[0].count(",") + 1, num_features)
+    try:
+        parsed = _read_features_csv(text, num_columns)
+    except pd.errors.ParserError:
+        # Some rows contain more elements than the first row
+        num_columns = max(num_columns, max(v.count(",") for v in valid_values) + 1)
+        parsed = _read_features_csv(text, num_columns)
+    features[is_valid] = parsed[:, :num_features]
+    return features
+
+
+def _read_features_csv(text, num_columns):
+    return pd.read_csv(
+        io.StringIO(text),
+        header=None,
+        names=range(num_columns),
+        dtype=float,
+        skip_blank_lines=False,
+    ).values
+
+
+def format_mutation_features(df, method="vectorized"):
     """.
 
     Converts columns containing comma-separated lists of FoldX features and physicochemical
@@ -107,6 +144,9 @@ def format_mutation_features(df):
     feature_df : DataFrame
         A pandas DataFrame containing a subset of rows from the :ref:`uniprot_domain_mutation`
         or the :ref:`uniprot_domain_pair_mutation` tables.
+    method : str
+        ``vectorized`` parses each column of comma-separated features at once,
+        ``loop`` parses features one value at a time.
 
     Returns
     -------
@@ -115,6 +155,100 @@ def format_mutation_features(df):
         of features converted to columns containing a single feature each.
 
     """
+    if method == "vectorized":
+        return _format_mutation_features_vectorized(df)
+    elif method == "loop":
+        return _format_mutation_features_loop(df)
+    else:
+        raise ValueError("Unsupported method: '{}'".format(method))
+
+
+def _format_mutation_features_vectorized(df):
+    df = df.copy()
+
+    # PhysicoChemical properties
+    names_phys_chem = ["pcv_salt_equal", "pcv_salt_opposite", "pcv_hbond", "pcv_vdw"]
+    physchem_columns = [
+        ("_wt", "physchem_wt"),
+        ("_self_wt", "physchem_wt_ownchain"),
+        ("_mut", "physchem_mut"),
+        ("_self_mut", "physchem_mut_ownchain"),
+    ]
+    physchem_features = {
+        suffix: _split_features(df[column_name].values, len(names_phys_chem))
+        for suffix, column_name in physchem_columns
+    }
+    for column_index, column_name in enumerate(names_phys_chem):
+        for suffix, __ in physchem_columns:
+            df[column_name + suffix] = physchem_features[suffix][:, column_index]
+    for __, column_name in physchem_columns:
+        del df[column_name]
+
+    # Secondary structure
+    for col in df.columns:
+        if "secondary_structure" in col:
+            values = df[col]
+            unknown = values.notnull() & ~values.isin(list(secondary_structure_to_int))
+            if unknown.any():
+                raise KeyError(values[unknown].iloc[0])
+            df[col] = values.map(secondary_structure_to_int).astype(float)
+
+    # FoldX
+    result = []
+
+    foldx_core_column_name = "stability_energy"
+    foldx_interface_column_name = "analyse_complex_energy"
+
+    # Check to see if we have any interface mutations
+    if (foldx_interface_column_name + "_wt") in df.columns and df[
+        (foldx_interface_column_name + "_wt")
+    ].notnull().any():
+        is_interface = df[(foldx_interface_column_name + "_wt")].notnull()
+
+        # Parse FoldX interface features
+        df_interface = df[is_interface]
+        df_interface = _split_foldx_features_vectorized(
+            df_interface,
+            foldx_interface_column_name + "_wt",
+            call_foldx.names_stability_complex_wt,
+        )
+        df_interface = _split_foldx_features_vectorized(
+            df_interface,
+            foldx_interface_column_name + "_mut",
+            call_foldx.names_stability_complex_mut,
+        )
+        result.append(df_interface)
+
+        df_core = df[~is_interface]
+
+    else:
+        df_core = df
+
+    # Parse FoldX core features
+    df_core = _split_foldx_features_vectorized(
+        df_core, foldx_core_column_name + "_wt", call_foldx.names_stability_wt
+    )
+    df_core = _split_foldx_features_vectorized(
+        df_core, foldx_core_column_name + "_mut", call_foldx.names_stability_mut
+    )
+    result.append(df_core)
+
+    result_df = pd.concat(result, ignore_index=True)
+    assert result_df.shape[0] == df.shape[0]
+
+    return result_df
+
+
+def _split_foldx_features_vectorized(df, foldx_column_name, foldx_feature_names):
+    df = df.copy()
+    features = _split_features(df[foldx_column_name].values, len(foldx_feature_names))
+    for column_index, column_name in enumerate(foldx_feature_names):
+        df[column_name] = features[:, column_index]
+    del df[foldx_column_name]
+    return df
+
+
+def _format_mutation_features_loop(df):
     df = df.copy()
 
     # PhysicoChemical properties
@@ -197,11 +331,11 @@ def convert_features_to_differences(df, keep_mut=False):
     If `keep_mut` is `False`, removes all mutant features (features ending in `_mut`).
     """
     column_list = []
-    for column_name, column in df.iteritems():
+    for column_name, column in df.items():
         if (
             "_mut" in column_name
             and column_name.replace("_mut", "_wt") in df.columns
-            and df[column_name].dtype != object
+            and pd.api.types.is_numeric_dtype(column)
         ):
             if keep_mut:
                 column_list.append(column)
@@ -216,20 +350,66 @@ def convert_features_to_differences(df, keep_mut=False):
     return new_df
 
 
-def get_core_mutations(df, engine, schema_name="elaspic"):
-    values = "('" + df["uniprot_id"] + "', '" + df["uniprot_mutation"] + "')"
+#: Number of ``(uniprot_id, mutation)`` pairs to look up using a single query
+#: (three parameters per pair, so that old SQLite versions stay under their 999 parameter limit)
+MUTATION_LOOKUP_CHUNK_SIZE = 300
+
+
+def _read_mutations(sql_query, df, engine, chunk_size):
+    """Read rows for mutations in `df` using parameterized queries for chunks of mutations.
+
+    Parameters
+    ----------
+    sql_query : str
+        SQL query with a ``{mutation_filter}`` placeholder for a condition which selects
+        mutations in the table aliased as ``mut``.
+    df : DataFrame
+        Mutations to look up, with `uniprot_id` and `uniprot_mutation` columns.
+    engine : sqlalchemy.engine.Engine
+    chunk_size : int
+        Number of mutations to look up in each query.
+    """
+    keys = list(
+        df[["uniprot_id", "uniprot_mutation"]].drop_duplicates().itertuples(index=False, name=None)
+    )
+    results = []
+    for start in range(0, max(len(keys), 1), chunk_size):
+        chunk = keys[start : start + chunk_size]
+        if chunk:
+            # The condition on `uniprot_id` alone lets SQLite use an index
+            mutation_filter = (
+                "mut.uniprot_id IN ({}) AND (mut.uniprot_id, mut.mutation) IN ({})".format(
+                    ", ".join(":uniprot_id_{}".format(i) for i in range(len(chunk))),
+                    ", ".join(
+                        "(:uniprot_id_{0}, :mutation_{0})".format(i) for i in range(len(chunk))
+                    ),
+                )
+            )
+        else:
+            mutation_filter = "1 = 0"
+        params = {}
+        for i, (uniprot_id, mutation) in enumerate(chunk):
+            params["uniprot_id_{}".format(i)] = uniprot_id
+            params["mutation_{}".format(i)] = mutation
+        results.append(
+            pd.read_sql_query(
+                sa.text(sql_query.format(mutation_filter=mutation_filter)), engine, params=params
+            )
+        )
+    return pd.concat(results, ignore_index=True)
+
+
+def get_core_mutations(df, engine, schema_name="elaspic", chunk_size=MUTATION_LOOKUP_CHUNK_SIZE):
     sql_query = """\
 SELECT *
 FROM {schema_name}.uniprot_domain
 JOIN {schema_name}.uniprot_domain_template USING (uniprot_domain_id)
 JOIN {schema_name}.uniprot_domain_model USING (uniprot_domain_id)
 JOIN {schema_name}.uniprot_domain_mutation mut USING (uniprot_domain_id)
-WHERE (mut.uniprot_id, mut.mutation) in ({values})
-""".format(
-        schema_name=schema_name, values=", ".join(values)
-    )
+WHERE {{mutation_filter}}
+""".format(schema_name=schema_name)
 
-    results_df = pd.read_sql_query(sql_query, engine)
+    results_df = _read_mutations(sql_query, df, engine, chunk_size)
 
     # Format predictor features
     results_df = format_mutation_features(results_df)
@@ -239,26 +419,21 @@ WHERE (mut.uniprot_id, mut.mutation) in ({values})
     return results_df
 
 
-def get_interface_mutations(df, engine, schema_name="elaspic"):
-    values = "('" + df["uniprot_id"] + "', '" + df["uniprot_mutation"] + "')"
+def get_interface_mutations(
+    df, engine, schema_name="elaspic", chunk_size=MUTATION_LOOKUP_CHUNK_SIZE
+):
     sql_query = """\
 SELECT *
 FROM {schema_name}.uniprot_domain_pair
 JOIN {schema_name}.uniprot_domain_pair_template USING (uniprot_domain_pair_id)
 JOIN {schema_name}.uniprot_domain_pair_model USING (uniprot_domain_pair_id)
 JOIN {schema_name}.uniprot_domain_pair_mutation mut USING (uniprot_domain_pair_id)
-WHERE (mut.uniprot_id, mut.mutation) in ({values})
-""".format(
-        schema_name=schema_name, values=", ".join(values)
-    )
+WHERE {{mutation_filter}}
+""".format(schema_name=schema_name)
 
     # Format alignment features
-    results_df = pd.read_sql_query(sql_query, engine)
-    results_df["alignment_identity"] = np.sqrt(
-        results_df["identical_1"] * results_df["identical_2"]
-    )
-    results_df["alignment_coverage"] = np.sqrt(results_df["coverage_1"] * results_df["coverage_2"])
-    results_df["alignment_score"] = np.sqrt(results_df["score_1"] * results_df["score_2"])
+    results_df = _read_mutations(sql_query, df, engine, chunk_size)
+    results_df = _format_interface_alignment_features(results_df)
 
     # Format predictor features
     results_df = format_mutation_features(results_df)
@@ -268,6 +443,111 @@ WHERE (mut.uniprot_id, mut.mutation) in ({values})
     return results_df
 
 
+def _format_interface_alignment_features(df):
+    """Combine alignment statistics of both domains in a domain pair."""
+    df["alignment_identity"] = np.sqrt(df["identical_1"] * df["identical_2"])
+    df["alignment_coverage"] = np.sqrt(df["coverage_1"] * df["coverage_2"])
+    df["alignment_score"] = np.sqrt(df["score_1"] * df["score_2"])
+    return df
+
+
+def rescore_mutations(engine, core_or_interface, predictor=None, chunk_size=10000):
+    """Recalculate ΔΔG scores of all mutations stored in the database.
+
+    Mutations are streamed from the database using a server-side cursor, ΔΔG scores are
+    predicted for `chunk_size` mutations at a time, and the ``ddg`` column is updated
+    using one bulk UPDATE per chunk. Memory use does not depend on the size of the table.
+
+    Parameters
+    ----------
+    engine : sqlalchemy.engine.Engine
+        Connection to the ELASPIC database. SQLite databases should use the write-ahead log
+        (as set up by :class:`elaspic.elaspic_database.MyDatabase`), since updates are written
+        while mutations are being read.
+    core_or_interface : str
+        ``core`` to rescore mutations in the :ref:`uniprot_domain_mutation` table,
+        ``interface`` to rescore mutations in the :ref:`uniprot_domain_pair_mutation` table.
+    predictor : _Predictor | None
+        Predictor used to calculate ΔΔG scores. Defaults to :func:`get_predictor`.
+    chunk_size : int
+        Number of mutations to score at a time.
+
+    Returns
+    -------
+    int
+        Number of mutations whose ΔΔG scores were updated.
+        Mutations which are missing some of the features are left unchanged.
+    """
+    from . import elaspic_database_tables as tables
+
+    if core_or_interface in [False, 0, "core"]:
+        mutation_table = tables.UniprotDomainMutation.__table__
+        template_table = tables.UniprotDomainTemplate.__table__
+        model_table = tables.UniprotDomainModel.__table__
+        id_column_name = "uniprot_domain_id"
+        template_column_names = ["alignment_identity", "alignment_coverage", "alignment_score"]
+    else:
+        mutation_table = tables.UniprotDomainPairMutation.__table__
+        template_table = tables.UniprotDomainPairTemplate.__table__
+        model_table = tables.UniprotDomainPairModel.__table__
+        id_column_name = "uniprot_domain_pair_id"
+        template_column_names = [
+            "identical_1",
+            "identical_2",
+            "coverage_1",
+            "coverage_2",
+            "score_1",
+            "score_2",
+        ]
+    if predictor is None:
+        predictor = get_predictor(core_or_interface)
+
+    query = sa.select(
+        *[c for c in mutation_table.c if c.name != "ddg"],
+        *[template_table.c[name] for name in template_column_names],
+        model_table.c.norm_dope,
+    ).select_from(
+        mutation_table.join(
+            template_table,
+            mutation_table.c[id_column_name] == template_table.c[id_column_name],
+        ).join(
+            model_table,
+            mutation_table.c[id_column_name] == model_table.c[id_column_name],
+        )
+    )
+
+    primary_key_names = [c.name for c in mutation_table.primary_key.columns]
+    update = mutation_table.update().values(ddg=sa.bindparam("b_ddg"))
+    for name in primary_key_names:
+        update = update.where(mutation_table.c[name] == sa.bindparam("b_" + name))
+
+    num_updated = 0
+    with engine.connect() as read_conn:
+        result = read_conn.execution_options(stream_results=True).execute(query)
+        columns = list(result.keys())
+        while True:
+            rows = result.fetchmany(chunk_size)
+            if not rows:
+                break
+            df = pd.DataFrame(rows, columns=columns)
+            if core_or_interface not in [False, 0, "core"]:
+                df = _format_interface_alignment_features(df)
+            df["ddg"] = predictor.score_many(df)
+            df = df[df["ddg"].notnull()]
+            if df.empty:
+                continue
+            params = (
+                df[primary_key_names + ["ddg"]]
+                .rename(columns=lambda c: "b_" + c)
+                .to_dict(orient="records")
+            )
+            with engine.begin() as write_conn:
+                write_conn.execute(update, params)
+            num_updated += len(params)
+            logger.info("Updated ΔΔG scores of {} mutations...".format(num_updated))
+    return num_updated
+
+
 def get_final_predictor(data, features, options):
     """Train a predictor using the entire dataset."""
     CLF = sklearn.ensemble.GradientBoostingRegressor
@@ -362,6 +642,52 @@ class _Predictor:
         ddg = self.clf.predict(df[self.features])
         return ddg
 
+    def score_many(self, df):
+        """Predict ΔΔG scores for many mutations at once.
+
+        Features are formatted once for the entire batch and all mutations are scored
+        using a single call to the classifier.
+
+        Parameters
+        ----------
+        df : DataFrame
+            Rows with data required to predict ΔΔG scores (see :meth:`score`).
+
+        Returns
+        -------
+        ndarray
+            ΔΔG scores in the same order as rows in `df`.
+            Rows which are missing some of the required features, or which contain
+            an unknown secondary structure, get a score of NaN.
+        """
+        self._assert_trained()
+        df = df.reset_index(drop=True).assign(_row_idx=np.arange(len(df)))
+        # Unknown secondary structure codes would make `format_mutation_features` fail
+        # for the entire batch
+        is_unknown = np.zeros(len(df), dtype=bool)
+        for col in df.columns:
+            if "secondary_structure" in col:
+                unknown = df[col].notnull() & ~df[col].isin(list(secondary_structure_to_int))
+                if unknown.any():
+                    df[col] = df[col].where(~unknown)
+                    is_unknown |= unknown.values
+        try:
+            df = format_mutation_features(df)
+        except KeyError:
+            pass
+        try:
+            df = convert_features_to_differences(df, True)
+        except KeyError:
+            pass
+        # `format_mutation_features` can reorder rows
+        df = df.sort_values("_row_idx")
+        features = df[self.features]
+        ddg = np.full(len(df), np.nan)
+        is_valid = features.notnull().all(axis=1).values & ~is_unknown
+        if is_valid.any():
+            ddg[is_valid] = self.clf.predict(features[is_valid])
+        return ddg
+
 
 class CorePredictor(_Predictor):
 
@@ -373,3 +699,35 @@ class InterfacePredictor(_Predictor):
 
     clf_filename = "ml_clf_interface.pickle"
     features_filename = "ml_features_interface.json"
+
+
+PREDICTORS = {
+    "core": CorePredictor,
+    "interface": InterfacePredictor,
+}
+
+_loaded_predictors = {}
+_loaded_predictors_lock = threading.Lock()
+
+
+def get_predictor(core_or_interface, data_dir=CACHE_DIR):
+    """Return a predictor loaded from `data_dir`.
+
+    Each predictor is loaded only once per process and is shared by all callers.
+
+    Parameters
+    ----------
+    core_or_interface : str | bool | int
+        Predictor type. ``False``, ``0`` and ``"core"`` select :class:`CorePredictor`,
+        anything else selects :class:`InterfacePredictor`.
+    data_dir : str
+        Folder containing predictor data saved by :meth:`_Predictor.save`.
+    """
+    predictor_type = "core" if core_or_interface in [False, 0, "core"] else "interface"
+    key = (predictor_type, op.abspath(data_dir))
+    with _loaded_predictors_lock:
+        if key not in _loaded_predictors:
+            predictor = PREDICTORS[predictor_type]()
+            predictor.load(data_dir)
+            _loaded_predictors[key] = predictor
+        return _loaded_predictors[key]
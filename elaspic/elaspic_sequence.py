@@ -1,22 +1,23 @@
 import atexit
+import functools
+import hashlib
 import logging
 import os
 import os.path as op
 import re
-import shlex
 import shutil
-import subprocess
-import time
+import tempfile
 
+import numpy as np
 import psutil
 import requests
 import six
 from Bio import SeqIO
+from Bio.Align import substitution_matrices
 from Bio.Seq import Seq
 from Bio.SeqRecord import SeqRecord
-from Bio.SubsMat import MatrixInfo
 
-from . import conf, errors, helper
+from . import DATA_DIR, conf, errors, helper
 
 logger = logging.getLogger(__name__)
 
@@ -54,6 +55,196 @@ def convert_basestring_to_seqrecord(sequence, sequence_id="id"):
     return seqrec
 
 
+# %% Substitution matrices
+class SubstitutionMatrix:
+    """Substitution matrix stored as a 2-D NumPy array, for scoring encoded sequences.
+
+    Sequences are encoded as ``uint8`` arrays of indices into :attr:`alphabet`. Gaps are
+    encoded as :attr:`gap_code`, and residues that are not in the matrix as ``255``.
+
+    Parameters
+    ----------
+    matrix_type : str
+        Name of the matrix (e.g. ``'blosum80'``). Matrices in the ELASPIC data folder take
+        precedence over the matrices provided by :mod:`Bio.Align.substitution_matrices`.
+    """
+
+    unknown_code = 255
+
+    def __init__(self, matrix_type):
+        filename = op.join(DATA_DIR, matrix_type.lower() + ".txt")
+        if op.isfile(filename):
+            matrix = substitution_matrices.read(filename)
+        else:
+            matrix = substitution_matrices.load(matrix_type.upper())
+        self.alphabet = matrix.alphabet
+        self.scores = np.array(matrix)
+        if (self.scores == self.scores.round()).all():
+            self.scores = self.scores.astype(np.int64)
+        self.gap_code = len(self.alphabet)
+        self.codes = np.full(256, self.unknown_code, dtype=np.uint8)
+        for code, residue in enumerate(self.alphabet):
+            self.codes[ord(residue.upper())] = code
+            self.codes[ord(residue.lower())] = code
+        self.codes[ord("-")] = self.gap_code
+
+    def encode(self, sequence):
+        """Return `sequence` as an array of residue codes."""
+        return self.codes[np.frombuffer(str(sequence).encode("ascii"), dtype=np.uint8)]
+
+    def score_alignment(self, seq1, seq2, gap_start, gap_extend):
+        """Score aligned sequences `seq1` and `seq2` using affine gap penalties.
+
+        Every run of columns with a gap in either sequence is penalised by `gap_start`
+        for the first column and by `gap_extend` for each of the following columns.
+
+        Parameters
+        ----------
+        seq1, seq2 : str | numpy.ndarray
+            Aligned sequences, or aligned sequences encoded using :meth:`encode`.
+        gap_start : int
+        gap_extend : int
+
+        Raises
+        ------
+        KeyError
+            If an aligned residue is not in the matrix.
+        """
+        codes_1 = self.encode(seq1) if isinstance(seq1, str) else seq1
+        codes_2 = self.encode(seq2) if isinstance(seq2, str) else seq2
+        if len(codes_1) != len(codes_2):
+            raise ValueError("Aligned sequences must have the same length!")
+        is_gap = (codes_1 == self.gap_code) | (codes_2 == self.gap_code)
+        codes_1, codes_2 = codes_1[~is_gap], codes_2[~is_gap]
+        if (codes_1 == self.unknown_code).any() or (codes_2 == self.unknown_code).any():
+            raise KeyError("Some residues are not in the substitution matrix!")
+        num_gaps = np.count_nonzero(is_gap)
+        num_gap_starts = np.count_nonzero(is_gap[1:] & ~is_gap[:-1]) + int(is_gap[:1].any())
+        score = (
+            self.scores[codes_1, codes_2].sum()
+            + gap_start * num_gap_starts
+            + gap_extend * (num_gaps - num_gap_starts)
+        )
+        return score.item()
+
+
+@functools.lru_cache(maxsize=None)
+def get_substitution_matrix(matrix_type):
+    """Return :class:`SubstitutionMatrix` `matrix_type`, loading it only once."""
+    return SubstitutionMatrix(matrix_type)
+
+
+def get_sequence_hash(sequence):
+    """Return a SHA-256 hash of the amino acids in protein `sequence`."""
+    return hashlib.sha256(str(sequence).upper().encode()).hexdigest()
+
+
+class ProveanSupsetStore:
+    """Share Provean supporting sets between all proteins that have the same sequence.
+
+    Every supporting set is stored together with its ``.fasta`` file in a folder named after
+    the hash of the sequence. Folders are published using an atomic rename, so that readers
+    (possibly in other processes) see either both files or nothing, and published
+    supporting sets are never modified. The Provean profile of the sequence
+    (see :meth:`Sequence.build_provean_profile`) may be added to the folder later.
+
+    Parameters
+    ----------
+    store_dir : str
+        Folder where the supporting sets are stored.
+    """
+
+    supset_filename = "provean_supset"
+    profile_filename = "provean_profile.npy"
+
+    def __init__(self, store_dir):
+        self.store_dir = store_dir
+        os.makedirs(self.store_dir, exist_ok=True)
+
+    def _get_entry_dir(self, sequence):
+        sequence_hash = get_sequence_hash(sequence)
+        return op.join(self.store_dir, sequence_hash[:2], sequence_hash)
+
+    def __contains__(self, sequence):
+        return op.isdir(self._get_entry_dir(sequence))
+
+    def get(self, sequence, provean_supset_file):
+        """Copy the supporting set of `sequence` to `provean_supset_file`.
+
+        Returns
+        -------
+        bool
+            Whether or not the supporting set was found.
+        """
+        entry_dir = self._get_entry_dir(sequence)
+        for suffix in ["", ".fasta"]:
+            try:
+                _copy_atomic(
+                    op.join(entry_dir, self.supset_filename + suffix), provean_supset_file + suffix
+                )
+            except FileNotFoundError:
+                return False
+        logger.debug("Using Provean supporting set from '{}'.".format(entry_dir))
+        return True
+
+    def set(self, sequence, provean_supset_file):
+        """Add `provean_supset_file` to the store unless `sequence` already has one."""
+        entry_dir = self._get_entry_dir(sequence)
+        if op.isdir(entry_dir):
+            return
+        os.makedirs(op.dirname(entry_dir), exist_ok=True)
+        temp_dir = tempfile.mkdtemp(suffix=".tmp", dir=op.dirname(entry_dir))
+        try:
+            for suffix in ["", ".fasta"]:
+                shutil.copyfile(
+                    provean_supset_file + suffix, op.join(temp_dir, self.supset_filename + suffix)
+                )
+            os.rename(temp_dir, entry_dir)
+        except OSError:
+            # Another process published the same supporting set first
+            if not op.isdir(entry_dir):
+                raise
+        finally:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+        logger.debug("Saved Provean supporting set to '{}'.".format(entry_dir))
+
+    def get_profile(self, sequence, provean_profile_file):
+        """Copy the Provean profile of `sequence` to `provean_profile_file`, if it exists."""
+        try:
+            _copy_atomic(
+                op.join(self._get_entry_dir(sequence), self.profile_filename), provean_profile_file
+            )
+        except FileNotFoundError:
+            return False
+        return True
+
+    def set_profile(self, sequence, provean_profile_file):
+        """Add `provean_profile_file` to the supporting set of `sequence`."""
+        entry_dir = self._get_entry_dir(sequence)
+        if op.isdir(entry_dir) and not op.isfile(op.join(entry_dir, self.profile_filename)):
+            _copy_atomic(provean_profile_file, op.join(entry_dir, self.profile_filename))
+
+
+def get_provean_supset_store():
+    """Return the store of Provean supporting sets, if one is configured."""
+    if not conf.CONFIGS.get("provean_supset_store_dir"):
+        return None
+    return ProveanSupsetStore(conf.CONFIGS["provean_supset_store_dir"])
+
+
+def _get_profile_index(mutation):
+    """Return the position of `mutation` in a Provean profile."""
+    return int(mutation[1:-1]) - 1, CANONICAL_AMINO_ACIDS.index(mutation[-1])
+
+
+def _copy_atomic(src, dst):
+    with tempfile.NamedTemporaryFile(
+        "wb", dir=op.dirname(op.abspath(dst)), suffix=".tmp", delete=False
+    ) as ofh, open(src, "rb") as ifh:
+        shutil.copyfileobj(ifh, ofh)
+    os.replace(ofh.name, dst)
+
+
 class Sequence:
     """Class for calculating sequence level features."""
 
@@ -78,35 +269,155 @@ class Sequence:
         self.sequence = str(self.seqrecord.seq)
 
         # Provean supset
+        provean_supset_store = get_provean_supset_store()
         if provean_supset_file is not None and provean_supset_file != self.provean_supset_file:
             shutil.copy(provean_supset_file, self.provean_supset_file)
-            shutil.copy(provean_supset_file, self.provean_supset_file + ".fasta")
-        if not self.provean_supset_exists:
+            shutil.copy(provean_supset_file + ".fasta", self.provean_supset_file + ".fasta")
+        if self.provean_supset_exists:
+            logger.debug("Provean supset is already calculated!")
+        elif provean_supset_store is not None and provean_supset_store.get(
+            self.sequence, self.provean_supset_file
+        ):
+            logger.debug("Provean supset was calculated for an identical sequence!")
+        else:
             logger.debug("Calculating provean supset...")
             self._build_provean_supset()
-        else:
-            logger.debug("Provean supset is already calculated!")
+        if provean_supset_store is not None:
+            provean_supset_store.set(self.sequence, self.provean_supset_file)
         self.provean_supset_length = self._get_provean_supset_length()
 
+        # Provean scores of all substitutions
+        self.provean_profile = self._load_provean_profile(provean_supset_store)
+        if self.provean_profile is None and conf.CONFIGS.get("provean_saturation"):
+            logger.debug("Calculating provean profile...")
+            self.provean_profile = self.build_provean_profile()
+        if self.provean_profile is not None and provean_supset_store is not None:
+            provean_supset_store.set_profile(self.sequence, self.provean_profile_file)
+
         # Mutations
         self.mutations = {}
+        self.expected_mutations = []
 
     def mutate(self, mutation):
-        if mutation in self.mutations:
-            return self.mutations[mutation]
+        """Return sequence features of `mutation`.
 
-        if mutation[0] != self.sequence[int(mutation[1:-1]) - 1]:
-            logger.error("sequence: {}".format(self.sequence))
-            logger.error("mutation: {}".format(mutation))
-            raise errors.MutationMismatchError()
+        Mutations passed to :meth:`expect_mutations` are scored together with `mutation`.
+        """
+        if mutation not in self.mutations:
+            expected_mutations = [
+                m for m in self.expected_mutations if m != mutation and self.is_valid_mutation(m)
+            ]
+            self.mutate_many([mutation] + expected_mutations)
+        return self.mutations[mutation]
 
-        results = dict(
-            protein_id=self.protein_id,
-            mutation=mutation,
-            provean_score=self.run_provean(mutation),
-            matrix_score=self.score_pairwise(mutation[0], mutation[-1]),
+    def mutate_many(self, mutations):
+        """Return sequence features of all `mutations`, running Provean only once.
+
+        Returns
+        -------
+        dict
+            Sequence features of every mutation, keyed by mutation.
+
+        Raises
+        ------
+        errors.MutationMismatchError
+            If the wild-type residue of any mutation does not match the sequence.
+        """
+        for mutation in mutations:
+            if not self.is_valid_mutation(mutation):
+                logger.error("sequence: {}".format(self.sequence))
+                logger.error("mutation: {}".format(mutation))
+                raise errors.MutationMismatchError()
+
+        new_mutations = [m for m in dict.fromkeys(mutations) if m not in self.mutations]
+        if new_mutations:
+            provean_scores = {}
+            for mutation in new_mutations:
+                provean_score = self._get_profile_score(mutation)
+                if provean_score is not None:
+                    provean_scores[mutation] = provean_score
+            missing_mutations = [m for m in new_mutations if m not in provean_scores]
+            if missing_mutations:
+                provean_scores.update(self.run_provean_many(missing_mutations))
+            for mutation in new_mutations:
+                self.mutations[mutation] = dict(
+                    protein_id=self.protein_id,
+                    mutation=mutation,
+                    provean_score=provean_scores[mutation],
+                    matrix_score=self.score_pairwise(mutation[0], mutation[-1]),
+                )
+        return {mutation: self.mutations[mutation] for mutation in mutations}
+
+    def expect_mutations(self, mutations):
+        """Score `mutations` together with the next mutation that is passed to :meth:`mutate`.
+
+        This allows pipelines to run Provean once for all of their mutations, without scoring
+        any mutations if none of them have to be evaluated.
+        """
+        self.expected_mutations = list(dict.fromkeys(self.expected_mutations + list(mutations)))
+
+    def is_valid_mutation(self, mutation):
+        """Return `True` if the wild-type residue of `mutation` matches the sequence."""
+        position = int(mutation[1:-1])
+        if not 1 <= position <= len(self.sequence):
+            return False
+        return mutation[0] == self.sequence[position - 1]
+
+    def _get_profile_score(self, mutation):
+        if self.provean_profile is None or mutation[-1] not in CANONICAL_AMINO_ACIDS:
+            return None
+        provean_score = self.provean_profile[_get_profile_index(mutation)]
+        if np.isnan(provean_score):
+            return None
+        # Provean reports scores with three decimals
+        return round(float(provean_score), 3)
+
+    def build_provean_profile(self):
+        """Calculate Provean scores of all substitutions in the sequence using one provean run.
+
+        The profile is saved to :attr:`provean_profile_file`, so that it can be reused by
+        :meth:`mutate` instead of running provean.
+
+        Returns
+        -------
+        numpy.ndarray
+            ``float32`` array of shape ``(len(sequence), 20)``, with the score of substituting every
+            residue with every amino acid in :data:`CANONICAL_AMINO_ACIDS`. Synonymous substitutions
+            and substitutions of non-canonical residues are NaN.
+        """
+        mutations = [
+            "{}{}{}".format(aa_wt, position + 1, aa_mut)
+            for position, aa_wt in enumerate(self.sequence)
+            if aa_wt in CANONICAL_AMINO_ACIDS
+            for aa_mut in CANONICAL_AMINO_ACIDS
+            if aa_mut != aa_wt
+        ]
+        provean_scores = self.run_provean_many(mutations)
+        provean_profile = np.full(
+            (len(self.sequence), len(CANONICAL_AMINO_ACIDS)), np.nan, dtype=np.float32
         )
-        return results
+        for mutation, provean_score in provean_scores.items():
+            provean_profile[_get_profile_index(mutation)] = provean_score
+        with tempfile.NamedTemporaryFile(
+            "wb", dir=op.dirname(self.provean_profile_file), suffix=".tmp", delete=False
+        ) as ofh:
+            np.save(ofh, provean_profile)
+        os.replace(ofh.name, self.provean_profile_file)
+        return provean_profile
+
+    def _load_provean_profile(self, provean_supset_store=None):
+        if not op.isfile(self.provean_profile_file) and not (
+            provean_supset_store is not None
+            and provean_supset_store.get_profile(self.sequence, self.provean_profile_file)
+        ):
+            return None
+        provean_profile = np.load(self.provean_profile_file)
+        if provean_profile.shape != (len(self.sequence), len(CANONICAL_AMINO_ACIDS)):
+            logger.warning(
+                "Provean profile {} does not match the sequence!".format(self.provean_profile_file)
+            )
+            return None
+        return provean_profile
 
     @property
     def provean_supset_file(self):
@@ -115,6 +426,10 @@ class Sequence:
             helper.slugify(self.protein_id + "_provean_supset"),
         )
 
+    @property
+    def provean_profile_file(self):
+        return self.provean_supset_file + "_profile.npy"
+
     @property
     def provean_supset_exists(self):
         return op.isfile(self.provean_supset_file) and op.isfile(
@@ -136,22 +451,24 @@ class Sequence:
         )
         return result
 
-    def _build_provean_supset(self, mutation=None):
+    def _build_provean_supset(self, mutations=None):
         """"""
         logger.debug("Building Provean supporting set. This might take a while...")
         atexit.register(_clear_provean_temp)
 
         # Get the required parameters
-        any_position = 0
-        while self.sequence[any_position] not in CANONICAL_AMINO_ACIDS:
-            any_position += 1
-        first_aa = self.sequence[any_position]
-        if mutation is None:
-            mutation = "{0}{1}{0}".format(first_aa, any_position + 1)
+        if mutations is None:
+            any_position = 0
+            while self.sequence[any_position] not in CANONICAL_AMINO_ACIDS:
+                any_position += 1
+            first_aa = self.sequence[any_position]
+            mutations = ["{0}{1}{0}".format(first_aa, any_position + 1)]
 
         # Run provean
-        provean_score = self._run_provean(mutation, save_supporting_set=True, check_mem_usage=True)
-        return provean_score
+        provean_scores = self._run_provean_many(
+            mutations, save_supporting_set=True, check_mem_usage=True
+        )
+        return provean_scores
 
     def _get_provean_supset_length(self):
         provean_supset_length = 0
@@ -162,12 +479,15 @@ class Sequence:
         return provean_supset_length
 
     def run_provean(self, mutation, *args, **kwargs):
+        return self.run_provean_many([mutation], *args, **kwargs)[mutation]
+
+    def run_provean_many(self, mutations, *args, **kwargs):
         n_tries = 0
-        provean_score = None
+        provean_scores = None
         while n_tries < 5:
             n_tries += 1
             try:
-                provean_score = self._run_provean(mutation, *args, **kwargs)
+                provean_scores = self._run_provean_many(mutations, *args, **kwargs)
                 break
             except errors.ProveanError as e:
                 bad_ids = re.findall("Entry not found in BLAST database: '(.*)'", e.args[0])
@@ -184,13 +504,16 @@ class Sequence:
                             provean_supset_data.append(line)
                 with open(self.provean_supset_file, "wt") as ofh:
                     ofh.writelines(provean_supset_data)
-        if provean_score is None:
+        if provean_scores is None:
             # Recalculate provean supporting set
-            provean_score = self._build_provean_supset(mutation)
-        return provean_score
+            provean_scores = self._build_provean_supset(mutations)
+        return provean_scores
+
+    def _run_provean(self, mutation, *args, **kwargs):
+        return self._run_provean_many([mutation], *args, **kwargs)[mutation]
 
-    def _run_provean(self, mutation, save_supporting_set=False, check_mem_usage=False):
-        """Run Provean
+    def _run_provean_many(self, mutations, save_supporting_set=False, check_mem_usage=False):
+        """Run Provean, scoring all `mutations` at once.
 
         Provean results look something like this::
 
@@ -210,41 +533,61 @@ class Sequence:
 
         Parameters
         ----------
-        domain_mutation : string
-            Mutation in domain coordinates (i.e. relative to the start of the domain)
+        mutations : list
+            Mutations in sequence coordinates (e.g. ``['M1A', 'G2C']``).
 
         Returns
         -------
-        list
-            [result, error_message, return_code] :
-            The output from running a provean system command.
+        dict
+            Provean score of every mutation.
 
         Raises
         ------
         errors.ProveanError
-            Can raise this exception only if ``check_mem_usage`` is set to ``True``.
+            If Provean fails or does not report the score of every mutation.
+        errors.ProveanResourceError
+            If provean exceeds its resource budget. Free memory and disk space are checked only
+            if ``check_mem_usage`` is set to ``True``.
         """
+        # Resource budget of provean, in bytes and seconds
+        limits = dict(
+            max_memory=conf.CONFIGS.get("provean_max_memory", 0) * 1024**3 or None,
+            timeout=conf.CONFIGS.get("provean_timeout", 0) or None,
+        )
         if check_mem_usage:
-            # Get initial measurements of how much virtual memory and disk space is availible
-            disk_space_availible = psutil.disk_usage(conf.CONFIGS["provean_temp_dir"]).free / (
-                1024 ** 3
+            limits.update(
+                min_free_memory=conf.CONFIGS.get("provean_min_free_memory", 0.5) * 1024**3,
+                min_free_disk=conf.CONFIGS.get("provean_min_free_disk", 5) * 1024**3,
+                disk_path=conf.CONFIGS["provean_temp_dir"],
             )
-            logger.debug("Disk space availible: {:.2f} GB".format(disk_space_availible))
-            if disk_space_availible < 5:
+            # Make sure that there are enough resources to start provean
+            disk_space_availible = psutil.disk_usage(limits["disk_path"]).free
+            logger.debug("Disk space availible: {:.2f} GB".format(disk_space_availible / 1024**3))
+            if disk_space_availible < limits["min_free_disk"]:
                 raise errors.ProveanError(
-                    "Not enough disk space ({:.2f} GB) to run provean".format(disk_space_availible)
+                    "Not enough disk space ({:.2f} GB) to run provean".format(
+                        disk_space_availible / 1024**3
+                    )
                 )
-            memory_availible = psutil.virtual_memory().available / float(1024) ** 3
-            logger.debug("Memory availible: {:.2f} GB".format(memory_availible))
-            if memory_availible < 0.5:
+            memory_availible = psutil.virtual_memory().available
+            logger.debug("Memory availible: {:.2f} GB".format(memory_availible / 1024**3))
+            if memory_availible < limits["min_free_memory"]:
                 raise errors.ProveanError(
-                    "Not enough memory ({:.2f} GB) to run provean".format(memory_availible)
+                    "Not enough memory ({:.2f} GB) to run provean".format(
+                        memory_availible / 1024**3
+                    )
                 )
 
-        # Create a file with mutation
-        mutation_file = op.join(conf.CONFIGS["sequence_dir"], "{}.var".format(mutation))
-        with open(mutation_file, "w") as ofh:
-            ofh.write(mutation)
+        # Create a file with all mutations
+        with tempfile.NamedTemporaryFile(
+            "wt",
+            prefix=helper.slugify(self.protein_id) + "_",
+            suffix=".var",
+            dir=conf.CONFIGS["sequence_dir"],
+            delete=False,
+        ) as ofh:
+            ofh.write("\n".join(mutations) + "\n")
+        mutation_file = ofh.name
 
         # Run provean
         system_command = (
@@ -267,95 +610,54 @@ class Sequence:
             system_command += " --save_supporting_set '{}' ".format(self.provean_supset_file)
 
         logger.debug(system_command)
-        p = subprocess.Popen(
-            shlex.split(system_command),
-            cwd=conf.CONFIGS["sequence_dir"],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            universal_newlines=True,
-        )
-
-        logger.debug("Parent group id: {}".format(os.getpgrp()))
-        child_process_group_id = os.getpgid(p.pid)
-        logger.debug("Child group id: {}".format(child_process_group_id))
-
-        # Keep an eye on provean to make sure it doesn't do anything crazy
-        time.sleep(5)
-        while check_mem_usage and p.poll() is None:
-            disk_space_availible_now = (
-                psutil.disk_usage(conf.CONFIGS["provean_temp_dir"]).free / float(1024) ** 3
-            )
-            if disk_space_availible_now < 5:  # less than 5 GB of free disk space left
-                raise errors.ProveanResourceError(
-                    "Ran out of disk space and provean had to be terminated ({} GB used)".format(
-                        disk_space_availible - disk_space_availible_now
-                    ),
-                    child_process_group_id,
-                )
-            memory_availible_now = psutil.virtual_memory().available / float(1024) ** 3
-            if memory_availible_now < 0.5:
-                raise errors.ProveanResourceError(
-                    "Ran out of RAM and provean had to be terminated ({} GB left)".format(
-                        memory_availible - memory_availible_now
-                    ),
-                    child_process_group_id,
-                )
-            time.sleep(60)  # Wait for 1 minute before checking again
-
-        # Collect the results and check for errors
-        stdout, stderr = p.communicate()
-        stdout = stdout.strip()
-        stderr = stderr.strip()
+        try:
+            # Provean is killed as soon as it exceeds its resource budget
+            p = helper.run_monitored(system_command, cwd=conf.CONFIGS["sequence_dir"], **limits)
+        except errors.ProcessResourceError as e:
+            raise errors.ProveanResourceError(e.args[0], e.child_process_group_id)
+        finally:
+            os.remove(mutation_file)
+        stdout = p.stdout
+        stderr = p.stderr
         logger.debug(stdout)
 
-        # Extract provean score from the results message
-        provean_score = None
-        result_list = stdout.split("\n")
-        for i in range(len(result_list)):
-            if re.findall("# VARIATION\s*SCORE", result_list[i]):
-                provean_score = float(result_list[i + 1].split()[-1])
-                break
-
-        if p.returncode != 0 or provean_score is None:
+        provean_scores = parse_provean_scores(stdout)
+        if p.returncode != 0 or any(mutation not in provean_scores for mutation in mutations):
             logger.error("return_code: {}".format(p.returncode))
-            logger.error("provean_score: {}".format(provean_score))
+            logger.error("provean_scores: {}".format(provean_scores))
             logger.error("error_message: {}".format(stderr))
             raise errors.ProveanError(stderr)
 
-        return provean_score
+        return provean_scores
 
     # === Other sequence scores ===
 
     def score_pairwise(self, seq1, seq2, matrix=None, gap_s=None, gap_e=None):
-        """Get the BLOSUM (or what ever matrix is given) score."""
-        matrix = matrix or getattr(MatrixInfo, conf.CONFIGS["matrix_type"])
+        """Get the BLOSUM (or what ever matrix is given) score.
+
+        `matrix` can be the name of a matrix or a :class:`SubstitutionMatrix`.
+        """
+        matrix = matrix or conf.CONFIGS["matrix_type"]
+        if isinstance(matrix, str):
+            matrix = get_substitution_matrix(matrix)
         gap_s = gap_s or conf.CONFIGS["gap_start"]
         gap_e = gap_e or conf.CONFIGS["gap_extend"]
-
-        score = 0
-        gap = False
-        for i in range(len(seq1)):
-            pair = (seq1[i], seq2[i])
-            if not gap:
-                if "-" in pair:
-                    gap = True
-                    score += gap_s
-                else:
-                    score += self._score_match(pair, matrix)
-            else:
-                if "-" not in pair:
-                    gap = False
-                    score += self._score_match(pair, matrix)
-                else:
-                    score += gap_e
-        return score
-
-    def _score_match(self, pair_match, matrix_match):
-        """"""
-        if pair_match not in matrix_match:
-            return matrix_match[(tuple(reversed(pair_match)))]
-        else:
-            return matrix_match[pair_match]
+        return matrix.score_alignment(seq1, seq2, gap_s, gap_e)
+
+
+def parse_provean_scores(stdout):
+    """Return a dictionary of scores from the ``# VARIATION SCORE`` table printed by Provean."""
+    provean_scores = {}
+    result_list = stdout.split("\n")
+    for i in range(len(result_list)):
+        if re.findall("# VARIATION\s*SCORE", result_list[i]):
+            for line in result_list[i + 1 :]:
+                row = line.split()
+                if len(row) != 2 or row[0].startswith("#"):
+                    break
+                provean_scores[row[0]] = float(row[1])
+            break
+    return provean_scores
 
 
 def _clear_provean_temp():
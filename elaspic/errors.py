@@ -78,6 +78,12 @@ class ResourceError(Exception):
     pass
 
 
+class ProcessResourceError(ResourceError):
+    def __init__(self, message, child_process_group_id):
+        ResourceError.__init__(self, message)
+        self.child_process_group_id = child_process_group_id
+
+
 class InterfaceMismatchError(Exception):
     pass
 
@@ -109,3 +115,9 @@ class Archive7zipError(Exception):
 
 class Archive7zipFileNotFoundError(Archive7zipError):
     pass
+
+
+class ArchiveMemberNotFoundError(Archive7zipFileNotFoundError):
+    def __init__(self, archive_file, member_names):
+        message = "Files {} were not found in archive '{}'".format(member_names, archive_file)
+        super(ArchiveMemberNotFoundError, self).__init__(message, message, None)
@@ -1,14 +1,22 @@
 import functools
+import hashlib
 import json
 import logging
 import os
+import pickle
 import shlex
 import shutil
+import signal
 import string
 import subprocess
 import sys
+import tempfile
+import threading
+import time
 from contextlib import contextmanager
 
+from . import errors
+
 logger = logging.getLogger(__name__)
 
 
@@ -78,6 +86,137 @@ def run(system_command, **vargs):
     return p
 
 
+def run_monitored(
+    system_command,
+    max_memory=None,
+    min_free_memory=None,
+    min_free_disk=None,
+    disk_path=".",
+    timeout=None,
+    max_poll_interval=5,
+    **vargs,
+):
+    """Run `system_command`, killing it as soon as it exceeds its resource budget.
+
+    The command is started in its own process group, which is watched by a separate thread.
+    Resources are checked often while the command is starting and less often later on
+    (up to every `max_poll_interval` seconds), and the results are returned as soon as
+    the command finishes.
+
+    Parameters
+    ----------
+    system_command : str | list
+        Command to run.
+    max_memory : int, optional
+        Maximum memory (RSS) used by the whole process group, in bytes.
+    min_free_memory : int, optional
+        Minimum memory that should stay available on the system, in bytes.
+    min_free_disk : int, optional
+        Minimum free space that should stay available on the disk containing `disk_path`,
+        in bytes.
+    timeout : float, optional
+        Maximum running time, in seconds.
+
+    Returns
+    -------
+    subprocess.CompletedProcess
+        Finished process, with stripped `stdout` and `stderr`.
+
+    Raises
+    ------
+    errors.ProcessResourceError
+        If the process group had to be killed.
+    """
+    import psutil
+
+    if not isinstance(system_command, (list, tuple)):
+        system_command = shlex.split(system_command)
+
+    def get_violation():
+        if timeout is not None and time.monotonic() - start_time > timeout:
+            return "Ran for more than {:.0f} s".format(timeout)
+        if max_memory is not None:
+            memory_used = _get_process_group_memory(p.pid)
+            if memory_used > max_memory:
+                return "Used too much RAM ({:.2f} GB)".format(memory_used / 1024**3)
+        if min_free_memory is not None:
+            memory_available = psutil.virtual_memory().available
+            if memory_available < min_free_memory:
+                return "Ran out of RAM ({:.2f} GB left)".format(memory_available / 1024**3)
+        if min_free_disk is not None:
+            disk_space_available = psutil.disk_usage(disk_path).free
+            if disk_space_available < min_free_disk:
+                return "Ran out of disk space ({:.2f} GB left)".format(
+                    disk_space_available / 1024**3
+                )
+        return None
+
+    def watch():
+        poll_interval = 0.05
+        while not finished.wait(poll_interval):
+            violation = get_violation()
+            if violation is not None:
+                violations.append(violation)
+                _kill_process_group(p.pid)
+                return
+            poll_interval = min(poll_interval * 2, max_poll_interval)
+
+    start_time = time.monotonic()
+    p = subprocess.Popen(
+        system_command,
+        universal_newlines=True,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        start_new_session=True,
+        **vargs,
+    )
+    violations = []
+    finished = threading.Event()
+    watcher = threading.Thread(target=watch, name="process_monitor", daemon=True)
+    watcher.start()
+    try:
+        stdout, stderr = p.communicate()
+    except BaseException:
+        _kill_process_group(p.pid)
+        raise
+    finally:
+        finished.set()
+        watcher.join()
+    if violations:
+        raise errors.ProcessResourceError(
+            "{} and {} had to be terminated".format(
+                violations[0], os.path.basename(system_command[0])
+            ),
+            p.pid,
+        )
+    return subprocess.CompletedProcess(system_command, p.returncode, stdout.strip(), stderr.strip())
+
+
+def _get_process_group_memory(pid):
+    """Return the memory used by process `pid` and all of its children, in bytes."""
+    import psutil
+
+    memory_used = 0
+    try:
+        process = psutil.Process(pid)
+        processes = [process] + process.children(recursive=True)
+    except psutil.NoSuchProcess:
+        return memory_used
+    for process in processes:
+        try:
+            memory_used += process.memory_info().rss
+        except psutil.NoSuchProcess:
+            pass
+    return memory_used
+
+
+def _kill_process_group(process_group_id):
+    try:
+        os.killpg(process_group_id, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+
+
 def get_hostname():
     return run("hostname | cut -d. -f1").stdout
 
@@ -141,6 +280,111 @@ def makedirs(path, mode=None, exist_ok=True):
             os.umask(original_umask)
 
 
+# Files
+def dump_json_atomic(obj, filename):
+    """Write `obj` to `filename` in JSON format, so that the file is either complete or missing."""
+    with tempfile.NamedTemporaryFile(
+        "wt", dir=os.path.dirname(os.path.abspath(filename)), suffix=".tmp", delete=False
+    ) as ofh:
+        json.dump(obj, ofh)
+    os.replace(ofh.name, filename)
+
+
+# Cache
+def get_file_hash(filename, **params):
+    """Return a SHA-256 hash of the contents of `filename` and any additional parameters."""
+    h = hashlib.sha256()
+    with open(filename, "rb") as fh:
+        for chunk in iter(lambda: fh.read(1 << 20), b""):
+            h.update(chunk)
+    h.update(json.dumps(params, sort_keys=True).encode())
+    return h.hexdigest()
+
+
+class FileCache:
+    """Store pickled objects on disk, evicting the least recently used ones.
+
+    Entries are written atomically, so that the same cache folder can be shared between
+    several processes. Since entries are unpickled, a cache folder that is not owned by the
+    current user, or that is writable by other users, is ignored.
+
+    Parameters
+    ----------
+    cache_dir : str
+        Folder where the cached objects are stored.
+    max_size : int, optional
+        Maximum size of the cache folder, in bytes.
+    """
+
+    suffix = ".pickle"
+
+    def __init__(self, cache_dir, max_size=None):
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        os.makedirs(self.cache_dir, mode=0o700, exist_ok=True)
+        self.enabled = self._is_private(self.cache_dir)
+        if not self.enabled:
+            logger.warning(
+                "Cache folder '{}' is writable by other users; not using it.".format(self.cache_dir)
+            )
+
+    @staticmethod
+    def _is_private(cache_dir):
+        st = os.stat(cache_dir)
+        return st.st_uid == os.getuid() and not st.st_mode & 0o022
+
+    def _get_filename(self, key):
+        return os.path.join(self.cache_dir, key + self.suffix)
+
+    def get(self, key, default=None):
+        if not self.enabled:
+            return default
+        filename = self._get_filename(key)
+        try:
+            with open(filename, "rb") as fh:
+                value = pickle.load(fh)
+        except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+            return default
+        # Mark the entry as recently used
+        try:
+            os.utime(filename)
+        except FileNotFoundError:
+            pass
+        return value
+
+    def set(self, key, value):
+        if not self.enabled:
+            return
+        with tempfile.NamedTemporaryFile(
+            "wb", dir=self.cache_dir, suffix=".tmp", delete=False
+        ) as fh:
+            pickle.dump(value, fh, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(fh.name, self._get_filename(key))
+        if self.max_size is not None:
+            self.evict(self.max_size)
+
+    def evict(self, max_size):
+        """Remove least recently used entries until the cache is smaller than `max_size`."""
+        entries = []
+        for entry in os.scandir(self.cache_dir):
+            if not entry.name.endswith(self.suffix):
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total_size = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total_size <= max_size:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total_size -= size
+
+
 # Locks
 def lock(fn):
     """Allow only a single instance of function `fn`, and save results to a lock file."""
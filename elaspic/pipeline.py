@@ -1,4 +1,6 @@
+import collections
 import functools
+import inspect
 import logging
 import os
 
@@ -99,32 +101,105 @@ class Pipeline:
             raise errors.ParameterError("Wrong run_type: '{}'".format(run_type))
 
 
-# Make Bio objects hashable (hack!)
-# TODO: Think more closely about which fields should be used to construct the hash.
-Bio.Seq.Seq.__hash__ = lambda self: hash(self.__repr__())
-Bio.SeqRecord.SeqRecord.__hash__ = lambda self: hash(self.__repr__())
-Bio.SeqRecord.SeqRecord.__eq__ = lambda self, other: self.__hash__() == other.__hash__()
+#: Maximum number of instances remembered by each :func:`execute_and_remember` step
+DEFAULT_MAX_SIZE = 64
 
+CacheInfo = collections.namedtuple("CacheInfo", ["hits", "misses", "max_size", "size"])
 
-def execute_and_remember(f, _instances={}):
-    """A basic memoizer.
 
-    .. warning::
+def get_memo_key(value):
+    """Return a hashable key describing the contents of `value`.
 
-        Does not consider ``kwargs``!!!
+    Sequences are described by their id and sequence, containers by the keys of their elements.
+    Other objects are used as they are, so they are compared by their own ``__eq__``
+    (usually identity).
+    """
+    if isinstance(value, Bio.SeqRecord.SeqRecord):
+        return ("SeqRecord", value.id, str(value.seq))
+    if isinstance(value, Bio.Seq.Seq):
+        return ("Seq", str(value))
+    if isinstance(value, (list, tuple)):
+        return tuple(get_memo_key(v) for v in value)
+    if isinstance(value, dict):
+        return tuple(sorted((k, get_memo_key(v)) for k, v in value.items()))
+    return value
+
+
+class Memoizer:
+    """Memoize a pipeline step, keeping the `max_size` most recently used instances.
+
+    A pipeline step is a class which is initialized with the step inputs,
+    which is run inside its own context manager, and which provides a ``result``.
+
+    Parameters
+    ----------
+    f : type
+        Pipeline step.
+    max_size : int | None
+        Maximum number of instances to remember. ``None`` means no limit.
     """
 
-    @functools.wraps(f)
-    def f_new(*args, **kwargs):
-        key = tuple([f, *args])
-        if key in _instances:
-            return _instances[key].result
+    def __init__(self, f, max_size=DEFAULT_MAX_SIZE):
+        functools.update_wrapper(self, f, updated=())
+        self.f = f
+        self.max_size = max_size
+        self.signature = inspect.signature(f)
+        self.instances = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __call__(self, *args, **kwargs):
+        key = self.get_key(*args, **kwargs)
+        try:
+            instance = self.instances[key]
+        except KeyError:
+            pass
         else:
-            instance = f(*args, **kwargs)
-            if instance:
-                with instance:
-                    instance.run()
-            _instances[key] = instance
-            return _instances[key].result
-
-    return f_new
+            self.hits += 1
+            self.instances.move_to_end(key)
+            return instance.result
+        self.misses += 1
+        instance = self.f(*args, **kwargs)
+        if instance:
+            with instance:
+                instance.run()
+        self._add(key, instance)
+        return instance.result
+
+    def get_key(self, *args, **kwargs):
+        """Return the key of the instance created using `args` and `kwargs`."""
+        arguments = self.signature.bind(*args, **kwargs)
+        arguments.apply_defaults()
+        return tuple((name, get_memo_key(value)) for name, value in arguments.arguments.items())
+
+    def remember(self, instance, *args, **kwargs):
+        """Store an `instance` that was created and run outside of this memoizer."""
+        self._add(self.get_key(*args, **kwargs), instance)
+
+    def invalidate(self, *args, **kwargs):
+        """Forget the instance created using `args` and `kwargs`, or all instances if no arguments
+        are given."""
+        if not args and not kwargs:
+            self.instances.clear()
+        else:
+            self.instances.pop(self.get_key(*args, **kwargs), None)
+
+    def cache_info(self):
+        return CacheInfo(self.hits, self.misses, self.max_size, len(self.instances))
+
+    def _add(self, key, instance):
+        self.instances[key] = instance
+        self.instances.move_to_end(key)
+        if self.max_size is not None:
+            while len(self.instances) > self.max_size:
+                self.instances.popitem(last=False)
+
+
+def execute_and_remember(f=None, *, max_size=DEFAULT_MAX_SIZE):
+    """Memoize pipeline step `f` (see :class:`Memoizer`).
+
+    Can be used as ``@execute_and_remember`` or ``@execute_and_remember(max_size=...)``.
+    """
+    if f is None:
+        return functools.partial(execute_and_remember, max_size=max_size)
+    return Memoizer(f, max_size=max_size)
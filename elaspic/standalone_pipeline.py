@@ -4,9 +4,15 @@ TODO: The model object has two serialization steps:
     1. Inside the modeller class to save modeller results.
     2. In the local_pipeline to save all results.
 """
+
+import concurrent.futures
 import json
 import logging
+import multiprocessing
+import os
 import os.path as op
+import shutil
+import tempfile
 
 import pandas as pd
 from Bio import SeqIO
@@ -52,8 +58,8 @@ class StandalonePipeline(Pipeline):
         3. {sequence_pos}_{sequence_mutation}...
 
         If `sequence_file` is None, this does not matter (always {pdb_chain}_{pdb_mutation}).
-
-    .. todo:: Add an option to store provean results based on sequence hash.
+    jobs : int, default 1
+        Number of worker processes used to evaluate mutations.
     """
 
     def __init__(
@@ -64,6 +70,7 @@ class StandalonePipeline(Pipeline):
         configurations=None,
         mutation_format=None,
         run_type="5",
+        jobs=1,
     ):
         super().__init__(configurations)
 
@@ -71,6 +78,7 @@ class StandalonePipeline(Pipeline):
         self.pdb_id = op.splitext(op.basename(structure_file))[0]
         self.pdb_file = structure_file
         self.run_type = self._validate_run_type(run_type)
+        self.jobs = jobs
 
         logger.info("pdb_file: {}".format(self.pdb_file))
         logger.info("pwd: {}".format(self.PWD))
@@ -217,6 +225,9 @@ class StandalonePipeline(Pipeline):
             self.run_all_models()
         if "mutation" in self.run_type:
             self.run_all_mutations()
+        for step in [PrepareSequence, PrepareModel, PrepareMutation]:
+            logger.debug("{}: {}".format(step.__name__, step.cache_info()))
+            step.invalidate()
 
     def run_all_sequences(self):
         sequence_results = []
@@ -268,16 +279,9 @@ class StandalonePipeline(Pipeline):
             json.dump(model_results, ofh)
 
     def run_all_mutations(self):
-        handled_errors = (
-            errors.ChainsNotInteractingError,
-            errors.MutationOutsideDomainError,
-            errors.MutationOutsideInterfaceError,
-        )
+        mutations = []
         for (mutation_idx, mutation), mutation_in in self.mutations.items():
-            mutation_results = []
-            mutation_results_file = op.join(
-                conf.CONFIGS["unique_temp_dir"], "mutation_{}.json".format(mutation_in)
-            )
+            mutation_results_file = self._get_mutation_results_file(mutation_in)
             if op.isfile(mutation_results_file):
                 logger.debug(
                     "Results file for mutation {} already exists: {}".format(
@@ -285,31 +289,101 @@ class StandalonePipeline(Pipeline):
                     )
                 )
                 continue
+            mutations.append((mutation_idx, mutation, mutation_in))
+
+        # Score the mutations of every chain using a single provean run.
+        # Mutations which do not match the sequence fail later, one at a time.
+        for mutation_idx in sorted({mutation_idx for mutation_idx, __, __ in mutations}):
+            sequence = self.get_sequence(mutation_idx)
+            sequence.mutate_many(
+                [
+                    mutation
+                    for idx, mutation, __ in mutations
+                    if idx == mutation_idx and sequence.is_valid_mutation(mutation)
+                ]
+            )
+
+        if self.jobs > 1 and len(mutations) > 1:
+            self._run_mutations_in_parallel(mutations)
+        else:
+            for mutation_idx, mutation, mutation_in in mutations:
+                self.run_mutation(mutation_idx, mutation, mutation_in)
+
+    def run_mutation(self, mutation_idx, mutation, mutation_in):
+        """Evaluate mutation in every model containing the mutated chain and save results."""
+        handled_errors = (
+            errors.ChainsNotInteractingError,
+            errors.MutationOutsideDomainError,
+            errors.MutationOutsideInterfaceError,
+        )
+        mutation_results = []
+        try:
+            mutation_result = self.get_mutation_score(mutation_idx, mutation_idx, mutation)
+        except handled_errors as e:
+            logger.error(e)
+            return
+        mutation_result["idx"] = mutation_idx
+        mutation_results.append(mutation_result)
+        for idxs in self._get_interacting_chain_idxs(mutation_idx):
             try:
-                mutation_result = self.get_mutation_score(mutation_idx, mutation_idx, mutation)
+                mutation_result = self.get_mutation_score(idxs, mutation_idx, mutation)
             except handled_errors as e:
                 logger.error(e)
                 continue
             mutation_result["idx"] = mutation_idx
+            mutation_result["idxs"] = tuple(idxs)
             mutation_results.append(mutation_result)
-            for idxs in self.sp.interacting_chain_idxs:
-                if not all(i in range(len(self.seqrecords)) for i in idxs):
-                    warning = (
-                        "Skipping idxs: '{}' because we lack the corresponding seqrecord!"
-                    ).format(idxs)
-                    logger.warning(warning)
-                    continue
-                if mutation_idx in idxs:
-                    try:
-                        mutation_result = self.get_mutation_score(idxs, mutation_idx, mutation)
-                    except handled_errors as e:
-                        logger.error(e)
-                        continue
-                    mutation_result["idx"] = mutation_idx
-                    mutation_result["idxs"] = tuple(idxs)
-                    mutation_results.append(mutation_result)
-            with open(mutation_results_file, "w") as ofh:
-                json.dump(mutation_results, ofh)
+        helper.dump_json_atomic(mutation_results, self._get_mutation_results_file(mutation_in))
+
+    def _run_mutations_in_parallel(self, mutations):
+        """Evaluate mutations using a pool of `self.jobs` worker processes.
+
+        Sequences and models are calculated in the parent process, so that forked workers
+        inherit them and only have to run FoldX and the structural analysis.
+        Every mutation is evaluated in its own folder, and workers get their own temporary folders.
+        """
+        for mutation_idx in sorted({mutation_idx for mutation_idx, __, __ in mutations}):
+            self.get_sequence(mutation_idx)
+            self.get_model(mutation_idx)
+            for idxs in self._get_interacting_chain_idxs(mutation_idx):
+                self.get_model(idxs)
+
+        global _worker_pipeline
+        _worker_pipeline = self
+        workers_temp_dir = tempfile.mkdtemp(prefix="workers_", dir=conf.CONFIGS["temp_dir"])
+        try:
+            with concurrent.futures.ProcessPoolExecutor(
+                max_workers=self.jobs,
+                mp_context=multiprocessing.get_context("fork"),
+                initializer=_init_worker,
+                initargs=(workers_temp_dir,),
+            ) as executor:
+                futures = [
+                    executor.submit(_run_mutation_in_worker, mutation_idx, mutation, mutation_in)
+                    for mutation_idx, mutation, mutation_in in mutations
+                ]
+                for future in concurrent.futures.as_completed(futures):
+                    future.result()
+        finally:
+            _worker_pipeline = None
+            shutil.rmtree(workers_temp_dir, ignore_errors=True)
+
+    def _get_interacting_chain_idxs(self, mutation_idx):
+        """Return pairs of interacting chains which include chain `mutation_idx`."""
+        interacting_chain_idxs = []
+        for idxs in self.sp.interacting_chain_idxs:
+            if not all(i in range(len(self.seqrecords)) for i in idxs):
+                warning = (
+                    "Skipping idxs: '{}' because we lack the corresponding seqrecord!"
+                ).format(idxs)
+                logger.warning(warning)
+                continue
+            if mutation_idx in idxs:
+                interacting_chain_idxs.append(idxs)
+        return interacting_chain_idxs
+
+    def _get_mutation_results_file(self, mutation_in):
+        return op.join(conf.CONFIGS["unique_temp_dir"], "mutation_{}.json".format(mutation_in))
 
     # === Get methods ===
 
@@ -360,6 +434,23 @@ class StandalonePipeline(Pipeline):
         return idxs
 
 
+#: Pipeline used by worker processes started by `StandalonePipeline._run_mutations_in_parallel`
+_worker_pipeline = None
+
+
+def _init_worker(workers_temp_dir):
+    """Give each worker process its own temporary folders inside `workers_temp_dir`."""
+    worker_temp_dir = op.join(workers_temp_dir, "worker_{}".format(os.getpid()))
+    os.makedirs(worker_temp_dir, exist_ok=True)
+    tempfile.tempdir = worker_temp_dir
+    conf.CONFIGS["provean_temp_dir"] = op.join(worker_temp_dir, "provean_temp")
+    os.makedirs(conf.CONFIGS["provean_temp_dir"], exist_ok=True)
+
+
+def _run_mutation_in_worker(mutation_idx, mutation, mutation_in):
+    _worker_pipeline.run_mutation(mutation_idx, mutation, mutation_in)
+
+
 @execute_and_remember
 class PrepareSequence:
     """.
@@ -548,10 +639,9 @@ class PrepareMutation:
         feature_df = pd.DataFrame(features, index=[0])
 
         if len(self.model.sequence_seqrecords) == 1:
-            pred = elaspic_predictor.CorePredictor()
+            pred = elaspic_predictor.get_predictor("core", CACHE_DIR)
         else:
-            pred = elaspic_predictor.InterfacePredictor()
-        pred.load(CACHE_DIR)
+            pred = elaspic_predictor.get_predictor("interface", CACHE_DIR)
         features["ddg"] = pred.score(feature_df)[0]
         logger.debug("Predicted ddG: {}".format(features["ddg"]))
 
@@ -1,11 +1,15 @@
+import hashlib
+import json
 import logging
 import os
 import os.path as op
 import tempfile
 
+import numpy as np
 import pandas as pd
+from scipy.spatial import cKDTree
 
-from . import errors, helper, structure_tools
+from . import __version__, errors, helper, structure_tools
 
 logger = logging.getLogger(__name__)
 
@@ -39,6 +43,22 @@ STANDARD_SASA_ALL = [
 ]
 STANDARD_SASA = {x[3]: float(x[4]) for x in STANDARD_SASA_ALL}
 
+#: Atom types used by :meth:`AnalyzeStructure.get_physi_chem`, indexed by their integer code
+ATOM_TYPES = ("ignore", "carbon", "polar", "charged_plus", "charged_minus")
+ATOM_TYPE_CODES = {atom_type: i for i, atom_type in enumerate(ATOM_TYPES)}
+
+#: Main chain atoms are not considered when looking for contacts of the mutated residue
+MAIN_CHAIN_ATOMS = frozenset(["CA", "C", "N", "O"])
+
+# This is based on the naming convention for the atoms in crystalography
+CHARGED_PLUS_RESIDUES = frozenset(["ARG", "R", "LYS", "K"])
+CHARGED_PLUS_ATOMS = frozenset(["NH1", "NH2", "NZ"])
+CHARGED_MINUS_RESIDUES = frozenset(["ASP", "D", "GLU", "E"])
+CHARGED_MINUS_ATOMS = frozenset(["OD1", "OD2", "OE1", "OE2"])
+POLAR_ATOMS = frozenset(
+    ["OG", "OG1", "OD1", "OD2", "ND1", "OE1", "NE", "NE1", "NE2", "ND2", "SG", "OH", "O", "N"]
+)
+
 
 class AnalyzeStructure:
     """Calculate structural properties for a PDB containing one or more chains.
@@ -48,24 +68,76 @@ class AnalyzeStructure:
     The interface is then given by the substracting.
     """
 
-    def __init__(self, pdb_file, working_dir, vdw_distance=5.0, min_contact_distance=4.0):
+    def __init__(
+        self, pdb_file, working_dir, vdw_distance=5.0, min_contact_distance=4.0, cache=None
+    ):
+        """.
+
+        Parameters
+        ----------
+        cache : helper.FileCache, optional
+            Cache for chain splits, SASA and secondary structure calculations, which are
+            looked up using a hash of the contents of `pdb_file`.
+        """
         self.pdb_file = pdb_file
+        self.pdb_id = structure_tools.get_pdb_id(pdb_file)
         #: Folder with all the binaries (i.e. ./analyze_structure)
         self.working_dir = working_dir
         self.vdw_distance = vdw_distance
         self.min_contact_distance = min_contact_distance
+        self.cache = cache
 
         self._prepare_temp_folder(self.working_dir)
 
-        self.sp = structure_tools.StructureParser(pdb_file)
-        self.sp.extract()
-        self.sp.save_structure(output_dir=self.working_dir)
+        self._sp = None
+        self._pdb_hash = helper.get_file_hash(pdb_file) if cache is not None else None
+        self._atom_arrays = None
 
-        self.chain_ids = self.sp.chain_ids
+        structure_files = self._get_cached("structure_files", self._save_structure)
+        for chains, data in structure_files["files"].items():
+            with open(self.get_structure_file(chains), "wb") as ofh:
+                ofh.write(data)
+        self.chain_ids = structure_files["chain_ids"]
 
     def _prepare_temp_folder(self, temp_folder):
         os.makedirs(temp_folder, exist_ok=True)
 
+    @property
+    def sp(self):
+        """Structure parser with the extracted structure (parsed on first use)."""
+        if self._sp is None:
+            self._sp = structure_tools.StructureParser(self.pdb_file)
+            self._sp.extract()
+        return self._sp
+
+    def _save_structure(self):
+        """Save the structure as well as individual chains and chain pairs.
+
+        Returns
+        -------
+        dict
+            Chain ids and the contents of every saved file, keyed by the chains it contains.
+        """
+        structure_files = {"chain_ids": self.sp.chain_ids, "files": {}}
+        for filename in self.sp.save_structure(output_dir=self.working_dir):
+            chains = op.splitext(op.basename(filename))[0][len(self.pdb_id) :]
+            with open(filename, "rb") as ifh:
+                structure_files["files"][chains] = ifh.read()
+        return structure_files
+
+    def _get_cached(self, name, fn):
+        """Return the result of calling `fn`, using a cached value if possible."""
+        if self.cache is None:
+            return fn()
+        key = hashlib.sha256(json.dumps([self._pdb_hash, name, __version__]).encode()).hexdigest()
+        value = self.cache.get(key)
+        if value is None:
+            value = fn()
+            self.cache.set(key, value)
+        else:
+            logger.debug("Loaded '{}' for structure {} from cache.".format(name, self.pdb_file))
+        return value
+
     def __call__(self, chain_id, mutation, chain_id_other=None):
         """Calculate all properties."""
         # Solvent accessibility
@@ -128,9 +200,9 @@ class AnalyzeStructure:
         return results
 
     def get_structure_file(self, chains, ext=".pdb"):
-        return op.join(self.working_dir, self.sp.pdb_id + chains + ext)
+        return op.join(self.working_dir, self.pdb_id + chains + ext)
 
-    def get_physi_chem(self, chain_id, mutation):
+    def get_physi_chem(self, chain_id, mutation, method="kdtree"):
         """Return the atomic contact vector.
 
         Count how many interactions there are between charged, polar or "carbon" residues.
@@ -143,11 +215,16 @@ class AnalyzeStructure:
         chainIDs is a list of strings with the chain identifiers to be used
         if more than two chains are given, the chains not containing the mutation
         are considered as "opposing" chain
+
+        Parameters
+        ----------
+        method : str
+            Algorithm used to find atoms in contact with the mutated residue.
+            ``kdtree`` queries a KD-tree built once over all atoms in the structure,
+            ``loop`` compares the mutated residue against every other atom.
         """
         model = self.sp.structure[0]
         mutated_chain = model[chain_id]
-        opposite_chains = [chain for chain in model.child_list if chain.id != chain_id]
-        main_chain_atoms = ["CA", "C", "N", "O"]
 
         # Find the mutated residue (assuming mutation is in resnum)
         for residue in mutated_chain:
@@ -156,7 +233,102 @@ class AnalyzeStructure:
                     self._validate_mutation(residue.resname, mutation)
                     mutated_residue = residue
                     break
-        mutated_atoms = [atom for atom in mutated_residue if atom.name not in main_chain_atoms]
+
+        if method == "kdtree":
+            return self._get_physi_chem_kdtree(mutated_chain, mutated_residue)
+        elif method == "loop":
+            return self._get_physi_chem_loop(model, mutated_chain, mutated_residue)
+        else:
+            raise ValueError("Unsupported method: '{}'".format(method))
+
+    def _get_atom_arrays(self):
+        """Return coordinates and interaction types of all atoms in the structure.
+
+        The arrays are calculated once and reused for every mutation in the structure.
+        """
+        if self._atom_arrays is not None:
+            return self._atom_arrays
+
+        coords = []
+        atom_types = []
+        is_main_chain = []
+        chain_idxs = []
+        residue_idxs = []
+        residue_atom_idxs = {}
+        model = self.sp.structure[0]
+        for chain_idx, chain in enumerate(model):
+            for residue in chain:
+                residue_idx = len(residue_atom_idxs)
+                residue_atom_idxs[(chain.id, residue.id)] = np.arange(
+                    len(coords), len(coords) + len(residue)
+                )
+                for atom in residue:
+                    coords.append(atom.coord)
+                    atom_types.append(ATOM_TYPE_CODES[self._get_atom_type(residue.resname, atom)])
+                    is_main_chain.append(atom.name in MAIN_CHAIN_ATOMS)
+                    chain_idxs.append(chain_idx)
+                    residue_idxs.append(residue_idx)
+
+        coords = np.array(coords, dtype=np.float32).reshape(-1, 3)
+        self._atom_arrays = dict(
+            coords=coords,
+            atom_types=np.array(atom_types, dtype=np.int8),
+            is_main_chain=np.array(is_main_chain, dtype=bool),
+            chain_idxs=np.array(chain_idxs, dtype=np.intp),
+            residue_idxs=np.array(residue_idxs, dtype=np.intp),
+            residue_atom_idxs=residue_atom_idxs,
+            tree=cKDTree(coords),
+        )
+        return self._atom_arrays
+
+    def _get_physi_chem_kdtree(self, mutated_chain, mutated_residue):
+        atom_arrays = self._get_atom_arrays()
+        coords = atom_arrays["coords"]
+        atom_types = atom_arrays["atom_types"]
+        chain_idxs = atom_arrays["chain_idxs"]
+        residue_idxs = atom_arrays["residue_idxs"]
+
+        mutated_atom_idxs = atom_arrays["residue_atom_idxs"][(mutated_chain.id, mutated_residue.id)]
+        mutated_atom_idxs = mutated_atom_idxs[~atom_arrays["is_main_chain"][mutated_atom_idxs]]
+        if not len(mutated_atom_idxs):
+            return [0, 0, 0, 0], [0, 0, 0, 0]
+
+        # Atoms are in contact if they are within `vdw_distance` along every axis
+        # (Chebyshev distance). The radius is padded slightly so that the exact
+        # comparison below, done in the same precision as the coordinates, has the final say.
+        neighbours = atom_arrays["tree"].query_ball_point(
+            coords[mutated_atom_idxs], self.vdw_distance + 1e-3, p=np.inf
+        )
+        mutated_idxs = np.repeat(mutated_atom_idxs, [len(n) for n in neighbours])
+        partner_idxs = np.hstack(neighbours).astype(np.intp)
+
+        deltas = coords[mutated_idxs] - coords[partner_idxs]
+        keep = (
+            (residue_idxs[partner_idxs] != residue_idxs[mutated_atom_idxs[0]])
+            & (atom_types[partner_idxs] != ATOM_TYPE_CODES["ignore"])
+            & (np.abs(deltas) <= self.vdw_distance).all(axis=1)
+        )
+        mutated_idxs = mutated_idxs[keep]
+        partner_idxs = partner_idxs[keep]
+        in_contact = np.sqrt((deltas[keep] ** 2).sum(axis=1)) <= self.min_contact_distance
+        is_same_chain = chain_idxs[partner_idxs] == chain_idxs[mutated_atom_idxs[0]]
+
+        contact_vectors = []
+        for mask in [~is_same_chain, is_same_chain]:
+            contact_vectors.append(
+                _count_atom_contacts(
+                    atom_types[mutated_idxs[mask]],
+                    atom_types[partner_idxs[mask]],
+                    coords[partner_idxs[mask]],
+                    in_contact[mask],
+                )
+            )
+        opposite_chain_contact_vector, same_chain_contact_vector = contact_vectors
+        return opposite_chain_contact_vector, same_chain_contact_vector
+
+    def _get_physi_chem_loop(self, model, mutated_chain, mutated_residue):
+        opposite_chains = [chain for chain in model.child_list if chain.id != mutated_chain.id]
+        mutated_atoms = [atom for atom in mutated_residue if atom.name not in MAIN_CHAIN_ATOMS]
 
         # Go through each atom in each residue in each partner chain...
         opposite_chain_contacts = {
@@ -275,38 +447,15 @@ class AnalyzeStructure:
         With this label, one can determine which atom of the residue one is looking
         at, and hence, one can determine which "interaction" two atoms are forming.
         """
-        # This is based on the naming convention for the atoms in crystalography
-        charged_plus = ["NH1", "NH2", "NZ"]
-        # Label of negatively charged atoms
-        charged_minus = ["OD1", "OD2", "OE1", "OE2"]
-        # Label of polar atoms
-        polar = [
-            "OG",
-            "OG1",
-            "OD1",
-            "OD2",
-            "ND1",
-            "OE1",
-            "NE",
-            "NE1",
-            "NE2",
-            "ND1",
-            "ND2",
-            "SG",
-            "OH",
-            "O",
-            "N",
-        ]
-
-        if residue.upper() in ["ARG", "R", "LYS", "K"]:
-            if atom.name in charged_plus:
+        if residue.upper() in CHARGED_PLUS_RESIDUES:
+            if atom.name in CHARGED_PLUS_ATOMS:
                 return "charged_plus"
 
-        if residue.upper() in ["ASP", "D", "GLU", "E"]:
-            if atom.name in charged_minus:
+        if residue.upper() in CHARGED_MINUS_RESIDUES:
+            if atom.name in CHARGED_MINUS_ATOMS:
                 return "charged_minus"
 
-        if atom.name in polar:
+        if atom.name in POLAR_ATOMS:
             return "polar"
 
         if atom.name[0] == "C" or atom.name == "SD":
@@ -316,6 +465,9 @@ class AnalyzeStructure:
 
     # %% SASA New
     def get_seasa(self):
+        return self._get_cached("seasa", self._get_seasa)
+
+    def _get_seasa(self):
         structure_file = self.get_structure_file("".join(self.chain_ids))
         seasa_by_chain, seasa_by_residue = self._run_msms(structure_file)
         if len(self.chain_ids) > 1:
@@ -433,6 +585,9 @@ msms -probe_radius {probe_radius:.1f} -surface ases -if '{input_file}' -af '{are
     # === Secondary Structure ===
     def get_secondary_structure(self):
         """Run `stride` to calculate protein secondary structure."""
+        return self._get_cached("secondary_structure", self._get_secondary_structure)
+
+    def _get_secondary_structure(self):
         structure_file = self.get_structure_file("".join(self.chain_ids))
         stride_results_file = op.join(
             op.dirname(structure_file),
@@ -462,8 +617,165 @@ msms -probe_radius {probe_radius:.1f} -surface ases -if '{input_file}' -af '{are
             )
         return file_data_df
 
-    def get_interchain_distances(self, pdb_chain=None, pdb_mutation=None, cutoff=None):
-        """Calculate distance between two chains."""
+    def get_interchain_distances(
+        self, pdb_chain=None, pdb_mutation=None, cutoff=None, method="kdtree"
+    ):
+        """Calculate distance between two chains.
+
+        Parameters
+        ----------
+        pdb_chain : str, optional
+            Only calculate distances between this chain and all other chains.
+        pdb_mutation : str, optional
+            Only consider the mutated residue in `pdb_chain`.
+        cutoff : float, optional
+            Distances larger than this value are reported as `cutoff`.
+        method : str
+            ``kdtree`` finds the closest atoms using a KD-tree built for each chain,
+            ``loop`` compares every pair of atoms.
+        """
+        if method == "kdtree":
+            shortest_interchain_distances = self._get_interchain_distances_kdtree(
+                pdb_chain, pdb_mutation, cutoff
+            )
+        elif method == "loop":
+            shortest_interchain_distances = self._get_interchain_distances_loop(
+                pdb_chain, pdb_mutation, cutoff
+            )
+        else:
+            raise ValueError("Unsupported method: '{}'".format(method))
+
+        if not shortest_interchain_distances:
+            logger.warning(
+                "get_interchain_distances({pdb_chain}, {pdb_mutation}, {cutoff}) failed!".format(
+                    pdb_chain=pdb_chain, pdb_mutation=pdb_mutation, cutoff=cutoff
+                )
+            )
+            raise Exception()
+
+        _shortest_interchain_distances_complement = {}
+        for key in shortest_interchain_distances:
+            for key_2, value in shortest_interchain_distances[key].items():
+                _shortest_interchain_distances_complement.setdefault(key_2, dict())[key] = value
+        shortest_interchain_distances.update(_shortest_interchain_distances_complement)
+
+        all_chains = {key for key in shortest_interchain_distances}
+        all_chains.update(
+            {
+                key_2
+                for key in shortest_interchain_distances
+                for key_2 in shortest_interchain_distances[key]
+            }
+        )
+
+        if set(all_chains) != set(self.sp.chain_ids):
+            logger.warning(
+                "get_interchain_distances({pdb_chain}, {pdb_mutation}, {cutoff}) failed!".format(
+                    pdb_chain=pdb_chain, pdb_mutation=pdb_mutation, cutoff=cutoff
+                )
+            )
+            logger.warning("Did not calculate chain distances for all chain pairs!")
+            logger.warning("all_chains: {}".format(all_chains))
+            logger.warning("self.sp.chain_ids: {}".format(self.sp.chain_ids))
+            raise Exception()
+
+        for key_1, value_1 in shortest_interchain_distances.items():
+            logger.debug(
+                "Calculated interchain distances between chain {} and chains {}.".format(
+                    key_1, ", ".join(list(value_1.keys()))
+                )
+            )
+
+        return shortest_interchain_distances
+
+    def _get_interchain_distances_kdtree(self, pdb_chain, pdb_mutation, cutoff):
+        model = self.sp.structure[0]
+        chain_atom_coords = {}
+        chain_trees = {}
+
+        def get_atom_coords(chain_id, resnum=None):
+            """Return coordinates of all atoms in standard amino acids."""
+            if (chain_id, resnum) not in chain_atom_coords:
+                chain_atom_coords[(chain_id, resnum)] = np.array(
+                    [
+                        atom.coord
+                        for residue in model[chain_id]
+                        if residue.resname in structure_tools.AMINO_ACIDS
+                        and residue.id[0] == " "
+                        and (resnum is None or str(residue.id[1]) == resnum)
+                        for atom in residue
+                    ],
+                    dtype=np.float32,
+                ).reshape(-1, 3)
+            return chain_atom_coords[(chain_id, resnum)]
+
+        def get_tree(chain_id, resnum=None):
+            if (chain_id, resnum) not in chain_trees:
+                chain_trees[(chain_id, resnum)] = cKDTree(get_atom_coords(chain_id, resnum))
+            return chain_trees[(chain_id, resnum)]
+
+        def validate_mutation(chain_id):
+            for residue in model[chain_id]:
+                if (
+                    residue.resname in structure_tools.AMINO_ACIDS
+                    and residue.id[0] == " "
+                    and str(residue.id[1]) == pdb_mutation[1:-1]
+                ):
+                    aa = structure_tools.convert_aa(residue.resname)
+                    if aa != pdb_mutation[0] and aa != pdb_mutation[-1]:
+                        logger.debug(pdb_mutation)
+                        logger.debug(aa)
+                        logger.debug(residue.id)
+                        raise errors.MutationMismatchError()
+
+        shortest_interchain_distances = {}
+        # Chain 1
+        for i, chain_1_id in enumerate(self.sp.chain_ids):
+            shortest_interchain_distances[chain_1_id] = {}
+            if pdb_chain:
+                if chain_1_id == pdb_chain:
+                    continue
+                chain_2_ids = [pdb_chain]
+            else:
+                chain_2_ids = self.sp.chain_ids[i + 1 :]
+            atom_1_coords = get_atom_coords(chain_1_id)
+            # Chain 2
+            for chain_2_id in chain_2_ids:
+                min_r = cutoff
+                resnum = pdb_mutation[1:-1] if pdb_mutation else None
+                atom_2_coords = get_atom_coords(chain_2_id, resnum)
+                if pdb_mutation and len(atom_1_coords):
+                    validate_mutation(chain_2_id)
+                if len(atom_1_coords) and len(atom_2_coords):
+                    # Query the larger chain against the KD-tree of the smaller one
+                    if len(atom_1_coords) < len(atom_2_coords):
+                        tree, query_coords = get_tree(chain_1_id), atom_2_coords
+                    else:
+                        tree, query_coords = get_tree(chain_2_id, resnum), atom_1_coords
+                    distances, _ = tree.query(
+                        query_coords,
+                        distance_upper_bound=(np.inf if cutoff is None else cutoff + 1e-3),
+                    )
+                    if np.isfinite(distances).any():
+                        # Recalculate distances between all nearly closest atoms with the
+                        # precision used by `structure_tools.calculate_distance`
+                        r_max = distances.min() + 1e-3
+                        query_idxs = np.where(distances <= r_max)[0]
+                        neighbours = tree.query_ball_point(query_coords[query_idxs], r_max)
+                        query_idxs = np.repeat(query_idxs, [len(n) for n in neighbours])
+                        partner_idxs = np.hstack(neighbours).astype(np.intp)
+                        partner_coords = tree.data[partner_idxs].astype(np.float32)
+                        r = min(
+                            structure_tools.euclidean_distance(a, b)
+                            for a, b in zip(query_coords[query_idxs], partner_coords)
+                        )
+                        if cutoff is None or r < cutoff:
+                            min_r = r
+                shortest_interchain_distances[chain_1_id][chain_2_id] = min_r
+
+        return shortest_interchain_distances
+
+    def _get_interchain_distances_loop(self, pdb_chain, pdb_mutation, cutoff):
         model = self.sp.structure[0]
         shortest_interchain_distances = {}
         # Chain 1
@@ -516,47 +828,6 @@ msms -probe_radius {probe_radius:.1f} -surface ases -if '{input_file}' -af '{are
 
                 shortest_interchain_distances[chain_1_id][chain_2_id] = min_r
 
-        if not shortest_interchain_distances:
-            logger.warning(
-                "get_interchain_distances({pdb_chain}, {pdb_mutation}, {cutoff}) failed!".format(
-                    pdb_chain=pdb_chain, pdb_mutation=pdb_mutation, cutoff=cutoff
-                )
-            )
-            raise Exception()
-
-        _shortest_interchain_distances_complement = {}
-        for key in shortest_interchain_distances:
-            for key_2, value in shortest_interchain_distances[key].items():
-                _shortest_interchain_distances_complement.setdefault(key_2, dict())[key] = value
-        shortest_interchain_distances.update(_shortest_interchain_distances_complement)
-
-        all_chains = {key for key in shortest_interchain_distances}
-        all_chains.update(
-            {
-                key_2
-                for key in shortest_interchain_distances
-                for key_2 in shortest_interchain_distances[key]
-            }
-        )
-
-        if set(all_chains) != set(self.sp.chain_ids):
-            logger.warning(
-                "get_interchain_distances({pdb_chain}, {pdb_mutation}, {cutoff}) failed!".format(
-                    pdb_chain=pdb_chain, pdb_mutation=pdb_mutation, cutoff=cutoff
-                )
-            )
-            logger.warning("Did not calculate chain distances for all chain pairs!")
-            logger.warning("all_chains: {}".format(all_chains))
-            logger.warning("self.sp.chain_ids: {}".format(self.sp.chain_ids))
-            raise Exception()
-
-        for key_1, value_1 in shortest_interchain_distances.items():
-            logger.debug(
-                "Calculated interchain distances between chain {} and chains {}.".format(
-                    key_1, ", ".join(list(value_1.keys()))
-                )
-            )
-
         return shortest_interchain_distances
 
     def get_interface_area(self, chain_ids):
@@ -698,3 +969,35 @@ msms -probe_radius {probe_radius:.1f} -surface ases -if '{input_file}' -af '{are
                     ]
                     break
         return result
+
+
+def _count_atom_contacts(mutated_atom_types, partner_atom_types, partner_coords, in_contact):
+    """Count contacts between pairs of atoms, as in :meth:`AnalyzeStructure._increment_vector`.
+
+    Returns
+    -------
+    list
+        Number of equal charge, opposite charge, hydrogen bond and (unique) carbon contacts.
+    """
+    carbon = ATOM_TYPE_CODES["carbon"]
+    polar = ATOM_TYPE_CODES["polar"]
+    charged_plus = ATOM_TYPE_CODES["charged_plus"]
+    charged_minus = ATOM_TYPE_CODES["charged_minus"]
+
+    is_charged = (mutated_atom_types == charged_plus) | (mutated_atom_types == charged_minus)
+    equal_charge = in_contact & is_charged & (mutated_atom_types == partner_atom_types)
+    opposite_charge = in_contact & (
+        ((mutated_atom_types == charged_plus) & (partner_atom_types == charged_minus))
+        | ((mutated_atom_types == charged_minus) & (partner_atom_types == charged_plus))
+    )
+    h_bond = in_contact & (mutated_atom_types == polar) & (partner_atom_types == polar)
+    # Van der Waals packing is counted nonredundantly, using partner atom coordinates
+    carbon_contact = (mutated_atom_types == carbon) & (partner_atom_types == carbon)
+    num_carbon_contacts = len(np.unique(partner_coords[carbon_contact], axis=0))
+
+    return [
+        int(equal_charge.sum()),
+        int(opposite_charge.sum()),
+        int(h_bond.sum()),
+        num_carbon_contacts,
+    ]
@@ -16,6 +16,7 @@ from Bio.PDB.MMCIFParser import MMCIFParser
 from Bio.PDB.PDBParser import PDBParser
 from Bio.PDB.Polypeptide import PPBuilder
 from Bio.Seq import Seq
+from scipy.spatial import cKDTree
 
 from . import errors
 
@@ -514,13 +515,19 @@ def get_aa_residues(chain):
     return aa_residues
 
 
-def get_interacting_residues(model, r_cutoff=5, skip_hetatm_chains=True):
+def get_interacting_residues(model, r_cutoff=5, skip_hetatm_chains=True, method="kdtree"):
     """Return residue-residue interactions between all chains in `model`.
 
     Parameters
     ----------
     model : biopython.Model
         Model to analyse.
+    method : str
+        Algorithm used to find the interacting residues. One of:
+        ``'kdtree'``: build a single KD-tree for all atoms in the model and find all atom pairs
+        within `r_cutoff` using one batched query (default);
+        ``'neighborsearch'``: build a `NeighborSearch` for every chain pair and
+        query it with every atom (slow; kept for reference).
 
     Returns
     -------
@@ -547,8 +554,97 @@ def get_interacting_residues(model, r_cutoff=5, skip_hetatm_chains=True):
          for value in values}
 
     """
-    from Bio.PDB import NeighborSearch
+    if method == "kdtree":
+        return _get_interacting_residues_kdtree(model, r_cutoff, skip_hetatm_chains)
+    elif method == "neighborsearch":
+        return _get_interacting_residues_neighborsearch(model, r_cutoff, skip_hetatm_chains)
+    else:
+        raise ValueError("Unsupported method: '{}'!".format(method))
+
+
+def get_residue_atom_arrays(model, skip_hetatm_chains=True):
+    """Collect the coordinates of all amino acid atoms in `model` into NumPy arrays.
+
+    Parameters
+    ----------
+    model : biopython.Model
+        Model to analyse.
+    skip_hetatm_chains : bool
+        Whether to leave out chains that contain only hetatms.
+
+    Returns
+    -------
+    residue_keys : list
+        ``(chain_idx, chain_id, residue_idx, residue_resnum, residue_amino_acid)`` tuple
+        for every amino acid residue, in the order in which they appear in the model.
+    residue_chain_idxs : ndarray
+        Index of the chain containing each residue in `residue_keys`.
+    atom_coords : ndarray
+        ``(n_atoms, 3)`` array of atom coordinates.
+    atom_residue_idxs : ndarray
+        Index into `residue_keys` of the residue containing each atom.
+    """
+    residue_keys = []
+    residue_chain_idxs = []
+    atom_coords = []
+    atom_residue_idxs = []
+    for chain_idx, chain in enumerate(model):
+        if skip_hetatm_chains and chain_is_hetatm(chain):
+            logger.debug(
+                "Skipping chain with idx {} because it contains only hetatms.".format(chain_idx)
+            )
+            continue
+        residue_idx = 0
+        for residue in chain:
+            if residue.resname not in AAA_DICT:
+                continue
+            residue_resnum = str(residue.id[1]) + residue.id[2].strip()
+            residue_keys.append(
+                (chain_idx, chain.id, residue_idx, residue_resnum, AAA_DICT[residue.resname])
+            )
+            residue_chain_idxs.append(chain_idx)
+            for atom in residue:
+                atom_coords.append(atom.get_coord())
+                atom_residue_idxs.append(len(residue_keys) - 1)
+            residue_idx += 1
+    residue_chain_idxs = np.array(residue_chain_idxs, dtype=np.int64)
+    atom_coords = np.array(atom_coords, dtype=np.float64).reshape(-1, 3)
+    atom_residue_idxs = np.array(atom_residue_idxs, dtype=np.int64)
+    return residue_keys, residue_chain_idxs, atom_coords, atom_residue_idxs
+
+
+def _get_interacting_residues_kdtree(model, r_cutoff=5, skip_hetatm_chains=True):
+    """Find interacting residues using a single KD-tree for the entire model.
+
+    Produces the same output as :func:`_get_interacting_residues_neighborsearch`.
+    """
+    (
+        residue_keys,
+        residue_chain_idxs,
+        atom_coords,
+        atom_residue_idxs,
+    ) = get_residue_atom_arrays(model, skip_hetatm_chains)
 
+    interactions_between_chains = dict()
+    if not len(atom_coords):
+        return interactions_between_chains
+
+    # Atoms are ordered by chain, so for every pair (i, j) with i < j,
+    # the chain of atom i always comes before (or is the same as) the chain of atom j
+    atom_pairs = cKDTree(atom_coords).query_pairs(r_cutoff, output_type="ndarray")
+    residue_pairs = atom_residue_idxs[atom_pairs]
+    interchain = residue_chain_idxs[residue_pairs[:, 0]] != residue_chain_idxs[residue_pairs[:, 1]]
+    residue_pairs = np.unique(residue_pairs[interchain], axis=0)
+
+    for residue_1_idx, residue_2_idx in residue_pairs:
+        interactions_between_chains.setdefault(residue_keys[residue_1_idx], set()).add(
+            residue_keys[residue_2_idx]
+        )
+    return interactions_between_chains
+
+
+def _get_interacting_residues_neighborsearch(model, r_cutoff=5, skip_hetatm_chains=True):
+    """Find interacting residues using a `NeighborSearch` for every pair of chains."""
     interactions_between_chains = dict()
 
     # Chain 1
@@ -833,16 +929,25 @@ class StructureParser:
         return get_chain_seqres_sequence(chain, *args, **varargs)
 
     def save_structure(self, output_dir="", remove_disordered=False):
+        """Save the extracted structure, as well as individual chains and chain pairs.
+
+        Returns
+        -------
+        list
+            Names of all saved files.
+        """
         if remove_disordered:
             self._unset_disordered_flags()
 
         io = PDBIO()
         io.set_structure(self.structure)
 
+        saved_files = []
         try:
             # Save all chains together
             outFile = op.join(output_dir, self.pdb_id + "".join(self.chain_ids) + ".pdb")
             io.save(outFile)
+            saved_files.append(outFile)
             if len(self.chain_ids) > 1:
                 # Save each chain individually
                 for chain_id in self.chain_ids:
@@ -856,6 +961,7 @@ class StructureParser:
                         chain_id, self.hetatm_chain_id, hetatm_chain_ns, self.r_cutoff
                     )
                     io.save(outFile, select=select)
+                    saved_files.append(outFile)
             if len(self.chain_ids) > 2:
                 # Save each interacting chain pair.
                 for chain_ids in self.interacting_chain_ids:
@@ -870,11 +976,14 @@ class StructureParser:
                         chain_ids, self.hetatm_chain_id, hetatm_chain_ns, self.r_cutoff
                     )
                     io.save(outFile, select=select)
+                    saved_files.append(outFile)
 
         except AttributeError as e:
             if remove_disordered:
                 raise (e)
-            self.save_structure(output_dir=output_dir, remove_disordered=True)
+            return self.save_structure(output_dir=output_dir, remove_disordered=True)
+
+        return saved_files
 
     def save_sequences(self, output_dir=""):
         self.chain_numbering_extended_dict = {}
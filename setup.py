@@ -46,6 +46,10 @@ setup(
     author_email="alex.strokach@utoronto.ca",
     packages=["elaspic"],
     package_data={"elaspic": ["data/*"]},
+    extras_require={
+        # Read 7zip archives in-process instead of using the ``7za`` command
+        "7zip": ["py7zr"],
+    },
     long_description=read_md("README.md"),
     entry_points={"console_scripts": "elaspic = elaspic.__main__:main"},
     classifiers=[
@@ -0,0 +1,57 @@
+import os.path as op
+import zipfile
+
+import pytest
+
+from elaspic import archive_tools, errors
+
+MEMBERS = {
+    "P12345/Pkinase.1-300/model.pdb": b"ATOM\n" * 1000,
+    "P12345/Pkinase.1-300/alignment.fasta": b">P12345\nMKV\n",
+    "P12345/empty.txt": b"",
+}
+
+
+@pytest.fixture
+def zip_file(tmpdir):
+    filename = str(tmpdir.join("uniprot_domain.zip"))
+    with zipfile.ZipFile(filename, "w") as archive:
+        for idx, (name, data) in enumerate(MEMBERS.items()):
+            compress_type = [zipfile.ZIP_DEFLATED, zipfile.ZIP_STORED, zipfile.ZIP_BZIP2][idx]
+            archive.writestr(name, data, compress_type=compress_type)
+    return filename
+
+
+def test_zip_archive(tmpdir, zip_file, monkeypatch):
+    index_cache_dir = str(tmpdir.join("archive_index"))
+    archive = archive_tools.ZipArchive(zip_file, index_cache_dir)
+    assert archive.read_many(list(MEMBERS)) == MEMBERS
+    with pytest.raises(errors.ArchiveMemberNotFoundError):
+        archive.read("P12345/missing.pdb")
+
+    output_dir = str(tmpdir.join("output"))
+    archive.extract(list(MEMBERS)[:2], output_dir)
+    with open(op.join(output_dir, "P12345/Pkinase.1-300/model.pdb"), "rb") as ifh:
+        assert ifh.read() == MEMBERS["P12345/Pkinase.1-300/model.pdb"]
+
+    # The index is reused by other readers of the same archive
+    monkeypatch.setattr(archive_tools.ZipArchive, "_build_index", None)
+    archive = archive_tools.ZipArchive(zip_file, index_cache_dir)
+    assert archive.read("P12345/Pkinase.1-300/alignment.fasta") == b">P12345\nMKV\n"
+
+
+def test_seven_zip_archive(tmpdir):
+    py7zr = pytest.importorskip("py7zr")
+    filename = str(tmpdir.join("uniprot_domain.7z"))
+    with py7zr.SevenZipFile(filename, "w") as archive:
+        for name, data in MEMBERS.items():
+            archive.writestr(data, name)
+
+    archive = archive_tools.get_archive(filename)
+    assert isinstance(archive, archive_tools.SevenZipArchive)
+    assert (
+        archive.read("P12345/Pkinase.1-300/model.pdb") == MEMBERS["P12345/Pkinase.1-300/model.pdb"]
+    )
+    # The rest of the block is served from memory
+    archive._read_block = None
+    assert archive.read_many(list(MEMBERS)) == MEMBERS
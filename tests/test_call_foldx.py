@@ -1,11 +1,21 @@
 import logging
 import os.path as op
+import shutil
 
 import numpy as np
 import pytest
 import yaml
 
-from elaspic.call_foldx import FoldX, read_analyse_complex, read_build_model, read_stability
+from elaspic.call_foldx import (
+    FoldX,
+    add_number_of_residues,
+    get_foldx_version,
+    read_analyse_complex,
+    read_build_model,
+    read_build_models,
+    read_stability,
+)
+from elaspic.helper import FileCache, get_file_hash
 from elaspic.structure_tools import download_pdb_file
 
 logger = logging.getLogger(__name__)
@@ -81,6 +91,46 @@ def test_read_build_model():
     )
 
 
+def test_read_build_models(tmpdir):
+    pdb_id = "3zml"
+    foldx_mutation = "QA93A"
+    output_file = op.join(
+        op.splitext(__file__)[0],
+        "{}-{}".format(pdb_id, foldx_mutation),
+        "Raw_{}-foldx.fxout".format(pdb_id),
+    )
+    # Pretend that the same mutation was introduced twice
+    with open(output_file) as ifh:
+        data = ifh.read()
+    data += "\n".join(line.replace("_1.pdb", "_2.pdb") for line in data.strip().split("\n")[-2:])
+    output_file_batch = op.join(str(tmpdir), op.basename(output_file))
+    with open(output_file_batch, "wt") as ofh:
+        ofh.write(data)
+    stability_values = read_build_models(
+        output_file_batch,
+        ["WT_3zml-foldx_1.pdb", "WT_3zml-foldx_2.pdb"],
+        ["3zml-foldx_1.pdb", "3zml-foldx_2.pdb"],
+    )
+    assert len(stability_values) == 2
+    assert stability_values[0] == stability_values[1]
+    assert stability_values[0] == read_build_model(
+        output_file, "WT_3zml-foldx_1.pdb", "3zml-foldx_1.pdb"
+    )
+
+
+def test_add_number_of_residues():
+    data_dir = op.join(op.splitext(__file__)[0], "3zml-QA93A")
+    stability_values_wt, stability_values_mut = read_build_model(
+        op.join(data_dir, "Raw_3zml-foldx.fxout"), "WT_3zml-foldx_1.pdb", "3zml-foldx_1.pdb"
+    )
+    for suffix, stability_values in [("wt", stability_values_wt), ("mut", stability_values_mut)]:
+        structure_file = op.join(data_dir, "3zml-foldx-QA93A-{}.pdb".format(suffix))
+        stability_output_file = op.join(data_dir, "3zml-foldx-QA93A-{}_0_ST.fxout".format(suffix))
+        assert add_number_of_residues(stability_values, structure_file) == read_stability(
+            stability_output_file
+        )
+
+
 def test_read_stability():
     pdb_id = "3zml"
     foldx_mutation = "QA93A"
@@ -174,10 +224,16 @@ def test_foldx(test_data, tmpdir):
         test_data["pdb_mutation"][0] + test_data["pdb_chain"] + test_data["pdb_mutation"][1:]
     )
     foldx = FoldX(tmp_dir)
-    structure_file_wt, structure_file_mut = _test_build_model(
-        pdb_file, foldx_mutation, foldx, test_data["stability_results_"]
-    )
+    (
+        structure_file_wt,
+        structure_file_mut,
+        stability_values_wt,
+        stability_values_mut,
+    ) = _test_build_model(pdb_file, foldx_mutation, foldx, test_data["stability_results_"])
     _test_stability(structure_file_wt, structure_file_mut, foldx, test_data["stability_results_"])
+    _test_stability_from_build_model(
+        structure_file_wt, structure_file_mut, stability_values_wt, stability_values_mut, foldx
+    )
     _test_analyse_complex(
         structure_file_wt,
         structure_file_mut,
@@ -202,7 +258,7 @@ def _test_build_model(pdb_file, foldx_mutation, foldx, stability_results_):
     logger.debug("stability_results_: %s", stability_results_)
     stability_results = [round(f, 3) for f in stability_results]
     assert stability_results == stability_results_[:-1]
-    return structure_file_wt, structure_file_mut
+    return structure_file_wt, structure_file_mut, stability_values_wt, stability_values_mut
 
 
 def _test_stability(structure_file_wt, structure_file_mut, foldx, stability_results_):
@@ -218,6 +274,21 @@ def _test_stability(structure_file_wt, structure_file_mut, foldx, stability_resu
     assert stability_results == stability_results_
 
 
+def _test_stability_from_build_model(
+    structure_file_wt, structure_file_mut, stability_values_wt, stability_values_mut, foldx
+):
+    """Make sure that ``BuildModel`` energies can be used in place of ``Stability`` energies."""
+    logger.info("Test Stability from BuildModel")
+    for structure_file, stability_values in [
+        (structure_file_wt, stability_values_wt),
+        (structure_file_mut, stability_values_mut),
+    ]:
+        assert np.allclose(
+            add_number_of_residues(stability_values, structure_file),
+            foldx.stability(structure_file),
+        )
+
+
 def _test_analyse_complex(
     structure_file_wt, structure_file_mut, pdb_chains, foldx, analyze_complex_results_
 ):
@@ -233,3 +304,70 @@ def _test_analyse_complex(
     logger.debug("analyze_complex_results: %s", analyze_complex_results_)
     analyze_complex_results = [round(f, 3) for f in analyze_complex_results]
     assert analyze_complex_results == analyze_complex_results_
+
+
+def test_repair_pdb_cache(tmpdir, monkeypatch):
+    """Make sure that a cached repaired structure is used instead of running FoldX."""
+    data_dir = op.join(op.splitext(__file__)[0], "3zml-QA93A")
+    cache = FileCache(str(tmpdir.mkdir("cache")))
+    foldx_dir = str(tmpdir.mkdir("foldx"))
+    structure_file = op.join(foldx_dir, "3zml.pdb")
+    shutil.copy(op.join(data_dir, "3zml.pdb"), structure_file)
+    with open(op.join(data_dir, "3zml-foldx.pdb"), "rb") as ifh:
+        repaired_data = ifh.read()
+    key = get_file_hash(structure_file, command="RepairPDB", foldx=get_foldx_version())
+    cache.set(key, repaired_data)
+
+    monkeypatch.setattr(FoldX, "_find_rotabase", lambda self: "")
+    foldx = FoldX(foldx_dir, cache=cache)
+    repaired_structure_file = foldx._repair_pdb(structure_file)
+    assert repaired_structure_file == op.join(foldx_dir, "3zml-foldx.pdb")
+    with open(repaired_structure_file, "rb") as ifh:
+        assert ifh.read() == repaired_data
+
+
+def test_repair_pdb_cache_miss(tmpdir, monkeypatch):
+    """Make sure that repaired structures are cached by FoldX version and input structure."""
+    data_dir = op.join(op.splitext(__file__)[0], "3zml-QA93A")
+    cache = FileCache(str(tmpdir.mkdir("cache")))
+    foldx_dir = str(tmpdir.mkdir("foldx"))
+    structure_file = op.join(foldx_dir, "3zml.pdb")
+    shutil.copy(op.join(data_dir, "3zml.pdb"), structure_file)
+
+    repair_calls = []
+
+    def run_repair_pdb(self, structure_file):
+        repair_calls.append(structure_file)
+        repaired_structure_file = op.splitext(structure_file)[0] + "-foldx.pdb"
+        with open(repaired_structure_file, "w") as ofh:
+            ofh.write("repaired {}\n".format(len(repair_calls)))
+        return repaired_structure_file
+
+    foldx_version = ["1"]
+    monkeypatch.setattr("elaspic.call_foldx.get_foldx_version", lambda: foldx_version[0])
+    monkeypatch.setattr(FoldX, "_find_rotabase", lambda self: "")
+    monkeypatch.setattr(FoldX, "_run_repair_pdb", run_repair_pdb)
+    foldx = FoldX(foldx_dir, cache=cache)
+
+    # A miss runs RepairPDB and stores the repaired structure
+    repaired_structure_file = foldx._repair_pdb(structure_file)
+    assert len(repair_calls) == 1
+    key = get_file_hash(structure_file, command="RepairPDB", foldx="1")
+    assert cache.get(key) == b"repaired 1\n"
+
+    # A hit does not run RepairPDB
+    foldx._repair_pdb(structure_file)
+    assert len(repair_calls) == 1
+    with open(repaired_structure_file, "rb") as ifh:
+        assert ifh.read() == b"repaired 1\n"
+
+    # A different FoldX version does not hit
+    foldx_version[0] = "2"
+    foldx._repair_pdb(structure_file)
+    assert len(repair_calls) == 2
+
+    # A different input structure does not hit
+    with open(structure_file, "a") as ofh:
+        ofh.write("END\n")
+    foldx._repair_pdb(structure_file)
+    assert len(repair_calls) == 3
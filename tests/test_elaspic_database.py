@@ -0,0 +1,256 @@
+import concurrent.futures
+import gzip
+import multiprocessing
+
+import pandas as pd
+import pytest
+import sqlalchemy as sa
+
+from elaspic import conf, elaspic_database
+from elaspic.elaspic_database_tables import (
+    Base,
+    Domain,
+    Provean,
+    UniprotDomain,
+    UniprotDomainModel,
+    UniprotDomainMutation,
+    UniprotDomainPair,
+    UniprotDomainPairModel,
+    UniprotDomainPairTemplate,
+    UniprotDomainTemplate,
+    UniprotSequence,
+)
+
+
+@pytest.fixture
+def db(tmpdir, monkeypatch):
+    for key, value in [("archive_dir", None), ("archive_type", None), ("db_is_immutable", False)]:
+        monkeypatch.setitem(conf.CONFIGS, key, value)
+    engine = sa.create_engine("sqlite:///{}".format(tmpdir.join("elaspic.db")))
+    Base.metadata.create_all(engine)
+    session = sa.orm.Session(engine)
+    session.add(
+        Domain(
+            cath_id="1abcA01",
+            pdb_id="1abc",
+            pdb_chain="A",
+            pdb_domain_def="1:100",
+            pdb_pdbfam_name="Pkinase",
+        )
+    )
+    for uniprot_id in ["P00001", "P00002"]:
+        session.add(
+            UniprotSequence(
+                db="sp", uniprot_id=uniprot_id, uniprot_name=uniprot_id, uniprot_sequence="M" * 100
+            )
+        )
+        session.add(Provean(uniprot_id=uniprot_id, provean_supset_filename="supset"))
+    for idx in range(1, 21):
+        session.add(
+            UniprotDomain(
+                uniprot_domain_id=idx,
+                uniprot_id=["P00001", "P00002"][idx % 2],
+                pdbfam_name="Pkinase",
+                pdbfam_idx=idx,
+            )
+        )
+        session.add(UniprotDomainTemplate(uniprot_domain_id=idx, cath_id="1abcA01"))
+        session.add(UniprotDomainModel(uniprot_domain_id=idx, model_filename="model.pdb"))
+    for idx in range(1, 20):
+        session.add(
+            UniprotDomainPair(
+                uniprot_domain_pair_id=idx,
+                uniprot_domain_id_1=idx,
+                uniprot_domain_id_2=idx + 1,
+                uniprot_id_1=["P00001", "P00002"][idx % 2],
+                uniprot_id_2=["P00001", "P00002"][(idx + 1) % 2],
+            )
+        )
+        session.add(
+            UniprotDomainPairTemplate(
+                uniprot_domain_pair_id=idx, cath_id_1="1abcA01", cath_id_2="1abcA01"
+            )
+        )
+        session.add(UniprotDomainPairModel(uniprot_domain_pair_id=idx, model_filename="model.pdb"))
+    session.commit()
+    session.close()
+    monkeypatch.setattr(
+        elaspic_database,
+        "Session",
+        sa.orm.scoped_session(sa.orm.sessionmaker(bind=engine, expire_on_commit=False)),
+    )
+    db = elaspic_database.MyDatabase.__new__(elaspic_database.MyDatabase)
+    db.engine = engine
+    db.loading_strategy = "joined"
+    db.write_buffer = None
+    db.copy_executor = None
+    db._copy_futures = {}
+    db._copied_keys = set()
+    return db
+
+
+@pytest.mark.parametrize("loading_strategy, max_queries", [("joined", 1), ("selectin", 17)])
+def test_loading_strategy_query_count(db, loading_strategy, max_queries):
+    statements = []
+    sa.event.listen(db.engine, "before_cursor_execute", lambda *args: statements.append(args[2]))
+    db.loading_strategy = loading_strategy
+
+    uniprot_domains = db.get_uniprot_domain("P00002")
+    assert len(uniprot_domains) == 10
+    assert len(statements) <= max_queries
+    for d in uniprot_domains:
+        assert d.template.model.model_filename == "model.pdb"
+        assert d.template.domain.pdb_id == "1abc"
+        assert d.uniprot_sequence.provean.provean_supset_filename == "supset"
+
+    del statements[:]
+    uniprot_domain_pairs = db.get_uniprot_domain_pair("P00002")
+    assert len(uniprot_domain_pairs) == 19
+    assert len(statements) <= max_queries
+    for d in uniprot_domain_pairs:
+        assert d.template.model.model_filename == "model.pdb"
+        assert d.template.domain_1.pdb_id == d.template.domain_2.pdb_id == "1abc"
+        for ud in [d.uniprot_domain_1, d.uniprot_domain_2]:
+            assert ud.template.model.model_filename == "model.pdb"
+            assert ud.template.domain.pdb_id == "1abc"
+            assert ud.uniprot_sequence.provean.provean_supset_filename == "supset"
+    # Accessing the loaded objects should not hit the database
+    assert len(statements) <= max_queries
+
+
+def test_upsert_buffer(db):
+    db.write_buffer = elaspic_database.UpsertBuffer(db.engine, max_size=3)
+    db.merge_row(UniprotDomainMutation(uniprot_id="P00002", uniprot_domain_id=1, mutation="M1A"))
+    db.merge_row(UniprotDomainModel(uniprot_domain_id=1, norm_dope=-1.5))
+    assert len(db.write_buffer) == 2
+    # Rows with the same primary key are merged
+    db.merge_row(UniprotDomainModel(uniprot_domain_id=1, chain="A"))
+    assert len(db.write_buffer) == 2
+    db.merge_row(UniprotDomainMutation(uniprot_id="P00002", uniprot_domain_id=1, mutation="M1C"))
+    assert len(db.write_buffer) == 0
+
+    with db.engine.connect() as conn:
+        model = conn.execute(
+            sa.text("select * from uniprot_domain_model where uniprot_domain_id = 1")
+        ).one()
+        num_mutations = conn.execute(
+            sa.text("select count(*) from uniprot_domain_mutation")
+        ).scalar()
+    # Columns that were not set are left untouched
+    assert (model.model_filename, model.norm_dope, model.chain) == ("model.pdb", -1.5, "A")
+    assert num_mutations == 2
+
+    # Buffered rows are written before the database is queried
+    db.write_buffer.max_size = 1000
+    db.merge_row(UniprotDomainModel(uniprot_domain_id=1, model_filename="model_2.pdb"))
+    assert len(db.write_buffer) == 1
+    uniprot_domains = db.get_uniprot_domain("P00002")
+    assert uniprot_domains[0].template.model.model_filename == "model_2.pdb"
+    assert len(db.write_buffer) == 0
+
+
+def test_prefetch_archive_data(db, tmpdir, monkeypatch):
+    archive_dir = tmpdir.join("archive")
+    for key, value in [
+        ("archive_dir", str(archive_dir)),
+        ("archive_type", "directory"),
+        ("archive_temp_dir", str(tmpdir.join("archive_temp"))),
+    ]:
+        monkeypatch.setitem(conf.CONFIGS, key, value)
+    with db.engine.begin() as conn:
+        conn.execute(sa.text("update uniprot_domain set path_to_data = 'data/' || pdbfam_idx"))
+        conn.execute(sa.text("update uniprot_domain_model set alignment_filename = 'aln.fasta'"))
+    for path in ["p00002/P00/00/P00002/supset", "p00002/P00/00/P00002/supset.fasta"] + [
+        "data/{}/{}".format(idx, filename)
+        for idx in range(1, 21, 2)
+        for filename in ["aln.fasta", "model.pdb"]
+    ]:
+        archive_dir.join(path).write(path, ensure=True)
+    copy_started = []
+    copy_uniprot_domain_data = db._copy_uniprot_domain_data
+    monkeypatch.setattr(
+        db,
+        "_copy_uniprot_domain_data",
+        lambda d, *args: copy_started.append(d) or copy_uniprot_domain_data(d, *args),
+    )
+
+    db.copy_executor = concurrent.futures.ThreadPoolExecutor(2)
+    uniprot_domains = db.get_uniprot_domain("P00002", copy_data=True)
+    for d in uniprot_domains:
+        db.wait_for_data(d)
+        filename = tmpdir.join("archive_temp", d.path_to_data, "model.pdb")
+        assert filename.read() == "{}/model.pdb".format(d.path_to_data)
+    assert tmpdir.join("archive_temp", "p00002/P00/00/P00002/supset.fasta").check()
+    assert not db._copy_futures
+    # Files are copied only once for every domain
+    db.get_uniprot_domain("P00002", copy_data=True)
+    db.shutdown_copy_executor()
+    assert db.copy_executor is None
+    assert len(copy_started) == 10
+
+
+def test_load_tables(tmpdir):
+    engine = sa.create_engine("sqlite:///{}".format(tmpdir.join("elaspic.db")))
+    Base.metadata.create_all(engine)
+    with gzip.open(str(tmpdir.join("domain.tsv.gz")), "wt") as ofh:
+        for idx in range(1000):
+            ofh.write('1a{0:02}A01,1a{0:02},A,"1:10,20:30",Pkinase,\\N,\\N\n'.format(idx))
+    with gzip.open(str(tmpdir.join("domain_contact.tsv.gz")), "wt") as ofh:
+        for idx in range(999):
+            ofh.write(
+                "{},1a{:02}A01,1a{:02}A01,5.0,{}\n".format(
+                    idx + 1, idx, idx + 1, ",".join(["\\N"] * 10)
+                )
+            )
+
+    num_rows = elaspic_database.load_tables(
+        engine, ["domain", "domain_contact"], str(tmpdir), jobs=2
+    )
+    assert num_rows == {"domain": 1000, "domain_contact": 999}
+    df = pd.read_sql_query("select * from domain order by cath_id", engine)
+    assert df.loc[0, "pdb_domain_def"] == "1:10,20:30"
+    assert df["pdb_pdbfam_idx"].isnull().all()
+    # Indexes are recreated after the data is loaded
+    index_names = {index["name"] for index in sa.inspect(engine).get_indexes("domain_contact")}
+    assert index_names == {index.name for index in Base.metadata.tables["domain_contact"].indexes}
+
+    # Loading the same tables again replaces their contents
+    num_rows = elaspic_database.load_tables(engine, ["domain"], str(tmpdir))
+    assert pd.read_sql_query("select count(*) as n from domain", engine)["n"][0] == 1000
+
+
+def _count_checked_in_connections():
+    (engine,) = elaspic_database._engines.values()
+    return engine.pool.checkedin()
+
+
+def test_get_engine(tmpdir, monkeypatch):
+    connection_string = "sqlite:///{}".format(tmpdir.join("elaspic.db"))
+    for key, value in [("db_type", "sqlite"), ("connection_string", connection_string)]:
+        monkeypatch.setitem(conf.CONFIGS, key, value)
+    monkeypatch.setattr(elaspic_database, "_engines", {})
+    db = elaspic_database.MyDatabase.__new__(elaspic_database.MyDatabase)
+    engine = db.get_engine()
+    assert db.get_engine() is engine
+
+    with engine.connect() as conn:
+        conn.execute(sa.text("select 1"))
+    assert engine.pool.checkedin() == 1
+    # Forked processes should not reuse connections opened by the parent
+    with concurrent.futures.ProcessPoolExecutor(
+        1, mp_context=multiprocessing.get_context("fork")
+    ) as executor:
+        assert executor.submit(_count_checked_in_connections).result() == 0
+    assert engine.pool.checkedin() == 1
+    engine.dispose()
+
+
+def test_session_scope_threads(db):
+    def get_session_id(_):
+        with db.session_scope() as session:
+            session.query(UniprotDomain).count()
+            return id(session)
+
+    with db.session_scope() as session:
+        with concurrent.futures.ThreadPoolExecutor(1) as executor:
+            assert executor.submit(get_session_id, None).result() != id(session)
@@ -1,6 +1,7 @@
 import pytest
 
 import elaspic.elaspic_model
+import elaspic.errors
 
 
 @pytest.mark.parametrize(
@@ -11,3 +12,23 @@ import elaspic.elaspic_model
 )
 def test_analyze_alignment(alignment, scores):
     assert elaspic.elaspic_model.analyze_alignment(alignment) == scores
+
+
+def test_mutate_many_outside_domain(monkeypatch):
+    calls = []
+
+    def get_mutation_info(sequence_idx, mutation):
+        calls.append(mutation)
+        raise elaspic.errors.MutationOutsideDomainError()
+
+    model = elaspic.elaspic_model.Model.__new__(elaspic.elaspic_model.Model)
+    model.mutations = {(0, "M1A"): {"mutation_domain": "M1A"}}
+    monkeypatch.setattr(model, "_get_mutation_info", get_mutation_info)
+
+    results = model.mutate_many(0, ["M1A", "K99A", "K99A"])
+    assert results["M1A"] == {"mutation_domain": "M1A"}
+    assert isinstance(results["K99A"], elaspic.errors.MutationOutsideDomainError)
+    assert calls == ["K99A"]
+    assert model.mutate(0, "M1A") == {"mutation_domain": "M1A"}
+    with pytest.raises(elaspic.errors.MutationOutsideDomainError):
+        model.mutate(0, "K99A")
@@ -1,7 +1,12 @@
+import json
 import logging
 import os.path as op
+import time
 
+import numpy as np
 import pandas as pd
+import pytest
+import sklearn.ensemble
 
 import elaspic
 import elaspic.elaspic_predictor
@@ -158,6 +163,59 @@ def test_format_mutation_features():
     assert df3["dg_change"].notnull().all()
 
 
+def _get_synthetic_features(num_rows):
+    """Sample `num_rows` core and interface mutations from the test data."""
+    df = pd.read_csv(op.join(op.splitext(__file__)[0], "df2.tsv"), sep="\t")
+    columns = [
+        "physchem_wt",
+        "physchem_wt_ownchain",
+        "physchem_mut",
+        "physchem_mut_ownchain",
+        "secondary_structure_wt",
+        "secondary_structure_mut",
+        "stability_energy_wt",
+        "stability_energy_mut",
+    ]
+    df = df[columns].sample(num_rows, replace=True, random_state=42).reset_index(drop=True)
+    # Every third mutation is an interface mutation
+    is_interface = np.arange(num_rows) % 3 == 0
+    for suffix in ["_wt", "_mut"]:
+        df["analyse_complex_energy" + suffix] = np.where(
+            is_interface, df["stability_energy" + suffix] + ",1.5,-2", None
+        )
+    return df
+
+
+@pytest.mark.parametrize("num_rows", [1, 1000])
+def test_format_mutation_features_vectorized(num_rows):
+    df = _get_synthetic_features(num_rows)
+    df.loc[1::7, "physchem_wt"] = np.nan
+    df.loc[2::7, "secondary_structure_mut"] = np.nan
+    df_vectorized = elaspic.elaspic_predictor.format_mutation_features(df, method="vectorized")
+    df_loop = elaspic.elaspic_predictor.format_mutation_features(df, method="loop")
+    pd.testing.assert_frame_equal(df_vectorized, df_loop)
+
+
+def test_format_mutation_features_benchmark():
+    df = _get_synthetic_features(1_000_000)
+    t0 = time.perf_counter()
+    df_vectorized = elaspic.elaspic_predictor.format_mutation_features(df, method="vectorized")
+    time_vectorized = time.perf_counter() - t0
+
+    num_rows = 10_000
+    t0 = time.perf_counter()
+    df_loop = elaspic.elaspic_predictor.format_mutation_features(df[:num_rows], method="loop")
+    time_loop = time.perf_counter() - t0
+    logger.info(
+        "vectorized: {:.0f} rows / s, loop: {:.0f} rows / s".format(
+            len(df) / time_vectorized, num_rows / time_loop
+        )
+    )
+
+    assert len(df_vectorized) == len(df)
+    assert df_vectorized.columns.tolist() == df_loop.columns.tolist()
+
+
 class TestElaspicPredictor:
     @classmethod
     def setup_class(cls):
@@ -174,3 +232,166 @@ class TestElaspicPredictor:
         for df in dfs:
             df["ddg"] = self.predictor.score(df)
             assert df["ddg"].notnull().all()
+
+
+def _get_core_predictor(df):
+    """Train a small core predictor using mutations in `df`."""
+    predictor = elaspic.elaspic_predictor.CorePredictor()
+    with open(op.join(elaspic.DATA_DIR, predictor.features_filename)) as ifh:
+        predictor.features = json.load(ifh)
+    training_df = elaspic.elaspic_predictor.convert_features_to_differences(
+        elaspic.elaspic_predictor.format_mutation_features(df), True
+    )
+    training_df = training_df[predictor.features + ["ddg_exp"]].dropna()
+    predictor.clf = sklearn.ensemble.GradientBoostingRegressor(n_estimators=20).fit(
+        training_df[predictor.features].values, training_df["ddg_exp"].values
+    )
+    return predictor
+
+
+def test_score_many():
+    """Compare scoring mutations one at a time with scoring them in a single batch."""
+    df = pd.read_csv(op.join(op.splitext(__file__)[0], "df2.tsv"), sep="\t")
+    predictor = _get_core_predictor(df)
+
+    num_rows = 200
+    t0 = time.perf_counter()
+    ddg_one = np.array([predictor.score(df.iloc[i : i + 1])[0] for i in range(num_rows)])
+    time_one = time.perf_counter() - t0
+
+    df_many = pd.concat([df] * 10, ignore_index=True)
+    t0 = time.perf_counter()
+    ddg_many = predictor.score_many(df_many)
+    time_many = time.perf_counter() - t0
+    logger.info(
+        "score: {:.0f} mutations / s, score_many: {:.0f} mutations / s".format(
+            num_rows / time_one, len(df_many) / time_many
+        )
+    )
+
+    assert len(ddg_many) == len(df_many)
+    assert np.allclose(ddg_many[:num_rows], ddg_one)
+    assert np.allclose(ddg_many[: len(df)], ddg_many[len(df) :].reshape(9, -1))
+
+
+def test_score_many_unknown_secondary_structure():
+    """Make sure that one bad row does not prevent the rest of the batch from being scored."""
+    df = pd.read_csv(op.join(op.splitext(__file__)[0], "df2.tsv"), sep="\t")
+    predictor = _get_core_predictor(df)
+    ddg_expected = predictor.score_many(df)
+
+    df_bad = df.copy()
+    df_bad.loc[1, "secondary_structure_wt"] = "?"
+    ddg = predictor.score_many(df_bad)
+    assert np.isnan(ddg[1])
+    assert np.allclose(np.delete(ddg, 1), np.delete(ddg_expected, 1), equal_nan=True)
+
+
+def _create_core_mutation_database(tmpdir, df):
+    """Create an SQLite database with core mutations from `df`."""
+    import sqlalchemy as sa
+
+    from elaspic import elaspic_database_tables as tables
+
+    engine = sa.create_engine("sqlite:///{}".format(tmpdir.join("elaspic.db")))
+    with engine.connect() as conn:
+        conn.exec_driver_sql("PRAGMA journal_mode=WAL")
+    table_classes = [
+        tables.UniprotDomain,
+        tables.UniprotDomainTemplate,
+        tables.UniprotDomainModel,
+        tables.UniprotDomainMutation,
+    ]
+    tables.Base.metadata.create_all(engine, tables=[c.__table__ for c in table_classes])
+
+    df = df.iloc[:250].assign(uniprot_domain_id=lambda df: df.index % 5)
+    df = df.drop_duplicates(["uniprot_id", "uniprot_domain_id", "mutation"])
+    df["uniprot_id"] = df["uniprot_id"].fillna("P00000")
+    with engine.begin() as conn:
+        conn.execute(
+            tables.UniprotDomain.__table__.insert(),
+            [
+                {
+                    "uniprot_domain_id": i,
+                    "uniprot_id": "P00000",
+                    "pdbfam_name": "Pkinase",
+                    "pdbfam_idx": i,
+                }
+                for i in range(5)
+            ],
+        )
+        conn.execute(
+            tables.UniprotDomainTemplate.__table__.insert(),
+            [
+                {
+                    "uniprot_domain_id": i,
+                    "cath_id": "1abcA01",
+                    "alignment_identity": 0.9,
+                    "alignment_coverage": 0.8,
+                    "alignment_score": 0.7,
+                }
+                for i in range(5)
+            ],
+        )
+        conn.execute(
+            tables.UniprotDomainModel.__table__.insert(),
+            [{"uniprot_domain_id": i, "norm_dope": -1.0} for i in range(5)],
+        )
+        mutation_columns = [c.name for c in tables.UniprotDomainMutation.__table__.c]
+        conn.execute(
+            tables.UniprotDomainMutation.__table__.insert(),
+            (
+                df[[c for c in mutation_columns if c in df.columns and c != "ddg"]]
+                .astype(object)
+                .where(df.notnull(), None)
+                .to_dict(orient="records")
+            ),
+        )
+    return engine, df
+
+
+@pytest.mark.parametrize("chunk_size", [7, 300])
+def test_get_core_mutations(tmpdir, chunk_size):
+    df = pd.read_csv(op.join(op.splitext(__file__)[0], "df2.tsv"), sep="\t")
+    engine, df = _create_core_mutation_database(tmpdir, df)
+
+    keys_df = pd.DataFrame(
+        {
+            "uniprot_id": list(df["uniprot_id"][:40]) + ["P99999"],
+            "uniprot_mutation": list(df["mutation"][:40]) + ["A1C"],
+        }
+    )
+    results_df = elaspic.elaspic_predictor.get_core_mutations(
+        keys_df, engine, schema_name="main", chunk_size=chunk_size
+    )
+    expected_df = df.merge(
+        keys_df.rename(columns={"uniprot_mutation": "mutation"}).drop_duplicates()
+    )
+    assert len(results_df) == len(expected_df)
+    assert set(results_df["mutation"]) == set(expected_df["mutation"])
+    assert results_df["dg_change"].notnull().all()
+
+    results_df = elaspic.elaspic_predictor.get_core_mutations(
+        keys_df[:0], engine, schema_name="main", chunk_size=chunk_size
+    )
+    assert results_df.empty
+
+
+def test_rescore_mutations(tmpdir):
+    df = pd.read_csv(op.join(op.splitext(__file__)[0], "df2.tsv"), sep="\t")
+    predictor = _get_core_predictor(df)
+    engine, df = _create_core_mutation_database(tmpdir, df)
+
+    num_updated = elaspic.elaspic_predictor.rescore_mutations(
+        engine, "core", predictor=predictor, chunk_size=64
+    )
+    assert num_updated == len(df)
+
+    ddg_db = pd.read_sql_query("select * from uniprot_domain_mutation", engine)
+    ddg_db = df[["uniprot_id", "uniprot_domain_id", "mutation"]].merge(ddg_db, how="left")["ddg"]
+    ddg_expected = predictor.score_many(
+        df.assign(
+            alignment_identity=0.9, alignment_coverage=0.8, alignment_score=0.7, norm_dope=-1.0
+        )
+    )
+    assert np.allclose(ddg_db.values, ddg_expected)
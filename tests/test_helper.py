@@ -0,0 +1,58 @@
+import json
+import os
+import time
+
+import pytest
+
+from elaspic import errors, helper
+
+
+def test_file_cache(tmpdir):
+    cache = helper.FileCache(str(tmpdir))
+    assert cache.get("a") is None
+    cache.set("a", {"x": 1})
+    assert cache.get("a") == {"x": 1}
+
+
+def test_file_cache_shared_folder(tmpdir):
+    helper.FileCache(str(tmpdir)).set("a", {"x": 1})
+    os.chmod(str(tmpdir), 0o777)
+    cache = helper.FileCache(str(tmpdir))
+    assert cache.get("a") is None
+    cache.set("b", {"x": 2})
+    assert not os.path.exists(os.path.join(str(tmpdir), "b" + cache.suffix))
+
+
+def test_file_cache_evict(tmpdir):
+    cache = helper.FileCache(str(tmpdir))
+    for key in ["a", "b", "c"]:
+        cache.set(key, b"0" * 1000)
+        time.sleep(0.01)
+    # Make "a" the most recently used entry
+    cache.get("a")
+    entry_size = os.path.getsize(os.path.join(str(tmpdir), "a" + cache.suffix))
+    cache.evict(entry_size * 2)
+    assert cache.get("a") is not None
+    assert cache.get("b") is None
+    assert cache.get("c") is not None
+
+
+def test_dump_json_atomic(tmpdir):
+    filename = os.path.join(str(tmpdir), "mutation.json")
+    helper.dump_json_atomic([{"idx": 0}], filename)
+    with open(filename) as ifh:
+        assert json.load(ifh) == [{"idx": 0}]
+    assert os.listdir(str(tmpdir)) == ["mutation.json"]
+
+
+def test_run_monitored():
+    start_time = time.monotonic()
+    p = helper.run_monitored("echo hello")
+    assert (p.returncode, p.stdout) == (0, "hello")
+    # Results are returned as soon as the process finishes
+    assert time.monotonic() - start_time < 1
+
+    start_time = time.monotonic()
+    with pytest.raises(errors.ProcessResourceError):
+        helper.run_monitored(["sh", "-c", "sleep 30 & sleep 30"], timeout=0.5)
+    assert time.monotonic() - start_time < 5
@@ -1,6 +1,10 @@
+import types
+
 import pytest
+from Bio.Seq import Seq
+from Bio.SeqRecord import SeqRecord
 
-from elaspic import errors, pipeline
+from elaspic import conf, errors, pipeline
 
 
 class TestPipeline:
@@ -39,3 +43,80 @@ class TestPipeline:
     def test_validate_run_type_2(self, run_type):
         with pytest.raises(errors.ParameterError):
             self.p._validate_run_type(run_type)
+
+
+class _Step:
+    def __init__(self, value, offset=0):
+        self.value = value
+        self.offset = offset
+        self.n_runs = 0
+
+    def __bool__(self):
+        return True
+
+    def __enter__(self):
+        pass
+
+    def run(self):
+        self.n_runs += 1
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+    @property
+    def result(self):
+        return self
+
+
+def test_memoizer():
+    step = pipeline.execute_and_remember(_Step, max_size=2)
+    a = step("a")
+    assert step("a") is a
+    assert step("a", 0) is a
+    assert step(value="a", offset=0) is a
+    assert step("a", offset=1) is not a
+    assert a.n_runs == 1
+    assert step.cache_info() == pipeline.CacheInfo(hits=3, misses=2, max_size=2, size=2)
+    # "b" evicts the least recently used instance ("a", 1)
+    assert step("a") is a
+    step("b")
+    assert step("a") is a
+    assert step.cache_info().misses == 3
+    assert step("a", offset=1).n_runs == 1
+    assert step.cache_info().misses == 4
+    step.invalidate("a")
+    assert step("a") is not a
+    step.invalidate()
+    assert step.cache_info().size == 0
+
+
+def test_memoizer_seqrecord_keys():
+    step = pipeline.execute_and_remember(_Step)
+    seqrecord_1 = SeqRecord(Seq("M" * 100 + "A"), id="x")
+    seqrecord_2 = SeqRecord(Seq("M" * 100 + "C"), id="x")
+    assert step([seqrecord_1]) is step([SeqRecord(Seq("M" * 100 + "A"), id="x")])
+    assert step([seqrecord_1]) is not step([seqrecord_2])
+
+
+@pytest.mark.parametrize("module_name", ["database_pipeline", "standalone_pipeline"])
+def test_run_invalidates_steps(module_name, monkeypatch):
+    """Make sure that memoized pipeline steps do not outlive a pipeline run."""
+    module = pytest.importorskip("elaspic." + module_name)
+    monkeypatch.setitem(conf.CONFIGS, "look_for_interactions", False)
+    steps = [module.PrepareSequence, module.PrepareModel, module.PrepareMutation]
+    for step in steps:
+        step.remember(object(), *[object() for _ in step.signature.parameters])
+        assert step.cache_info().size == 1
+
+    if module_name == "database_pipeline":
+        p = module.DatabasePipeline.__new__(module.DatabasePipeline)
+        p.uniprot_id = "P00001"
+        p.uniprot_domains = []
+        p.uniprot_domain_pairs = []
+        p.mutations = []
+        p.db = types.SimpleNamespace(flush=lambda: None)
+    else:
+        p = module.StandalonePipeline.__new__(module.StandalonePipeline)
+    p.run_type = ""
+    p.run()
+    assert [step.cache_info().size for step in steps] == [0, 0, 0]
@@ -0,0 +1,152 @@
+import concurrent.futures
+import os.path as op
+
+import numpy as np
+import pytest
+
+from elaspic import conf, elaspic_sequence, errors
+
+
+def test_provean_supset_store(tmpdir):
+    store = elaspic_sequence.ProveanSupsetStore(str(tmpdir.join("store")))
+    supset_file = str(tmpdir.join("P00001_provean_supset"))
+    for suffix in ["", ".fasta"]:
+        with open(supset_file + suffix, "w") as ofh:
+            ofh.write("supset" + suffix)
+
+    assert "MKV" not in store
+    assert not store.get("MKV", str(tmpdir.join("P00002_provean_supset")))
+    # Several processes may try to publish the same supporting set
+    with concurrent.futures.ThreadPoolExecutor(4) as executor:
+        list(executor.map(lambda _: store.set("MKV", supset_file), range(8)))
+    assert "mkv" in store
+
+    output_file = str(tmpdir.join("P00002_provean_supset"))
+    assert store.get("MKV", output_file)
+    for suffix in ["", ".fasta"]:
+        with open(output_file + suffix) as ifh:
+            assert ifh.read() == "supset" + suffix
+    (entry_dir,) = tmpdir.join("store").listdir()
+    assert [op.basename(str(p)) for p in entry_dir.listdir()] == [
+        elaspic_sequence.get_sequence_hash("MKV")
+    ]
+
+
+def test_parse_provean_scores():
+    stdout = (
+        "## Number of supporting sequences used: 1\n"
+        "## PROVEAN scores ##\n"
+        "# VARIATION\tSCORE\n"
+        "M1A\t-6.000\n"
+        "K2C\t-1.500\n"
+    )
+    assert elaspic_sequence.parse_provean_scores(stdout) == {"M1A": -6.0, "K2C": -1.5}
+    assert elaspic_sequence.parse_provean_scores("") == {}
+
+
+def test_mutate_many(monkeypatch):
+    sequence = elaspic_sequence.Sequence.__new__(elaspic_sequence.Sequence)
+    sequence.protein_id = "P00001"
+    sequence.sequence = "MKV"
+    sequence.mutations = {}
+    sequence.expected_mutations = []
+    sequence.provean_profile = None
+    provean_runs = []
+    monkeypatch.setattr(
+        sequence,
+        "run_provean_many",
+        lambda mutations: provean_runs.append(mutations) or {m: -1.0 for m in mutations},
+    )
+    monkeypatch.setattr(sequence, "score_pairwise", lambda seq1, seq2: 0)
+
+    results = sequence.mutate_many(["M1A", "K2C", "M1A"])
+    assert sorted(results) == ["K2C", "M1A"]
+    assert results["M1A"]["provean_score"] == -1.0
+    assert provean_runs == [["M1A", "K2C"]]
+
+    # Expected mutations are scored together with the first mutation that is not known yet
+    sequence.expect_mutations(["K2C", "V3A", "A3C"])
+    assert sequence.mutate("K2C")["mutation"] == "K2C"
+    assert sequence.mutate("V3L")["mutation"] == "V3L"
+    assert sequence.mutate("V3A")["mutation"] == "V3A"
+    assert provean_runs == [["M1A", "K2C"], ["V3L", "V3A"]]
+
+    # Expected mutations outside of the sequence are skipped
+    sequence.expect_mutations(["M1C", "K99A", "M0A"])
+    assert sequence.mutate("M1C")["mutation"] == "M1C"
+    assert provean_runs[-1] == ["M1C"]
+    with pytest.raises(errors.MutationMismatchError):
+        sequence.mutate_many(["K99A"])
+
+
+def test_provean_profile(tmpdir, monkeypatch):
+    monkeypatch.setitem(conf.CONFIGS, "sequence_dir", str(tmpdir))
+    sequence = elaspic_sequence.Sequence.__new__(elaspic_sequence.Sequence)
+    sequence.protein_id = "P00001"
+    sequence.sequence = "MXV"
+    sequence.mutations = {}
+    sequence.expected_mutations = []
+    provean_runs = []
+    monkeypatch.setattr(
+        sequence,
+        "run_provean_many",
+        lambda mutations: provean_runs.append(mutations) or {m: -1.234 for m in mutations},
+    )
+    monkeypatch.setattr(sequence, "score_pairwise", lambda seq1, seq2: 0)
+
+    sequence.provean_profile = sequence.build_provean_profile()
+    assert len(provean_runs[0]) == 2 * 19
+    assert sequence.provean_profile.shape == (3, 20)
+    assert sequence.provean_profile.dtype == np.float32
+    # Only synonymous substitutions and substitutions of unknown residues are missing
+    assert np.isnan(sequence.provean_profile).sum() == 20 + 2
+
+    # Substitutions are looked up in the profile
+    assert sequence.mutate_many(["M1A", "V3W"])["V3W"]["provean_score"] == -1.234
+    assert sequence.mutate("M1M")["provean_score"] == -1.234
+    assert provean_runs[1:] == [["M1M"]]
+
+    # The profile is shared with other proteins that have the same sequence
+    store = elaspic_sequence.ProveanSupsetStore(str(tmpdir.join("store")))
+    for suffix in ["", ".fasta"]:
+        with open(sequence.provean_supset_file + suffix, "w") as ofh:
+            ofh.write("supset")
+    store.set(sequence.sequence, sequence.provean_supset_file)
+    store.set_profile(sequence.sequence, sequence.provean_profile_file)
+    sequence.protein_id = "P00002"
+    assert sequence._load_provean_profile() is None
+    np.testing.assert_array_equal(sequence._load_provean_profile(store), sequence.provean_profile)
+
+
+def _score_pairwise_loop(seq1, seq2, matrix, gap_s, gap_e):
+    score = 0
+    gap = False
+    for pair in zip(seq1, seq2):
+        if "-" in pair:
+            score += gap_e if gap else gap_s
+            gap = True
+        else:
+            score += matrix.scores[tuple(matrix.alphabet.index(aa) for aa in pair)]
+            gap = False
+    return score
+
+
+def test_score_pairwise(monkeypatch):
+    for key, value in [("matrix_type", "blosum80"), ("gap_start", -16), ("gap_extend", -4)]:
+        monkeypatch.setitem(conf.CONFIGS, key, value)
+    sequence = elaspic_sequence.Sequence.__new__(elaspic_sequence.Sequence)
+    assert sequence.score_pairwise("Q", "Q") == 6
+    assert sequence.score_pairwise("L", "R") == sequence.score_pairwise("R", "L") == -3
+    assert sequence.score_pairwise("AQ--LS", "A-KKRP") == 5 - 16 - 4 - 4 - 3 - 1
+    assert sequence.score_pairwise("-A", "KA") == -16 + 5
+
+    matrix = elaspic_sequence.get_substitution_matrix("blosum80")
+    random = np.random.RandomState(42)
+    for _ in range(20):
+        seq1, seq2 = (
+            "".join(random.choice(list(elaspic_sequence.CANONICAL_AMINO_ACIDS + "---"), 50))
+            for _ in range(2)
+        )
+        assert matrix.score_alignment(
+            matrix.encode(seq1), matrix.encode(seq2), -16, -4
+        ) == _score_pairwise_loop(seq1, seq2, matrix, -16, -4)
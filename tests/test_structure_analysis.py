@@ -2,8 +2,14 @@ import logging
 import os
 import os.path as op
 import tempfile
+import time
 
+import pytest
+
+import elaspic.errors
+import elaspic.helper
 import elaspic.structure_analysis
+import elaspic.structure_tools
 
 logger = logging.getLogger(__name__)
 
@@ -36,3 +42,63 @@ class TestAnalyseStructure:
             seasa_by_residue,
             seasa_by_residue_separately,
         ) = self.analyse_structure.get_seasa()
+
+    def test_get_physi_chem(self):
+        model = self.analyse_structure.sp.structure[0]
+        for chain_id in self.analyse_structure.chain_ids:
+            for residue in list(model[chain_id])[:20]:
+                if residue.resname not in elaspic.structure_tools.AMINO_ACIDS:
+                    continue
+                mutation = "{}{}A".format(
+                    elaspic.structure_tools.AAA_DICT[residue.resname], residue.id[1]
+                )
+                physi_chem_kdtree = self.analyse_structure.get_physi_chem(
+                    chain_id, mutation, method="kdtree"
+                )
+                physi_chem_loop = self.analyse_structure.get_physi_chem(
+                    chain_id, mutation, method="loop"
+                )
+                assert physi_chem_kdtree == physi_chem_loop
+
+    @pytest.mark.parametrize(
+        "pdb_chain, pdb_mutation, cutoff",
+        [(None, None, None), (None, None, 5.0), ("B", "H233A", None), ("I", "P5A", 12.0)],
+    )
+    def test_get_interchain_distances(self, pdb_chain, pdb_mutation, cutoff):
+        timings = {}
+        results = {}
+        for method in ["kdtree", "loop"]:
+            start_time = time.perf_counter()
+            results[method] = self.analyse_structure.get_interchain_distances(
+                pdb_chain, pdb_mutation, cutoff, method=method
+            )
+            timings[method] = time.perf_counter() - start_time
+        logger.info(
+            "get_interchain_distances: kdtree {:.4f}s, loop {:.4f}s".format(
+                timings["kdtree"], timings["loop"]
+            )
+        )
+        assert results["kdtree"] == results["loop"]
+
+    @pytest.mark.parametrize("method", ["kdtree", "loop"])
+    def test_get_interchain_distances_mismatch(self, method):
+        with pytest.raises(elaspic.errors.MutationMismatchError):
+            self.analyse_structure.get_interchain_distances("B", "W233A", method=method)
+
+    def test_cache(self):
+        cache = elaspic.helper.FileCache(tempfile.mkdtemp())
+        analyse_structure = elaspic.structure_analysis.AnalyzeStructure(
+            self.analyse_structure.pdb_file, tempfile.mkdtemp(), cache=cache
+        )
+        analyse_structure_cached = elaspic.structure_analysis.AnalyzeStructure(
+            self.analyse_structure.pdb_file, tempfile.mkdtemp(), cache=cache
+        )
+        # The structure should not have to be parsed again
+        assert analyse_structure_cached._sp is None
+        assert analyse_structure_cached.chain_ids == analyse_structure.chain_ids
+        for chain_id in analyse_structure.chain_ids:
+            with open(analyse_structure.get_structure_file(chain_id)) as ifh:
+                data = ifh.read()
+            with open(analyse_structure_cached.get_structure_file(chain_id)) as ifh:
+                data_cached = ifh.read()
+            assert data == data_cached
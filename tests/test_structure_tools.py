@@ -0,0 +1,18 @@
+import os.path as op
+
+import pytest
+
+from elaspic import structure_tools
+
+PDB_FILE = op.join(op.splitext(__file__)[0], "1S1Q.pdb")
+
+
+@pytest.mark.parametrize("r_cutoff", [4, 5, 6.0])
+def test_get_interacting_residues(r_cutoff):
+    model = structure_tools.get_pdb_structure(PDB_FILE)[0]
+    interactions_kdtree = structure_tools.get_interacting_residues(model, r_cutoff, method="kdtree")
+    interactions_neighborsearch = structure_tools.get_interacting_residues(
+        model, r_cutoff, method="neighborsearch"
+    )
+    assert interactions_kdtree
+    assert interactions_kdtree == interactions_neighborsearch